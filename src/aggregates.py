@@ -0,0 +1,325 @@
+import sqlite3
+import re
+import heapq
+import threading
+from array import array
+
+# Running totals live in the same sidecar database as the result cache
+import cache
+
+# --- Compact aggregate store ---
+# Instead of keeping every sentiment and every aspect mention as a Python string,
+# sentiments are small integer codes counted in an array, and each distinct
+# aspect is normalized, given an ID once, and counted in two integer arrays
+# (positive and negative mentions). Memory grows with the number of *distinct*
+# aspects, not with the number of reviews or mentions.
+#
+# A store can be read while a run is still adding to it: snapshot() copies the
+# counts under the store's lock (a few array copies, so the analysis thread is
+# held up for microseconds) and ranks the aspects after letting go of it.
+#
+# Reviews that could not be analyzed are counted as "Error" and their IDs are
+# kept with the store, because the high-water mark has already moved past them:
+# the next incremental run takes them out of the counts and analyzes them again.
+# A saved store also records which analyzer (name/model/version) made its
+# counts, so an incremental run with another analyzer doesn't mix the two.
+
+# Code order is also the bar chart order
+SENTIMENTS = ("Positive", "Negative", "Neutral", "Error")
+
+# The store for the whole reviews table (used by full and incremental runs)
+DEFAULT_STORE = "all_reviews"
+
+_SPACES = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n\"'`.,;:!?()[]{}*-"
+
+
+# Words the plural rules in normalize_aspect() would get wrong: plurals of
+# "-ie" and "-che" words, and words that only look plural. Checked first.
+SINGULAR_EXCEPTIONS = {
+    "movies": "movie", "cookies": "cookie", "selfies": "selfie", "zombies": "zombie", "calories": "calorie",
+    "hoodies": "hoodie", "goodies": "goodie", "niches": "niche", "lenses": "lens",
+    "series": "series", "species": "species", "news": "news", "lens": "lens", "glasses": "glasses",
+    "graphics": "graphics", "optics": "optics", "ergonomics": "ergonomics", "aesthetics": "aesthetics",
+    "electronics": "electronics", "analytics": "analytics", "physics": "physics", "canvas": "canvas",
+    "gps": "gps", "fps": "fps",
+    # "-os" is kept for visionOS, iOS, macOS; these are real plurals
+    "videos": "video", "photos": "photo", "demos": "demo", "logos": "logo",
+}
+
+
+def normalize_aspect(aspect):
+    """
+    Fold different spellings of the same aspect together:
+    "Battery  Life", "battery life." and "battery lifes" all become "battery life".
+    Only the last word is singularized, with a few simple English rules and
+    the SINGULAR_EXCEPTIONS list for words the rules would break.
+    """
+    text = _SPACES.sub(" ", str(aspect).lower()).strip(_EDGE_PUNCTUATION)
+    if not text:
+        return ""
+    head, _, last = text.rpartition(" ")
+    if last in SINGULAR_EXCEPTIONS:
+        last = SINGULAR_EXCEPTIONS[last]
+    elif len(last) > 4 and last.endswith("ies"):
+        last = last[:-3] + "y"            # batteries -> battery
+    elif last.endswith("aches"):
+        last = last[:-1]                  # headaches -> headache
+    elif last.endswith(("sses", "ches", "shes", "xes")):
+        last = last[:-2]                  # classes -> class, boxes -> box
+    elif len(last) > 3 and last.endswith("s") and not last.endswith(("ss", "us", "is", "os")):
+        last = last[:-1]                  # apps -> app, displays -> display
+    return f"{head} {last}" if head else last
+
+
+def _top_ids(counts, n):
+    """IDs of the n highest non-zero counts, highest first (ties in ID order)."""
+    return heapq.nlargest(n, (i for i in range(len(counts)) if counts[i]), key=counts.__getitem__)
+
+
+class AggregateStore:
+    """Sentiment counts, aspect counts and the high-water mark for one set of reviews."""
+
+    def __init__(self):
+        self.lock = threading.Lock()  # held while counts change, so snapshot() sees whole reviews
+        self.total_reviews = 0
+        self.last_review_id = 0  # highest review ID added so far
+        self.failed_ids = set()  # reviews counted as "Error" because they could not be analyzed
+        self.analyzer = None     # "name/model/vversion" of the analyzer behind the counts (None: not known)
+        self.sentiment_codes = {name: code for code, name in enumerate(SENTIMENTS)}
+        self.sentiment_names = list(SENTIMENTS)
+        self.sentiment_counts = array("q", [0] * len(SENTIMENTS))
+        self.aspect_ids = {}       # normalized aspect -> ID
+        self.aspect_names = []     # ID -> normalized aspect
+        self.positive_counts = array("q")  # ID -> positive mentions
+        self.negative_counts = array("q")  # ID -> negative mentions
+
+    # --- Adding data ---
+
+    def _sentiment_code(self, sentiment):
+        code = self.sentiment_codes.get(sentiment)
+        if code is None:
+            # An unexpected label from the model still gets counted
+            code = len(self.sentiment_names)
+            self.sentiment_codes[sentiment] = code
+            self.sentiment_names.append(sentiment)
+            self.sentiment_counts.append(0)
+        return code
+
+    def _aspect_id(self, aspect):
+        aspect_id = self.aspect_ids.get(aspect)
+        if aspect_id is None:
+            aspect_id = len(self.aspect_names)
+            self.aspect_ids[aspect] = aspect_id
+            self.aspect_names.append(aspect)
+            self.positive_counts.append(0)
+            self.negative_counts.append(0)
+        return aspect_id
+
+    def add(self, review_id, sentiment, positive_aspects=(), negative_aspects=(), count=1):
+        """Count one review's result (or `count` reviews with the same result)."""
+        positive_aspects = [a for a in map(normalize_aspect, positive_aspects) if a]
+        negative_aspects = [a for a in map(normalize_aspect, negative_aspects) if a]
+        with self.lock:
+            self.sentiment_counts[self._sentiment_code(sentiment)] += count
+            for aspect in positive_aspects:
+                self.positive_counts[self._aspect_id(aspect)] += count
+            for aspect in negative_aspects:
+                self.negative_counts[self._aspect_id(aspect)] += count
+            self.total_reviews += count
+            self.last_review_id = max(self.last_review_id, review_id)
+
+    def add_failure(self, review_id):
+        """Count a review that could not be analyzed as "Error", and remember it for the next incremental run."""
+        self.add(review_id, "Error")
+        with self.lock:
+            self.failed_ids.add(review_id)
+
+    def forget_failures(self, review_ids):
+        """
+        Take failed reviews out of the counts, so they can be analyzed (and
+        counted) again. IDs that are not failed reviews are ignored. Returns
+        the IDs taken out, in ID order.
+        """
+        with self.lock:
+            forgotten = sorted(self.failed_ids.intersection(review_ids))
+            self.failed_ids.difference_update(forgotten)
+            self.sentiment_counts[self._sentiment_code("Error")] -= len(forgotten)
+            self.total_reviews -= len(forgotten)
+        return forgotten
+
+    def merge(self, other):
+        """Add every count from another store into this one."""
+        with self.lock:
+            for name, count in zip(other.sentiment_names, other.sentiment_counts):
+                if count:
+                    self.sentiment_counts[self._sentiment_code(name)] += count
+            for name, pos, neg in zip(other.aspect_names, other.positive_counts, other.negative_counts):
+                aspect_id = self._aspect_id(name)
+                self.positive_counts[aspect_id] += pos
+                self.negative_counts[aspect_id] += neg
+            self.total_reviews += other.total_reviews
+            self.last_review_id = max(self.last_review_id, other.last_review_id)
+            self.failed_ids.update(other.failed_ids)
+
+    # --- Reading data ---
+
+    def sentiments(self):
+        """{sentiment: count} for every sentiment seen, in bar chart order."""
+        return {name: count for name, count in zip(self.sentiment_names, self.sentiment_counts) if count}
+
+    def aspect_frequencies(self, kind):
+        """{aspect: mentions} for kind "positive" or "negative" (aspects with no mentions are left out)."""
+        counts = self.positive_counts if kind == "positive" else self.negative_counts
+        return {name: count for name, count in zip(self.aspect_names, counts) if count}
+
+    def top_aspects(self, kind, n=5):
+        """The n most mentioned aspects as (aspect, count) pairs, like Counter.most_common()."""
+        counts = self.positive_counts if kind == "positive" else self.negative_counts
+        return [(self.aspect_names[i], counts[i]) for i in _top_ids(counts, n)]
+
+    def snapshot(self, top_n=10):
+        """
+        A consistent copy of the totals that is safe to take from another
+        thread while reviews are being added: {"total_reviews",
+        "last_review_id", "sentiments", "top_positive_aspects",
+        "top_negative_aspects"}.
+        """
+        with self.lock:
+            total_reviews, last_review_id = self.total_reviews, self.last_review_id
+            sentiments = self.sentiments()
+            positive_counts = array("q", self.positive_counts)
+            negative_counts = array("q", self.negative_counts)
+        # aspect_names only ever grows, so the copied counts line up with it
+        return {
+            "total_reviews": total_reviews,
+            "last_review_id": last_review_id,
+            "sentiments": sentiments,
+            "top_positive_aspects": [(self.aspect_names[i], positive_counts[i]) for i in _top_ids(positive_counts, top_n)],
+            "top_negative_aspects": [(self.aspect_names[i], negative_counts[i]) for i in _top_ids(negative_counts, top_n)],
+        }
+
+
+# --- Saving to SQLite ---
+
+def create_tables(conn):
+    """Create the aggregate tables on an open connection to the sidecar database."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS aggregate_stores (
+            name TEXT PRIMARY KEY,
+            total_reviews INTEGER NOT NULL,
+            last_review_id INTEGER NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    if "analyzer" not in {row[1] for row in conn.execute("PRAGMA table_info(aggregate_stores)")}:
+        conn.execute("ALTER TABLE aggregate_stores ADD COLUMN analyzer TEXT")  # stores saved before it existed
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS aggregate_sentiments (
+            store TEXT NOT NULL,
+            sentiment TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (store, sentiment)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS aggregate_aspects (
+            store TEXT NOT NULL,
+            aspect_id INTEGER NOT NULL,
+            aspect TEXT NOT NULL,
+            positive_count INTEGER NOT NULL,
+            negative_count INTEGER NOT NULL,
+            PRIMARY KEY (store, aspect_id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS aggregate_failed (
+            store TEXT NOT NULL,
+            review_id INTEGER NOT NULL,
+            PRIMARY KEY (store, review_id)
+        )
+    """)
+
+
+def _connect():
+    conn = sqlite3.connect(cache.CACHE_DB_PATH)
+    create_tables(conn)
+    return conn
+
+
+def read_store(conn, name=DEFAULT_STORE):
+    """Like load_store(), on a connection the caller already has open (e.g. inside its own transaction)."""
+    store = AggregateStore()
+    row = conn.execute(
+        "SELECT total_reviews, last_review_id, analyzer FROM aggregate_stores WHERE name = ?", (name,)
+    ).fetchone()
+    if row is None:
+        return store
+    store.total_reviews, store.last_review_id, store.analyzer = row
+    for sentiment, count in conn.execute(
+            "SELECT sentiment, count FROM aggregate_sentiments WHERE store = ?", (name,)):
+        store.sentiment_counts[store._sentiment_code(sentiment)] = count
+    for aspect, pos, neg in conn.execute(
+            "SELECT aspect, positive_count, negative_count FROM aggregate_aspects "
+            "WHERE store = ? ORDER BY aspect_id", (name,)):
+        aspect_id = store._aspect_id(aspect)
+        store.positive_counts[aspect_id] = pos
+        store.negative_counts[aspect_id] = neg
+    store.failed_ids = {review_id for (review_id,) in conn.execute(
+        "SELECT review_id FROM aggregate_failed WHERE store = ?", (name,))}
+    return store
+
+
+def write_store(conn, store, name=DEFAULT_STORE):
+    """Like save_store(), but the caller owns the connection and the transaction."""
+    conn.execute("DELETE FROM aggregate_sentiments WHERE store = ?", (name,))
+    conn.execute("DELETE FROM aggregate_aspects WHERE store = ?", (name,))
+    conn.execute("DELETE FROM aggregate_failed WHERE store = ?", (name,))
+    conn.execute(
+        "INSERT OR REPLACE INTO aggregate_stores (name, total_reviews, last_review_id, analyzer, updated_at) "
+        "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+        (name, store.total_reviews, store.last_review_id, store.analyzer),
+    )
+    conn.executemany(
+        "INSERT INTO aggregate_sentiments (store, sentiment, count) VALUES (?, ?, ?)",
+        [(name, sentiment, count) for sentiment, count in store.sentiments().items()],
+    )
+    conn.executemany(
+        "INSERT INTO aggregate_aspects (store, aspect_id, aspect, positive_count, negative_count) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(name, i, aspect, store.positive_counts[i], store.negative_counts[i])
+         for i, aspect in enumerate(store.aspect_names)],
+    )
+    conn.executemany(
+        "INSERT INTO aggregate_failed (store, review_id) VALUES (?, ?)",
+        [(name, review_id) for review_id in sorted(store.failed_ids)],
+    )
+
+
+def delete_store(conn, name):
+    """Remove a saved store, on a connection (and in a transaction) the caller owns."""
+    conn.execute("DELETE FROM aggregate_sentiments WHERE store = ?", (name,))
+    conn.execute("DELETE FROM aggregate_aspects WHERE store = ?", (name,))
+    conn.execute("DELETE FROM aggregate_failed WHERE store = ?", (name,))
+    conn.execute("DELETE FROM aggregate_stores WHERE name = ?", (name,))
+
+
+def load_store(name=DEFAULT_STORE):
+    """Load a saved store, or return an empty one if nothing was saved under this name."""
+    conn = _connect()
+    try:
+        return read_store(conn, name)
+    finally:
+        conn.close()
+
+
+def save_store(store, name=DEFAULT_STORE):
+    """Replace the saved store with this one, in a single transaction."""
+    conn = _connect()
+    try:
+        with conn:
+            write_store(conn, store, name)
+    finally:
+        conn.close()
+
+#final aggregates file
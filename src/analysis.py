@@ -1,147 +1,891 @@
 import os
-from openai import OpenAI
 from dotenv import load_dotenv
 import json
-import time
+import sqlite3
 import collections # Built-in library, no install needed
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
 # --- Import our other modules ---
-from database import fetch_reviews 
-from visuals import generate_wordcloud, generate_barchart
+from database import count_reviews, iter_review_pages, iter_reviews_by_ids, search_reviews
+from cache import make_cache_key, get_cached_results, store_results, clear_cache, clear_stale_results
+from aggregates import AggregateStore, DEFAULT_STORE, load_store, save_store
+from rate_limit import RateController
+import jobs
+from metrics import RunMetrics
+# openai, visuals (matplotlib, wordcloud), local_analyzer and dedupe (numpy) take a long
+# time to import, so they are imported inside the functions that use them
 
 # Load API Key from .env file
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
 # --- Configure the OpenAI API key ---
-try:
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    if not OPENAI_API_KEY:
-        raise ValueError("OPENAI_API_KEY not found in .env file.")
-    client = OpenAI(api_key=OPENAI_API_KEY) 
-except Exception as e:
-    print(f"CRITICAL ERROR: Failed to configure OpenAI API: {e}") 
+# The client is created the first time it is needed, so runs that never call
+# the API (cache hits only, the local analyzer, --help) don't pay for importing openai.
+_client = None
+_client_failed = False
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared OpenAI client, creating it on first use. None if the API is not configured."""
+    global _client, _client_failed
+    with _client_lock:
+        if _client is None and not _client_failed:
+            try:
+                api_key = os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    raise ValueError("OPENAI_API_KEY not found in .env file.")
+                from openai import OpenAI
+                # OPENAI_BASE_URL can point the app at another endpoint, e.g. mock_server.py
+                # Retries are done by the rate controller below, not by the client
+                _client = OpenAI(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL") or None, max_retries=0)
+            except Exception as e:
+                _client_failed = True
+                print(f"CRITICAL ERROR: Failed to configure OpenAI API: {e}")
+        return _client
 # --- END ---
 
 # Define path for the new recommendations file
 RECOMMENDATIONS_PATH = os.path.join(os.path.dirname(__file__), "..", "visuals", "recommendations.txt")
 
+# Metrics for each run (see metrics.py), written when the run ends
+METRICS_JSON_PATH = os.path.join(os.path.dirname(__file__), "..", "visuals", "metrics.json")
+METRICS_PROM_PATH = os.path.join(os.path.dirname(__file__), "..", "visuals", "metrics.prom")
+# How often a "Progress: ..." line with throughput and ETA is logged
+PROGRESS_LOG_SECONDS = 2.0
+# USD per million (prompt, completion) tokens, for the cost estimate in the metrics
+PRICE_PER_MILLION_TOKENS = {"gpt-4o-mini": (0.15, 0.60)}
+
+# How many reviews are sent to OpenAI at the same time.
+# All worker threads share the one client above (it is thread-safe and keeps
+# a pool of HTTP connections), so this is the number of in-flight requests.
+MAX_CONCURRENT_REQUESTS = 8
+
+# --- Settings that identify an analysis result in the cache ---
+# Bump PROMPT_VERSION whenever the prompt in get_detailed_analysis changes,
+# so results made with the old prompt are no longer used.
+MODEL_NAME = "gpt-4o-mini"
+PROMPT_VERSION = 2
+
+# New results are written to the cache every this many reviews
+CACHE_WRITE_EVERY = 100
+
+# --- Streaming ---
+# Reviews are read from the database PAGE_SIZE rows at a time, and at most
+# PAGES_IN_FLIGHT pages are being analyzed at once, so memory stays the same
+# however many reviews there are.
+PAGE_SIZE = 500
+PAGES_IN_FLIGHT = 2
+
+# --- Batched prompts ---
+# With BATCH_SIZE above 1, several reviews are packed into one request so the
+# instructions are only sent once. A batch is also closed early when its
+# reviews would go over BATCH_TOKEN_BUDGET (a rough estimate, ~4 chars/token).
+BATCH_SIZE = 1
+BATCH_TOKEN_BUDGET = 3000
+
+VALID_SENTIMENTS = ("Positive", "Negative", "Neutral")
+
+# --- Prompt size ---
+# The instructions and the JSON schema are a fixed system message, the same in
+# every request, so the provider can cache that prefix; the user message is
+# only the review text. The answer must follow the schema (strict structured
+# output) and its length is capped. Reviews longer than REVIEW_TOKEN_BUDGET
+# (estimated) tokens are shortened by cutting out the middle.
+REVIEW_TOKEN_BUDGET = 800
+MAX_OUTPUT_TOKENS_PER_REVIEW = 150
+CHARS_PER_TOKEN = 4  # rough estimate used for all token budgets
+
+REVIEW_SYSTEM_PROMPT = (
+    "Analyze the customer review about the Apple Vision Pro given in the user message. Return:\n"
+    "- sentiment: the overall sentiment, one of Positive, Negative or Neutral.\n"
+    "- positive_aspects: specific features or aspects the user liked (e.g. \"display\", \"eye tracking\").\n"
+    "- negative_aspects: specific features or aspects the user disliked (e.g. \"battery life\", \"weight\", \"price\").\n"
+    "If there are no positive or negative aspects, return an empty list."
+)
+BATCH_SYSTEM_PROMPT = (
+    "Analyze each customer review about the Apple Vision Pro in the JSON list given in the user message. "
+    "Return one entry in results per review, with:\n"
+    "- id: the id of the review, copied from the input.\n"
+    "- sentiment: the overall sentiment, one of Positive, Negative or Neutral.\n"
+    "- positive_aspects: specific features or aspects the user liked (e.g. \"display\", \"eye tracking\").\n"
+    "- negative_aspects: specific features or aspects the user disliked (e.g. \"battery life\", \"weight\", \"price\").\n"
+    "If a review has no positive or negative aspects, return an empty list."
+)
+
+_ANALYSIS_PROPERTIES = {
+    "sentiment": {"type": "string", "enum": list(VALID_SENTIMENTS)},
+    "positive_aspects": {"type": "array", "items": {"type": "string"}},
+    "negative_aspects": {"type": "array", "items": {"type": "string"}},
+}
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": _ANALYSIS_PROPERTIES,
+    "required": list(_ANALYSIS_PROPERTIES),
+    "additionalProperties": False,
+}
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {"results": {"type": "array", "items": {
+        "type": "object",
+        "properties": {"id": {"type": "integer"}, **_ANALYSIS_PROPERTIES},
+        "required": ["id", *_ANALYSIS_PROPERTIES],
+        "additionalProperties": False,
+    }}},
+    "required": ["results"],
+    "additionalProperties": False,
+}
+
+# --- Near-duplicates ---
+# With dedupe=True, reviews whose text is at least DEDUPE_THRESHOLD similar
+# (estimated Jaccard, see dedupe.py) to an earlier review reuse its result
+# instead of being analyzed again. The pre-pass holds about 1.2 KB per distinct
+# review, up to dedupe.MAX_SIGNATURES of them (about 120 MB).
+DEDUPE_THRESHOLD = 0.9
+
+# --- API rate limits ---
+# Every API call goes through this controller. It keeps us inside the account's
+# requests/tokens per minute, retries 429s and 5xx errors with jittered backoff,
+# and halves the requests in flight while the API is throttling us.
+# The defaults match a low usage tier; set these in .env to match your account.
+REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "200000"))
+MAX_RETRIES = 5
+
+rate_controller = RateController(
+    requests_per_minute=REQUESTS_PER_MINUTE,
+    tokens_per_minute=TOKENS_PER_MINUTE,
+    max_concurrency=MAX_CONCURRENT_REQUESTS,
+    max_retries=MAX_RETRIES,
+)
+
+# Timings, tokens and progress of the current run; the GUI stats panel reads it
+run_metrics = RunMetrics()
+
+# The totals the current (or last) run is adding to; the GUI's live dashboard reads them
+live_store = AggregateStore()
+
+
+def live_totals(top_n=10):
+    """A snapshot of the running totals (see AggregateStore.snapshot), safe to take while a run is adding to them."""
+    return live_store.snapshot(top_n)
+
+
+class OpenAIAnalyzer:
+    """
+    Analyzer backend that sends reviews to the OpenAI API (the original analyzer).
+
+    Every analyzer has the same small interface: a name, the model and version
+    used in cache keys, a default batch size, and analyze_batch(), which takes
+    a list of (review_id, text) pairs and returns {review_id: analysis or None}.
+    """
+    name = "openai"
+    model = MODEL_NAME
+    version = PROMPT_VERSION
+    batch_size = BATCH_SIZE
+    cacheable = True
+
+    def analyze_batch(self, batch, log_queue):
+        if len(batch) == 1:
+            review_id, text = batch[0]
+            return {review_id: get_detailed_analysis(text, log_queue)}
+        return get_batch_analysis(batch, log_queue)
 
-def analyze_sentiment_for_all(log_queue):
+
+def _local_analyzer():
+    from local_analyzer import LocalAnalyzer
+    return LocalAnalyzer()
+
+
+ANALYZERS = {
+    "openai": OpenAIAnalyzer,
+    "local": _local_analyzer,
+}
+
+
+def get_analyzer(backend, log_queue, allow_fallback=True):
+    """
+    Turn a backend name ("openai" or "local") into an analyzer object.
+    An analyzer object is passed through unchanged. If the OpenAI API is not
+    configured, the local analyzer is used instead, or with
+    allow_fallback=False a ValueError is raised.
+    """
+    if not isinstance(backend, str):
+        return backend
+    if backend not in ANALYZERS:
+        raise ValueError(f"Unknown analyzer backend '{backend}'. Choose from: {', '.join(ANALYZERS)}")
+    # Only checks for a key; the client itself is created by the first API call
+    if backend == "openai" and not os.getenv("OPENAI_API_KEY"):
+        if not allow_fallback:
+            raise ValueError("OpenAI API is not configured (OPENAI_API_KEY). An incremental run can't fall back "
+                             "to the local analyzer, its results would be mixed into the saved OpenAI totals.")
+        log_queue.put("OpenAI API is not configured, falling back to the local analyzer.\n")
+        backend = "local"
+    return ANALYZERS[backend]()
+
+
+def analyzer_key(analyzer):
+    """Names the analyzer, model and prompt version, e.g. "openai/gpt-4o-mini/v3"; saved with the totals it made."""
+    return f"{analyzer.name}/{analyzer.model}/v{analyzer.version}"
+
+
+def analyze_sentiment_for_all(log_queue, max_workers=MAX_CONCURRENT_REQUESTS, use_cache=True, incremental=False,
+                              batch_size=None, batch_token_budget=BATCH_TOKEN_BUDGET, backend="openai",
+                              search=None, search_mode="keyword", outputs=True, durable=False,
+                              dedupe=False, dedupe_threshold=DEDUPE_THRESHOLD):
     """
     Loop through all reviews, analyze them, generate visuals,
     and finally, generate a recommendations report.
+
+    Up to max_workers reviews are analyzed at once. Use max_workers=1
+    to analyze them one at a time.
+
+    Reviews whose text was already analyzed (same prompt version and model)
+    are read from the result cache instead of calling the API.
+    Pass use_cache=False to ignore cached results; fresh results are
+    still saved so the cache stays up to date.
+
+    With incremental=True only reviews added since the last run are analyzed,
+    plus the reviews that failed in earlier runs (they are taken out of the
+    "Error" count and tried again). Their counts are merged into the saved
+    running totals, so the charts and the report still cover every review.
+    A normal (full) run rebuilds the running totals from scratch.
+
+    With batch_size above 1, up to batch_size reviews (and at most
+    batch_token_budget estimated tokens) are analyzed in a single request.
+    By default the analyzer's own batch size is used.
+
+    backend picks the analyzer: "openai" (the default) or "local" for the
+    fast offline engine. An analyzer object can also be passed in. Without
+    an API key a full run falls back to the local analyzer and an
+    incremental run stops. An incremental run whose analyzer, model or
+    prompt version differs from the one behind the saved totals runs as a
+    full run instead, so the totals never mix two analyzers.
+
+    With search (e.g. "battery"), only the reviews matching that full-text
+    search are analyzed (search_mode "keyword", "phrase" or "prefix", see
+    database.search_reviews). The charts and report then cover just those
+    reviews, and the saved running totals for the whole table are left alone.
+
+    With durable=True the run is recorded in a job table (see jobs.py) and
+    every result is committed as it comes in. If the app stops halfway, the
+    next durable run with the same settings picks up where it stopped, and
+    several processes started with the same settings share the work.
+
+    With dedupe=True the reviews are first read once to find exact and near
+    duplicates (similarity of at least dedupe_threshold, see dedupe.py). Only
+    the first review of each cluster is analyzed and every duplicate gets its
+    result, so the counts still include every review. Near duplicates are
+    looked for among the last dedupe.MAX_SIGNATURES distinct reviews (about
+    1.2 KB of memory each); exact duplicates among all of them.
+
+    With outputs=False the charts and report are not made (the CLI runs
+    those as separate stages). Returns the aggregate store, or None if the
+    analysis could not run.
     """
+    global live_store
     try:
-        reviews = fetch_reviews()
-        if not reviews:
-            log_queue.put("CRITICAL ERROR: No reviews found in database.\n")
-            return
-        log_queue.put(f"Successfully loaded {len(reviews)} reviews from database.\n")
-
+        analyzer = get_analyzer(backend, log_queue, allow_fallback=not incremental)
+    except ValueError as e:
+        log_queue.put(f"CRITICAL ERROR: {e}\n")
+        return
+    if batch_size is None:
+        batch_size = analyzer.batch_size
+    if analyzer.name != "openai":
+        log_queue.put(f"Using the {analyzer.name} analyzer ({analyzer.model}).\n")
+        # The token budget only matters for API prompts
+        batch_token_budget = float("inf")
+    if not analyzer.cacheable:
+        use_cache = False
+    elif not use_cache:
+        log_queue.put("Result cache bypassed for this run.\n")
+    run_metrics.reset(prices=PRICE_PER_MILLION_TOKENS.get(analyzer.model))
+
+    # --- Step 1: Count the reviews (and load the running totals for an incremental run) ---
+    if search is not None and incremental:
+        log_queue.put("CRITICAL ERROR: A search run can't be incremental; untick one of the two.\n")
+        return
+    try:
+        store = load_store() if incremental else AggregateStore()
     except Exception as e:
+        log_queue.put(f"CRITICAL ERROR: Could not load saved running totals: {e}\n")
+        return
+    if incremental and store.analyzer not in (None, analyzer_key(analyzer)):
+        log_queue.put(f"The saved totals were made by {store.analyzer}, not {analyzer_key(analyzer)}; "
+                      f"running a full analysis instead of mixing the two.\n")
+        incremental = False
+        store = AggregateStore()
+    store.analyzer = analyzer_key(analyzer)
+    live_store = store
+
+    start_after = store.last_review_id
+    # Reviews that failed before are below the high-water mark; an incremental run retries them
+    retry_ids = store.forget_failures(store.failed_ids) if incremental else []
+    matching_ids = None
+    try:
+        if search is not None:
+            # Streamed in ID order like a full run, so results come out in the same order
+            matching_ids = sorted(search_reviews(search, search_mode))
+            review_count = len(matching_ids)
+        else:
+            review_count = count_reviews(after_id=start_after) + len(retry_ids)
+    except ValueError as e:
+        log_queue.put(f"CRITICAL ERROR: {e}\n")
+        return
+    except sqlite3.Error as e:
         log_queue.put(f"CRITICAL ERROR: Could not fetch reviews from database: {e}\n")
-        return 
-
-    all_sentiments = []
-    all_positive_aspects = []
-    all_negative_aspects = []
+        return
+    except Exception as e:
+        log_queue.put(f"CRITICAL ERROR: Could not count the reviews to analyze: {type(e).__name__}: {e}\n")
+        return
 
-    log_queue.put(f"Starting analysis of {len(reviews)} reviews (0.5s delay)...\n") 
+    if search is not None:
+        if not review_count:
+            log_queue.put(f"No reviews match the search '{search}'.\n")
+            return
+        log_queue.put(f"Search '{search}' ({search_mode}): {review_count} matching reviews.\n")
+    elif incremental:
+        if not review_count:
+            log_queue.put(f"No new reviews since review {start_after}. Results are up to date.\n")
+            return store  # the saved totals are already the answer
+        log_queue.put(
+            f"Incremental run: {review_count - len(retry_ids)} new reviews after review {start_after} "
+            f"({store.total_reviews} already analyzed).\n"
+        )
+        if retry_ids:
+            log_queue.put(f"Retrying {len(retry_ids)} reviews that failed in earlier runs.\n")
+    else:
+        if not review_count:
+            log_queue.put("CRITICAL ERROR: No reviews found in database.\n")
+            return
+        log_queue.put(f"Found {review_count} reviews in database.\n")
+
+    # Counts are added straight into the aggregate store as results come in,
+    # so memory depends on the number of distinct aspects, not on the number of reviews
+
+    worker = None
+    done_before = 0
+    if durable:
+        run_key = (f"{analyzer_key(analyzer)}/after={start_after}"
+                   f"/search={search_mode}:{search}/dedupe={dedupe_threshold if dedupe else 'off'}")
+        try:
+            run_id, created = jobs.open_run(run_key, start_after, matching_ids, retry_ids)
+            worker = jobs.JobWorker(run_id)
+            progress = jobs.run_progress(run_id)
+        except Exception as e:
+            log_queue.put(f"CRITICAL ERROR: Could not open the job table: {e}\n")
+            return
+        review_count = progress["total"]
+        done_before = review_count - progress["pending"]
+        if not created:
+            log_queue.put(f"Joining unfinished run {run_id[:8]} ({done_before} of {review_count} reviews already done).\n")
+
+    # --- Optional: group duplicate reviews, so each cluster is analyzed once ---
+    clusters = None
+    if dedupe:
+        log_queue.put(f"Looking for duplicate reviews (similarity >= {dedupe_threshold})...\n")
+        try:
+            with run_metrics.stage("dedupe"):
+                from dedupe import find_duplicates
+                clusters = find_duplicates(_review_pages(start_after, matching_ids, retry_ids), dedupe_threshold)
+        except ValueError as e:
+            log_queue.put(f"CRITICAL ERROR: {e}\n")
+            return
+        except sqlite3.Error as e:
+            log_queue.put(f"CRITICAL ERROR: Could not fetch reviews from database: {e}\n")
+            return
+        except Exception as e:
+            log_queue.put(f"CRITICAL ERROR: Duplicate detection failed: {type(e).__name__}: {e}\n")
+            return
+        run_metrics.set_section("dedupe", clusters.stats)
+        log_queue.put(f"Dedupe: {clusters.summary()}\n")
+
+    run_metrics.set_total(review_count - done_before)
+    max_workers = max(1, int(max_workers))
+    rate_controller.set_max_concurrency(max_workers)
+    stats = {"hits": 0, "misses": 0, "requests": 0, "reused": 0}
+    # Representatives that still have duplicates to come: ID -> cached analysis or the Future analyzing it
+    shared = {}
+    remaining = dict(clusters.members) if clusters else {}
+
+    def submit_page(executor, page):
+        """Check the cache for one page of reviews and send the misses off to be analyzed."""
+        keys = [make_cache_key(text, analyzer.version, analyzer.model) for _, text in page]
+        cached = {}
+        if use_cache:
+            try:
+                with run_metrics.stage("cache_lookup"):
+                    cached = get_cached_results(keys)
+            except Exception as e:
+                log_queue.put(f"Result cache unavailable for this page: {e}\n")
+
+        misses = []
+        follows = {}  # duplicate ID -> representative ID whose result it reuses
+        for (review_id, text), key in zip(page, keys):
+            if clusters and clusters.has_members(review_id):
+                # A representative: its duplicates (in this page or later ones) will wait for its result
+                shared[review_id] = cached.get(key)
+            if key in cached:
+                continue
+            representative = clusters.representative(review_id) if clusters else None
+            if representative in shared:
+                follows[review_id] = representative
+            else:
+                # Also a duplicate whose representative was analyzed by another worker
+                misses.append((review_id, text))
+        stats["hits"] += len(page) - len(misses) - len(follows)
+        stats["misses"] += len(misses)
+        stats["reused"] += len(follows)
+
+        futures = {}
+        for batch in make_batches(misses, batch_size, batch_token_budget):
+            future = executor.submit(analyzer.analyze_batch, batch, log_queue)
+            stats["requests"] += 1
+            for review_id, _ in batch:
+                futures[review_id] = future
+
+        for review_id, future in futures.items():
+            if review_id in shared:
+                shared[review_id] = future
+        return page, keys, cached, futures, follows
+
+    log_queue.put(f"Starting analysis of {review_count} reviews ({max_workers} at a time)...\n")
+
+    new_results = []
+    index = done_before
+
+    def read_pages(executor, pages):
+        """
+        Analyze a stream of pages, adding each result to the store in review order.
+        Returns False if the run had to stop (the database could not be read,
+        or the analyzer, rate limiter or job table raised an error).
+        """
+        nonlocal new_results, index
+        pages = run_metrics.timed_pages("db_fetch", pages)
+        in_flight = collections.deque()
+        try:
+            for page in pages:
+                in_flight.append(submit_page(executor, page))
+                if len(in_flight) >= PAGES_IN_FLIGHT:
+                    break
+
+            while in_flight:
+                page, keys, cached, futures, follows = in_flight.popleft()
+
+                for (review_id, text), key in zip(page, keys):
+                    index += 1
+                    representative = follows.get(review_id)
+                    if key in cached:
+                        analysis = cached[key]  # cache hit, no network call
+                    elif representative is not None:
+                        source = shared[representative]  # a duplicate, reuse its cluster's result
+                        analysis = source.result()[representative] if isinstance(source, Future) else source
+                    else:
+                        analysis = futures[review_id].result()[review_id]
+                    if clusters and review_id in clusters.representative_of:
+                        owner = clusters.representative_of[review_id]
+                        remaining[owner] -= 1
+                        if not remaining[owner]:
+                            shared.pop(owner, None)  # its last duplicate is done
+
+                    if analysis:
+                        sentiment = analysis.get("sentiment", "Error")
+                        pos_aspects = analysis.get("positive_aspects", [])
+                        neg_aspects = analysis.get("negative_aspects", [])
+
+                        store.add(review_id, sentiment, pos_aspects, neg_aspects)
+
+                        if key not in cached and representative is None and sentiment != "Error":
+                            new_results.append((key, analysis))
+
+                        log_msg = f"Review {review_id} ({index}/{review_count}) {sentiment}: +{pos_aspects} / -{neg_aspects}"
+                        if representative is not None:
+                            log_msg += f" (duplicate of review {representative})"
+                        log_msg += "\n"
+                        log_queue.put(log_msg)
+
+                    else:
+                        log_queue.put(f"Review {review_id}: Failed to analyze (skipped).\n")
+                        store.add_failure(review_id)
+
+                    if worker:
+                        worker.record(review_id, analysis)
+
+                    run_metrics.review_done()
+                    if run_metrics.progress_due(PROGRESS_LOG_SECONDS):
+                        log_queue.put(f"Progress: {run_metrics.status_line()}\n")
+
+                    if len(new_results) >= CACHE_WRITE_EVERY:
+                        _save_to_cache(new_results, analyzer, log_queue)
+                        new_results = []
+
+                if worker:
+                    worker.page_done()
+
+                # This page is done, start on the next one
+                next_page = next(pages, None)
+                if next_page is not None:
+                    in_flight.append(submit_page(executor, next_page))
+        except Exception as e:
+            if isinstance(e, sqlite3.Error):
+                log_queue.put(f"CRITICAL ERROR: Database error while reading reviews or saving results: {e}\n")
+            else:
+                # Raised by a page's analysis future (analyzer, rate limiter) or by the job worker
+                log_queue.put(f"CRITICAL ERROR: Analysis stopped: {type(e).__name__}: {e}\n")
+            for _, _, _, futures, _ in in_flight:
+                for future in futures.values():
+                    future.cancel()
+            return False
+        finally:
+            pages.close()
+        return True
+
+    with run_metrics.stage("analysis"), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # --- Step 2: Stream pages from the database into the analyzer ---
+        # Only a few pages are in flight at once: while one page is being read
+        # back, the next ones are already being analyzed. Results are read in
+        # review order and each batch result is keyed by review ID, so every
+        # result stays with its review and the totals come out the same as in a
+        # sequential run, no matter which request finishes first.
+        try:
+            if worker:
+                # Claim shards until none are left, then wait for the other
+                # workers; shards whose worker died are claimed again
+                while True:
+                    if not read_pages(executor, worker.pages()):
+                        return
+                    if worker.wait_for_others(log_queue):
+                        break
+            elif not read_pages(executor, _review_pages(start_after, matching_ids, retry_ids)):
+                return
+        finally:
+            if worker:
+                # Whatever was analyzed is kept, even if the run stops here
+                worker.close()
+
+    _save_to_cache(new_results, analyzer, log_queue)
+
+    if use_cache:
+        log_queue.put(f"Result cache: {stats['hits']} hits, {stats['misses']} misses.\n")
+    if clusters:
+        log_queue.put(f"Dedupe: {stats['reused']} duplicate reviews reused their cluster's result instead of being analyzed.\n")
+    if batch_size > 1 and analyzer.name == "openai":
+        log_queue.put(f"Packed {stats['misses']} reviews into {stats['requests']} batched requests.\n")
 
-    for index, (review_id, text) in enumerate(reviews):
-        
-        time.sleep(0.01) 
-        analysis = get_detailed_analysis(text, log_queue) 
+    log_queue.put("\n...Analysis loop complete!\n")
 
-        if analysis:
-            sentiment = analysis.get("sentiment", "Error")
-            pos_aspects = analysis.get("positive_aspects", [])
-            neg_aspects = analysis.get("negative_aspects", [])
-            
-            all_sentiments.append(sentiment)
-            all_positive_aspects.extend(pos_aspects)
-            all_negative_aspects.extend(neg_aspects)
-            
-            log_msg = f"Review {review_id} ({index+1}/{len(reviews)}) {sentiment}: +{pos_aspects} / -{neg_aspects}\n"
-            log_queue.put(log_msg)
-            
-        else:
-            log_queue.put(f"Review {review_id}: Failed to analyze (skipped).\n")
-            all_sentiments.append("Error")
+    if worker:
+        # Every worker's results are in the job table; build the totals from all of them
+        try:
+            with run_metrics.stage("merge"):
+                store = jobs.merge_run(worker.run_id, save_as=None if search is not None else DEFAULT_STORE,
+                                       analyzer=analyzer_key(analyzer))
+            live_store = store  # now includes every worker's results
+            if worker.reclaimed:
+                log_queue.put(f"Took over {worker.reclaimed} shard(s) from workers that had stopped.\n")
+            log_queue.put(f"Run {worker.run_id[:8]} merged ({store.total_reviews} reviews).\n")
+        except Exception as e:
+            log_queue.put(f"CRITICAL ERROR: Could not merge the run's results: {e}\n")
+            return
 
-    log_queue.put("\n...Analysis loop complete!\n")
+    if search is not None:
+        # The saved totals describe the whole table; a search run must not replace them
+        log_queue.put(f"The charts and report below cover only the {store.total_reviews} reviews matching '{search}'.\n")
+    elif worker:
+        log_queue.put(f"Running totals saved ({store.total_reviews} reviews up to review {store.last_review_id}).\n")
+    else:
+        try:
+            save_store(store)
+            log_queue.put(f"Running totals saved ({store.total_reviews} reviews up to review {store.last_review_id}).\n")
+        except Exception as e:
+            log_queue.put(f"Could not save running totals: {e}\n")
+
+    # --- Steps 3 and 4: Visuals and recommendations, at the same time ---
+    if outputs:
+        generate_outputs(store, log_queue)
+        write_metrics(log_queue)
+    return store
+
+
+def _review_pages(start_after, matching_ids=None, retry_ids=()):
+    """The pages of reviews a run covers: the search matches, or the retried reviews and then those after start_after."""
+    if matching_ids is not None:
+        yield from iter_reviews_by_ids(matching_ids, page_size=PAGE_SIZE)
+        return
+    if retry_ids:
+        yield from iter_reviews_by_ids(retry_ids, page_size=PAGE_SIZE)
+    yield from iter_review_pages(after_id=start_after, page_size=PAGE_SIZE)
+
+
+def render_visuals(store, log_queue):
+    """
+    Step 3: Draw the bar chart and word clouds from the aggregate store.
+    Returns {filename: status} (see visuals.render_all), or None if drawing failed.
+    """
+    from visuals import render_all, BAR_CHART_FILE, POSITIVE_WC_FILE, NEGATIVE_WC_FILE
 
-    # --- Step 3: Call Visualizers ---
     log_queue.put("Generating visualizations...\n")
+    messages = {
+        BAR_CHART_FILE: ("Sentiment bar chart", "No sentiment data, skipping bar chart."),
+        POSITIVE_WC_FILE: ("Positive aspects word cloud", "No positive aspects found, skipping word cloud."),
+        NEGATIVE_WC_FILE: ("Negative aspects word cloud", "No negative aspects found, skipping word cloud."),
+    }
     try:
-        generate_barchart(all_sentiments)
-        log_queue.put("Sentiment bar chart generated.\n")
+        with run_metrics.stage("rendering"):
+            status = render_all(
+                store.sentiments(),
+                store.aspect_frequencies("positive"),
+                store.aspect_frequencies("negative"),
+            )
     except Exception as e:
-        log_queue.put(f"Bar chart generation FAILED: {e}\n")
-
-    positive_text = " ".join(all_positive_aspects)
-    if positive_text:
-        generate_wordcloud(positive_text, "positive_aspects_wordcloud.png")
-        log_queue.put("Positive aspects word cloud generated.\n")
-    else:
-        log_queue.put("No positive aspects found, skipping word cloud.\n")
-
-    negative_text = " ".join(all_negative_aspects)
-    if negative_text:
-        generate_wordcloud(negative_text, "negative_aspects_wordcloud.png")
-        log_queue.put("Negative aspects word cloud generated.\n")
-    else:
-        log_queue.put("No negative aspects found, skipping word cloud.\n")
+        log_queue.put(f"Visualization FAILED: {e}\n")
+        return None
 
+    for filename, (label, empty_message) in messages.items():
+        result = status.get(filename, "")
+        if result == "rendered":
+            log_queue.put(f"{label} generated.\n")
+        elif result == "unchanged":
+            log_queue.put(f"{label} unchanged since the last run, not redrawn.\n")
+        elif result == "no data":
+            log_queue.put(empty_message + "\n")
+        else:
+            log_queue.put(f"{label} generation {result}\n")
     log_queue.put("Visualizations complete.\n")
+    return status
 
-    # --- NEW: Step 4: Generate Recommendations ---
+
+def write_recommendations(store, log_queue):
+    """Step 4: Ask for the recommendations report and save it. Returns the file path, or None on failure."""
     log_queue.put("\nGenerating final recommendations report...\n")
     try:
         # Get the Top 5 most common positive and negative aspects
-        pos_counts = collections.Counter(all_positive_aspects).most_common(5)
-        neg_counts = collections.Counter(all_negative_aspects).most_common(5)
+        pos_counts = store.top_aspects("positive", 5)
+        neg_counts = store.top_aspects("negative", 5)
 
         # Call new function to get report from OpenAI
-        report_text = get_recommendations(pos_counts, neg_counts, len(reviews), log_queue)
+        with run_metrics.stage("recommendations"):
+            report_text = get_recommendations(pos_counts, neg_counts, store.total_reviews, log_queue)
         
         if report_text:
             # Save the report to a file
             with open(RECOMMENDATIONS_PATH, "w", encoding="utf-8") as f:
                 f.write(report_text)
             log_queue.put("Recommendations report saved to visuals/recommendations.txt\n")
+            return RECOMMENDATIONS_PATH
         else:
             log_queue.put("Failed to generate recommendations report.\n")
             
     except Exception as e:
         log_queue.put(f"Failed to generate recommendations report: {e}\n")
-    # --- END NEW STEP ---
+    return None
 
 
-def get_detailed_analysis(text, log_queue):
+def generate_outputs(store, log_queue):
     """
-    Ask OpenAI for a detailed analysis of a *single review*.
+    Run steps 3 and 4 together: the images are drawn on a background thread
+    while the recommendations request is waiting on the API.
+    """
+    with ThreadPoolExecutor(max_workers=1) as render_thread:
+        rendering = render_thread.submit(render_visuals, store, log_queue)
+        write_recommendations(store, log_queue)
+        rendering.result()
+
+
+def write_metrics(log_queue):
+    """Save the current run's metrics as JSON and Prometheus text, and log a summary line."""
+    try:
+        os.makedirs(os.path.dirname(METRICS_JSON_PATH), exist_ok=True)
+        run_metrics.write(METRICS_JSON_PATH, METRICS_PROM_PATH)
+        log_queue.put(f"Run stats: {run_metrics.status_line()}\n")
+        log_queue.put("Metrics saved to visuals/metrics.json and visuals/metrics.prom\n")
+    except Exception as e:
+        log_queue.put(f"Could not save metrics: {e}\n")
+
+
+def clear_result_cache(stale_only=True):
+    """
+    Delete cached results: with stale_only, only those from another model or
+    prompt version (after MODEL_NAME or PROMPT_VERSION changed), otherwise
+    all of them. Returns how many were deleted.
     """
-    prompt = f"""
-    Analyze this customer review about the Apple Vision Pro.
-    Provide a JSON response with three keys:
-    1. "sentiment": (string) The overall sentiment. Must be one of: Positive, Negative, or Neutral.
-    2. "positive_aspects": (list of strings) A list of specific features or aspects the user liked (e.g., "display", "eye tracking").
-    3. "negative_aspects": (list of strings) A list of specific features or aspects the user disliked (e.g., "battery life", "weight", "price").
+    if stale_only:
+        return clear_stale_results(MODEL_NAME, PROMPT_VERSION)
+    return clear_cache()
+
 
-    If there are no positive or negative aspects, return an empty list [].
+def _save_to_cache(entries, analyzer, log_queue):
+    """Write new results to the cache. A cache failure never stops the analysis."""
+    if not analyzer.cacheable:
+        return
+    try:
+        store_results(entries, analyzer.version, analyzer.model)
+    except Exception as e:
+        log_queue.put(f"Could not save results to cache: {e}\n")
 
-    Review: "{text}"
 
-    JSON Response:
+def _create_completion(estimated_tokens, log_queue, kind="review", **request):
+    """
+    Send one chat completion request through the rate controller.
+    Reads the rate-limit headers of every response; raises if all retries fail.
+    The call's latency, tokens and retries are added to run_metrics under `kind`.
     """
-   
+    timings = {}
+    start = time.perf_counter()
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            response_format={"type": "json_object"}, 
-            messages=[{"role": "user", "content": prompt}]
+        raw = rate_controller.call(
+            lambda: get_client().chat.completions.with_raw_response.create(**request),
+            estimated_tokens=estimated_tokens,
+            log_queue=log_queue,
+            timings=timings,
         )
+        response = raw.parse()
+    except Exception:
+        run_metrics.record_call(kind, time.perf_counter() - start, timings, error=True)
+        raise
+    run_metrics.record_call(kind, time.perf_counter() - start, timings, getattr(response, "usage", None))
+    return response
+
+
+def _estimate_tokens(text):
+    """Rough token count (about 4 characters per token), good enough for budgeting."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _request_tokens(request):
+    """Tokens a request can use: its messages plus the output cap (the API budgets the cap too)."""
+    prompt = sum(_estimate_tokens(message["content"]) for message in request["messages"])
+    return prompt + request["max_completion_tokens"]
+
+
+def truncate_review(text, token_budget=None):
+    """
+    Shorten a review to about token_budget tokens (default REVIEW_TOKEN_BUDGET)
+    by cutting out the middle: the opening and the closing verdict carry most
+    of the sentiment. Shorter reviews are returned unchanged.
+    """
+    limit = (token_budget or REVIEW_TOKEN_BUDGET) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    head = limit * 2 // 3
+    return text[:head].rstrip() + " [...] " + text[len(text) - (limit - head):].lstrip()
+
+
+def _response_format(name, schema):
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def make_batches(reviews, batch_size, token_budget):
+    """
+    Split a list of (review_id, text) pairs into batches of at most batch_size
+    reviews whose estimated tokens stay within token_budget.
+    A single review that is over the budget gets a batch of its own.
+    """
+    batch_size = max(1, int(batch_size))
+    batches = []
+    current = []
+    current_tokens = 0
+    for review_id, text in reviews:
+        tokens = min(_estimate_tokens(text), REVIEW_TOKEN_BUDGET)  # long reviews are truncated in the prompt
+        if current and (len(current) >= batch_size or current_tokens + tokens > token_budget):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append((review_id, text))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def clean_analysis(item):
+    """
+    Return the analysis in the usual {"sentiment", "positive_aspects", "negative_aspects"}
+    shape, or None if the model's answer for this review is missing or mangled.
+    """
+    if not isinstance(item, dict) or item.get("sentiment") not in VALID_SENTIMENTS:
+        return None
+    cleaned = {"sentiment": item["sentiment"]}
+    for field in ("positive_aspects", "negative_aspects"):
+        aspects = item.get(field, [])
+        if not isinstance(aspects, list) or not all(isinstance(a, str) for a in aspects):
+            return None
+        cleaned[field] = aspects
+    return cleaned
+
+
+def get_batch_analysis(batch, log_queue):
+    """
+    Ask OpenAI to analyze several reviews in *one request*.
+    batch is a list of (review_id, text) pairs. Returns {review_id: analysis or None}.
+    Any review the model drops or answers badly is retried on its own.
+    """
+    request = build_batch_request(batch)
+    results = {}
+    try:
+        response = _create_completion(_request_tokens(request), log_queue, kind="batch", **request)
+        items = json.loads(response.choices[0].message.content).get("results", [])
+        for item in items if isinstance(items, list) else []:
+            if isinstance(item, dict):
+                try:
+                    review_id = int(item.get("id"))
+                except (TypeError, ValueError):
+                    continue
+                cleaned = clean_analysis(item)
+                if cleaned is not None:
+                    results[review_id] = cleaned
+    except Exception as e:
+        log_queue.put(f"Batch of {len(batch)} reviews failed, retrying one by one. API Error: {e}\n")
+
+    # --- Retry anything the batch did not answer properly ---
+    for review_id, text in batch:
+        if review_id not in results:
+            results[review_id] = get_detailed_analysis(text, log_queue)
+    # Ignore any IDs the model made up that were not in this batch
+    return {review_id: results[review_id] for review_id, _ in batch}
+
+
+def build_batch_request(batch):
+    """The chat completion request for several (review_id, text) pairs at once."""
+    reviews_json = json.dumps([{"id": review_id, "review": truncate_review(text)} for review_id, text in batch],
+                              ensure_ascii=False)
+    return {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": reviews_json},
+        ],
+        "response_format": _response_format("review_batch_analysis", BATCH_SCHEMA),
+        "max_completion_tokens": MAX_OUTPUT_TOKENS_PER_REVIEW * len(batch),
+    }
+
+
+def build_review_request(text):
+    """
+    The chat completion request for one review: model, messages, response
+    format and output cap. Used by get_detailed_analysis() and for the Batch
+    API files written by bulk.py, so both send exactly the same prompt.
+    """
+    return {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": REVIEW_SYSTEM_PROMPT},
+            {"role": "user", "content": truncate_review(text)},
+        ],
+        "response_format": _response_format("review_analysis", REVIEW_SCHEMA),
+        "max_completion_tokens": MAX_OUTPUT_TOKENS_PER_REVIEW,
+    }
+
+
+def get_detailed_analysis(text, log_queue):
+    """
+    Ask OpenAI for a detailed analysis of a *single review*.
+    """
+    request = build_review_request(text)
+    try:
+        response = _create_completion(_request_tokens(request), log_queue, **request)
         sentiment_json = json.loads(response.choices[0].message.content)
         return sentiment_json
     except Exception as e:
@@ -180,7 +924,10 @@ def get_recommendations(pos_counts, neg_counts, total_reviews, log_queue):
     """
 
     try:
-        response = client.chat.completions.create(
+        response = _create_completion(
+            _estimate_tokens(system_prompt + user_prompt) + 600,
+            log_queue,
+            kind="recommendations",
             model="gpt-4o-mini", # Use a smart model for this
             messages=[
                 {"role": "system", "content": system_prompt},
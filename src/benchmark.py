@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import queue
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# --- End-to-end throughput benchmark ---
+# Builds synthetic 'reviews' databases, starts mock_server.py in its own
+# process, and runs analyze_sentiment_for_all against it. Nothing touches the
+# real data/feedback.db, the real cache, or the real OpenAI API.
+#
+#     python benchmark.py --sizes 100,10000,100000
+#     python benchmark.py --sizes 1000 --save baseline.json
+#     python benchmark.py --sizes 1000 --baseline baseline.json   # exits 1 on a regression
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_OPENERS = ["Honestly,", "After a month,", "As a developer,", "I returned it.", "Wow.", "Mixed feelings.", ""]
+_PHRASES = [
+    "the display is stunning", "the display is blurry at the edges", "eye tracking feels like magic",
+    "eye tracking is slow in dim rooms", "it is way too heavy", "the weight is fine with the new strap",
+    "battery life is terrible", "the battery is good enough for a movie", "the price is overpriced for what it does",
+    "the price is worth it", "apps are limited", "the apps are great", "passthrough is incredible",
+    "immersive videos are mind-blowing", "typing in the air is awkward", "the audio is excellent",
+    "the strap is uncomfortable after an hour", "setup was easy", "visionOS feels empty", "movies look amazing",
+]
+
+
+def make_synthetic_db(path, rows, seed=0):
+    """Create a reviews database with `rows` random but repeatable reviews."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, review_text TEXT NOT NULL)")
+
+    def reviews():
+        for i in range(rows):
+            parts = rng.sample(_PHRASES, rng.randint(1, 4))
+            text = " ".join([rng.choice(_OPENERS)] + [p.capitalize() + "." for p in parts]).strip()
+            yield (f"{text} (#{i})",)  # the number keeps every review text unique
+
+    with conn:
+        conn.executemany("INSERT INTO reviews (review_text) VALUES (?)", reviews())
+    conn.close()
+
+
+def start_mock_server(args):
+    """Run mock_server.py in a separate process and return (process, base_url)."""
+    command = [
+        sys.executable, os.path.join(SRC_DIR, "mock_server.py"), "--port", "0",
+        "--latency-ms", str(args.latency_ms), "--latency-sigma", str(args.latency_sigma),
+        "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+        "--rpm-limit", str(args.rpm_limit), "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    first_line = process.stdout.readline().strip()
+    return process, first_line.rsplit(" ", 1)[-1]
+
+
+class TimedAnalyzer:
+    """Wraps an analyzer and records how long each request (one batch of reviews) took."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+        self.model = inner.model
+        self.version = inner.version
+        self.batch_size = inner.batch_size
+        self.cacheable = inner.cacheable
+        self.latencies = []  # seconds per analyze_batch call
+        self.reviews = 0
+        self.lock = threading.Lock()
+
+    def analyze_batch(self, batch, log_queue):
+        start = time.perf_counter()
+        results = self.inner.analyze_batch(batch, log_queue)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies.append(elapsed)
+            self.reviews += len(batch)
+        return results
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def warm_up(args):
+    """
+    Import the analyzer and send one request before anything is timed, so the
+    first size measured doesn't include the lazy openai import and client setup.
+    """
+    import analysis
+    analyzer = analysis.get_analyzer(args.backend, queue.Queue())
+    analyzer.analyze_batch([(0, "Warm-up review: the display is stunning.")], queue.Queue())
+
+
+def run_one(size, args, workdir):
+    """Benchmark one database size and return a dict of results."""
+    import analysis
+    import cache
+    import database
+    import visuals
+
+    db_path = os.path.join(workdir, f"reviews_{size}.db")
+    make_synthetic_db(db_path, size, seed=args.seed)
+
+    # Point every module at the temporary files
+    database.DB_PATH = db_path
+    cache.CACHE_DB_PATH = os.path.join(workdir, f"analysis_{size}.db")
+    visuals.VISUALS_DIR = os.path.join(workdir, f"visuals_{size}")
+    os.makedirs(visuals.VISUALS_DIR, exist_ok=True)
+    analysis.RECOMMENDATIONS_PATH = os.path.join(visuals.VISUALS_DIR, "recommendations.txt")
+    analysis.METRICS_JSON_PATH = os.path.join(visuals.VISUALS_DIR, "metrics.json")
+    analysis.METRICS_PROM_PATH = os.path.join(visuals.VISUALS_DIR, "metrics.prom")
+
+    # Budgets for this run, so the benchmark measures the pipeline and not the default account tier
+    analysis.rate_controller.set_budgets(args.rpm, args.tpm)
+
+    analyzer = TimedAnalyzer(analysis.get_analyzer(args.backend, queue.Queue()))
+
+    # Drain the log like the GUI does, so the queue does not grow without limit
+    log_queue = queue.Queue()
+    stop = threading.Event()
+    messages = {"count": 0, "errors": 0}
+
+    def drain():
+        while not stop.is_set() or not log_queue.empty():
+            try:
+                msg = log_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            messages["count"] += 1
+            if "Error" in msg or "FAILED" in msg:
+                messages["errors"] += 1
+            if args.verbose:
+                sys.stdout.write(msg)
+
+    drainer = threading.Thread(target=drain, daemon=True)
+    drainer.start()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    analysis.analyze_sentiment_for_all(
+        log_queue, max_workers=args.workers, batch_size=args.batch_size, backend=analyzer, use_cache=False,
+        durable=args.durable,
+    )
+    wall = time.perf_counter() - start
+    peak_mb = None
+    if args.trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    stop.set()
+    drainer.join()
+
+    return {
+        "rows": size,
+        "wall_s": round(wall, 3),
+        "reviews_per_s": round(size / wall, 1) if wall else None,
+        # Per request: with a batch size above 1, one request carries several reviews
+        "request_p50_ms": round(_percentile(analyzer.latencies, 0.50) * 1000, 1),
+        "request_p99_ms": round(_percentile(analyzer.latencies, 0.99) * 1000, 1),
+        "reviews_per_request": round(analyzer.reviews / len(analyzer.latencies), 1) if analyzer.latencies else None,
+        "peak_mb": round(peak_mb, 1) if peak_mb is not None else None,
+        "log_messages": messages["count"],
+        "error_messages": messages["errors"],
+    }
+
+
+def check_regressions(results, baseline_path, tolerance):
+    """Compare reviews/s against a saved baseline. Returns a list of problems."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {run["rows"]: run for run in json.load(f)["runs"]}
+    problems = []
+    for run in results:
+        old = baseline.get(run["rows"])
+        if old and old.get("reviews_per_s") and run["reviews_per_s"] < old["reviews_per_s"] * (1 - tolerance):
+            problems.append(
+                f"{run['rows']} rows: {run['reviews_per_s']} reviews/s is more than "
+                f"{tolerance:.0%} below the baseline of {old['reviews_per_s']}"
+            )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput benchmark against the mock OpenAI server.")
+    parser.add_argument("--sizes", default="100,10000,100000", help="comma-separated row counts")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent requests")
+    parser.add_argument("--batch-size", type=int, default=None, help="reviews per request (default: analyzer default)")
+    parser.add_argument("--backend", default="openai", help="openai (against the mock server) or local")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="mock server median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="mock server latency spread")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock server 500 rate")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="mock server 429 rate")
+    parser.add_argument("--rpm", type=int, default=1_000_000, help="client requests-per-minute budget")
+    parser.add_argument("--tpm", type=int, default=1_000_000_000, help="client tokens-per-minute budget")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="mock server requests-per-minute cap (0 = none)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--durable", action="store_true", help="run through the job table (measures its overhead)")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+                        help="skip tracemalloc (it slows Python down a little)")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a JSON file written with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs the baseline")
+    parser.add_argument("--verbose", action="store_true", help="print the analysis log")
+    args = parser.parse_args()
+
+    mock = None
+    if args.backend == "openai":
+        mock, base_url = start_mock_server(args)
+        # Must be set before the first API call, which creates the client
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ["OPENAI_API_KEY"] = "mock"
+        print(f"Mock server: {base_url}")
+
+    sys.path.insert(0, SRC_DIR)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            warm_up(args)
+            print(f"{'rows':>8} {'wall s':>9} {'reviews/s':>10} {'req p50 ms':>11} {'req p99 ms':>11} "
+                  f"{'reviews/req':>12} {'peak MB':>8}")
+            for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+                run = run_one(size, args, workdir)
+                results.append(run)
+                print(f"{run['rows']:>8} {run['wall_s']:>9} {run['reviews_per_s']:>10} "
+                      f"{run['request_p50_ms']:>11} {run['request_p99_ms']:>11} {run['reviews_per_request']:>12} "
+                      f"{run['peak_mb'] if run['peak_mb'] is not None else '-':>8}")
+    finally:
+        if mock:
+            mock.terminate()
+            mock.wait()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "runs": results}, f, indent=2)
+        print(f"Results saved to {args.save}")
+
+    if args.baseline:
+        problems = check_regressions(results, args.baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
+
+#final benchmark file
@@ -0,0 +1,299 @@
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+
+import analysis
+import aggregates
+import cache
+import database
+import jobs
+
+# --- Offline bulk mode (Batch API files) ---
+# For big overnight backlogs, synchronous calls are the slowest and most
+# expensive way to analyze reviews. Instead:
+#
+#     python bulk.py export                      # write batches/<run>_0000.jsonl, ... (one request per review)
+#     (upload the files to the Batch API, wait, download the output files)
+#     python bulk.py ingest results/*.jsonl      # read the results back, save the totals
+#
+# Export opens a durable run in the job table (see jobs.py) covering every
+# review without a result; reviews already in the result cache are filled in
+# straight away, the rest become requests built by analysis.build_review_request(),
+# the same prompt get_detailed_analysis() sends. Each request's custom_id is
+# "<run_id>-<review_id>", so result files can be ingested in any order, in
+# several goes, without a manifest. Ingest reads the result files one line at
+# a time, entirely offline, and records every result (or failure) in the run.
+# Once every review has a good result, the results are saved to the result
+# cache and the run is merged into the totals used by the charts and the report. Exporting again only
+# writes requests for reviews that still have no good result (missing or failed).
+
+BATCH_DIR = os.path.join(os.path.dirname(__file__), "..", "batches")
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Batch API limits per input file are 50,000 requests and 200 MB
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+# Results are written to the job table this many at a time
+INGEST_COMMIT_EVERY = 5000
+# How many failed results are listed individually in the report
+FAILURE_SAMPLES = 20
+
+
+def _run_key(after_id):
+    return f"bulk/{analysis.MODEL_NAME}/v{analysis.PROMPT_VERSION}/after={after_id}"
+
+
+def _log(log_queue, message):
+    if log_queue is not None:
+        log_queue.put(message + "\n")
+
+
+class _ShardWriter:
+    """Writes request lines to numbered files, starting a new file before either size limit is passed."""
+
+    def __init__(self, out_dir, prefix, max_requests, max_bytes):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.files = []
+        self.file = None
+        self.count = 0
+        self.size = 0
+
+    def write(self, line):
+        data = (line + "\n").encode("utf-8")
+        if self.file is None or self.count >= self.max_requests or self.size + len(data) > self.max_bytes:
+            self.close()
+            path = os.path.join(self.out_dir, f"{self.prefix}_{len(self.files):04d}.jsonl")
+            self.file = open(path, "wb")
+            self.files.append(path)
+            self.count = 0
+            self.size = 0
+        self.file.write(data)
+        self.count += 1
+        self.size += len(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def export_requests(out_dir=BATCH_DIR, incremental=False, use_cache=True,
+                    max_requests=MAX_REQUESTS_PER_FILE, max_bytes=MAX_BYTES_PER_FILE, log_queue=None):
+    """
+    Write a Batch API request file (or several, split at the size limits) for
+    every review of the bulk run that has no result yet. With incremental=True
+    the run covers only reviews added since the saved totals, plus the ones
+    the saved totals count as failed. Returns
+    {"run_id", "files", "requests", "cached"}.
+    """
+    saved = aggregates.load_store() if incremental else aggregates.AggregateStore()
+    if saved.analyzer not in (None, analysis.analyzer_key(analysis.OpenAIAnalyzer)):
+        _log(log_queue, f"The saved totals were made by {saved.analyzer}; exporting every review instead "
+                        f"of only the new ones.")
+        saved = aggregates.AggregateStore()
+    after_id = saved.last_review_id
+    run_id, created = jobs.open_run(_run_key(after_id), after_id, retry_ids=saved.failed_ids)
+    _log(log_queue, f"{'Created' if created else 'Continuing'} bulk run {run_id[:8]} (reviews after {after_id}).")
+
+    os.makedirs(out_dir, exist_ok=True)
+    writer = _ShardWriter(out_dir, f"batch_{run_id[:8]}_{int(time.time())}", max_requests, max_bytes)
+    requests = cached_count = 0
+    try:
+        for review_ids in jobs.iter_unfinished(run_id):
+            for page in database.iter_reviews_by_ids(review_ids, page_size=analysis.PAGE_SIZE):
+                keys = [cache.make_cache_key(text, analysis.PROMPT_VERSION, analysis.MODEL_NAME) for _, text in page]
+                cached = cache.get_cached_results(keys) if use_cache else {}
+                hits = [(review_id, cached[key]) for (review_id, _), key in zip(page, keys) if key in cached]
+                if hits:
+                    jobs.record_results(run_id, hits)
+                    cached_count += len(hits)
+                for (review_id, text), key in zip(page, keys):
+                    if key in cached:
+                        continue
+                    writer.write(json.dumps({
+                        "custom_id": f"{run_id}-{review_id}",
+                        "method": "POST",
+                        "url": BATCH_ENDPOINT,
+                        "body": analysis.build_review_request(text),
+                    }, ensure_ascii=False))
+                    requests += 1
+    finally:
+        writer.close()
+
+    _log(log_queue, f"{requests} requests written to {len(writer.files)} file(s); "
+                    f"{cached_count} reviews filled in from the result cache.")
+    return {"run_id": run_id, "files": writer.files, "requests": requests, "cached": cached_count}
+
+
+def parse_result_line(line):
+    """
+    Turn one line of a Batch API output file into (run_id, review_id, analysis, failure).
+    analysis is None when the request failed, and failure then says why.
+    run_id is None if the line can't be matched to a review at all.
+    """
+    try:
+        item = json.loads(line)
+        run_id, review_id = item["custom_id"].rsplit("-", 1)
+        review_id = int(review_id)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None, None, None, "unreadable line"
+
+    error = item.get("error")
+    response = item.get("response") or {}
+    if error:
+        return run_id, review_id, None, f"error: {error.get('code') or error.get('message') or error}"
+    if response.get("status_code") != 200:
+        return run_id, review_id, None, f"HTTP {response.get('status_code')}"
+    try:
+        content = response["body"]["choices"][0]["message"]["content"]
+        result = analysis.clean_analysis(json.loads(content))
+    except (ValueError, KeyError, IndexError, TypeError):
+        return run_id, review_id, None, "unreadable answer"
+    if result is None:
+        return run_id, review_id, None, "answer not in the expected shape"
+    return run_id, review_id, result, None
+
+
+def _save_run_to_cache(run_id):
+    """Put a run's good results into the result cache, so later runs don't ask for them again."""
+    saved = 0
+    for results in jobs.iter_results(run_id):
+        by_id = dict(results)
+        entries = [(cache.make_cache_key(text, analysis.PROMPT_VERSION, analysis.MODEL_NAME), by_id[review_id])
+                   for page in database.iter_reviews_by_ids(list(by_id), page_size=analysis.PAGE_SIZE)
+                   for review_id, text in page]
+        cache.store_results(entries, analysis.PROMPT_VERSION, analysis.MODEL_NAME)
+        saved += len(entries)
+    return saved
+
+
+def ingest_results(paths, merge=True, accept_failures=False, save_cache=True, log_queue=None):
+    """
+    Read Batch API output files (streamed, one line at a time) into the bulk
+    runs they belong to. When a run has a good result for every review and
+    merge is True, it is merged into the saved totals. Failed reviews hold the
+    merge back so they can be exported again, unless accept_failures is True
+    (they are then counted as errors, like in a normal run). Returns a report dict with
+    counts, failure reasons (plus a sample of failed custom_ids), and for each
+    run its progress and, once merged, its totals.
+    """
+    start = time.perf_counter()
+    report = {"lines": 0, "ok": 0, "failed": 0, "failures": collections.Counter(), "failure_samples": [],
+              "ignored": 0, "runs": {}}
+    pending = collections.defaultdict(list)  # run_id -> results not written yet
+    runs = set()
+
+    def flush(run_id):
+        results = pending.pop(run_id, [])
+        if results:
+            updated = jobs.record_results(run_id, results)
+            report["ignored"] += len(results) - updated  # unknown or merged run, or already had a good result
+
+    for path in paths:
+        _log(log_queue, f"Reading {path}...")
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                report["lines"] += 1
+                run_id, review_id, result, failure = parse_result_line(line)
+                if failure:
+                    report["failed"] += 1
+                    report["failures"][failure] += 1
+                    if len(report["failure_samples"]) < FAILURE_SAMPLES:
+                        report["failure_samples"].append({"line": report["lines"], "file": path,
+                                                          "review_id": review_id, "reason": failure})
+                else:
+                    report["ok"] += 1
+                if run_id is None:
+                    continue
+                runs.add(run_id)
+                pending[run_id].append((review_id, result))
+                if len(pending[run_id]) >= INGEST_COMMIT_EVERY:
+                    flush(run_id)
+    for run_id in list(pending):
+        flush(run_id)
+
+    for run_id in sorted(runs):
+        progress = jobs.run_progress(run_id)
+        info = {"progress": progress, "merged": False}
+        report["runs"][run_id] = info
+        if not progress["total"]:
+            _log(log_queue, f"Run {run_id[:8]}: not found or already merged, its results were ignored.")
+            continue
+        if progress["pending"]:
+            _log(log_queue, f"Run {run_id[:8]}: {progress['pending']} of {progress['total']} reviews have no "
+                            f"result yet. Ingest the remaining files, or export again to resend them.")
+            continue
+        if progress["failed"] and not accept_failures:
+            _log(log_queue, f"Run {run_id[:8]}: {progress['failed']} reviews failed. Export again to retry them, "
+                            f"or ingest with --accept-failures to count them as errors.")
+            continue
+        if merge:
+            if save_cache:
+                info["cached"] = _save_run_to_cache(run_id)
+            store = jobs.merge_run(run_id, analyzer=analysis.analyzer_key(analysis.OpenAIAnalyzer))
+            info["merged"] = True
+            info["summary"] = {
+                "total_reviews": store.total_reviews,
+                "sentiments": store.sentiments(),
+                "top_positive_aspects": store.top_aspects("positive", 10),
+                "top_negative_aspects": store.top_aspects("negative", 10),
+            }
+            _log(log_queue, f"Run {run_id[:8]} merged: {store.total_reviews} reviews, {store.sentiments()}.")
+
+    report["failures"] = dict(report["failures"])
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    _log(log_queue, f"Ingested {report['lines']} results ({report['ok']} ok, {report['failed']} failed) "
+                    f"in {report['seconds']}s.")
+    return report
+
+
+class _PrintQueue:
+    """Stands in for the log queue on the command line: prints each message to stderr."""
+
+    def put(self, message):
+        sys.stderr.write(message)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze reviews offline through Batch API request/result files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write request files for every review without a result")
+    export.add_argument("--out", default=BATCH_DIR, help="folder for the request files")
+    export.add_argument("--incremental", action="store_true", help="only reviews added since the saved totals")
+    export.add_argument("--no-cache", dest="use_cache", action="store_false", help="don't fill in cached results")
+    export.add_argument("--max-requests", type=int, default=MAX_REQUESTS_PER_FILE, help="requests per file")
+    export.add_argument("--max-mb", type=float, default=MAX_BYTES_PER_FILE / 1024 / 1024, help="megabytes per file")
+    ingest = commands.add_parser("ingest", help="read result files and save the totals")
+    ingest.add_argument("files", nargs="+", help="Batch API output files (.jsonl)")
+    ingest.add_argument("--no-merge", dest="merge", action="store_false",
+                        help="record the results but don't merge the run into the saved totals yet")
+    ingest.add_argument("--accept-failures", action="store_true",
+                        help="merge even if some reviews failed, counting them as errors")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            result = export_requests(args.out, args.incremental, args.use_cache, args.max_requests,
+                                     int(args.max_mb * 1024 * 1024), _PrintQueue())
+        else:
+            result = ingest_results(args.files, args.merge, args.accept_failures, log_queue=_PrintQueue())
+    except Exception as e:
+        print(f"CRITICAL ERROR: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+#final bulk file
@@ -0,0 +1,123 @@
+import sqlite3
+import os
+import json
+import hashlib
+
+# Sidecar database for analysis results, kept next to feedback.db so the
+# review data itself is never modified by the cache.
+CACHE_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "analysis.db")
+
+# SQLite limits how many '?' placeholders one query may have
+_LOOKUP_CHUNK = 500
+
+
+def _connect():
+    """Open the cache database, creating the table the first time."""
+    conn = sqlite3.connect(CACHE_DB_PATH)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            prompt_version INTEGER NOT NULL,
+            result_json TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn
+
+
+def make_cache_key(text, prompt_version, model):
+    """
+    Hash the review text together with the prompt version and model name.
+    Changing any of the three gives a different key, so old results are
+    never reused for a new prompt or model.
+    """
+    raw = f"{prompt_version}\n{model}\n{text}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def get_cached_results(cache_keys):
+    """Return a {cache_key: analysis dict} for every key found in the cache."""
+    found = {}
+    keys = list(dict.fromkeys(cache_keys))  # drop repeats, keep order
+    if not keys:
+        return found
+
+    conn = _connect()
+    try:
+        for start in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[start:start + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT cache_key, result_json FROM analysis_cache WHERE cache_key IN ({placeholders})",
+                chunk,
+            )
+            for cache_key, result_json in rows:
+                found[cache_key] = json.loads(result_json)
+    finally:
+        conn.close()
+    return found
+
+
+def store_results(entries, prompt_version, model):
+    """
+    Save analysis results in one transaction.
+    entries is a list of (cache_key, analysis dict) pairs.
+    """
+    if not entries:
+        return
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO analysis_cache (cache_key, model, prompt_version, result_json) "
+                "VALUES (?, ?, ?, ?)",
+                [(key, model, prompt_version, json.dumps(result)) for key, result in entries],
+            )
+    finally:
+        conn.close()
+
+
+def clear_cache(model=None, prompt_version=None):
+    """
+    Invalidate cached results. With no arguments the whole cache is emptied;
+    otherwise only rows for the given model and/or prompt version are removed.
+    Returns the number of rows deleted.
+    """
+    query = "DELETE FROM analysis_cache"
+    conditions = []
+    params = []
+    if model is not None:
+        conditions.append("model = ?")
+        params.append(model)
+    if prompt_version is not None:
+        conditions.append("prompt_version = ?")
+        params.append(prompt_version)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    conn = _connect()
+    try:
+        with conn:
+            deleted = conn.execute(query, params).rowcount
+    finally:
+        conn.close()
+    return deleted
+
+
+def clear_stale_results(model, prompt_version):
+    """
+    Remove every cached result that was not made with this model and prompt
+    version (they can never be looked up again). Returns the number of rows deleted.
+    """
+    conn = _connect()
+    try:
+        with conn:
+            deleted = conn.execute(
+                "DELETE FROM analysis_cache WHERE model != ? OR prompt_version != ?", (model, prompt_version)
+            ).rowcount
+    finally:
+        conn.close()
+    return deleted
+
+#final cache file
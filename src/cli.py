@@ -0,0 +1,220 @@
+import time
+
+_START = time.perf_counter()  # before anything else is imported, for the startup report
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+
+# --- Headless command line ---
+# Runs the same pipeline as the GUI without a display, for cron jobs and CI:
+#
+#     python cli.py                                    # fetch, analyze, visualize, recommend
+#     python cli.py --stages analyze --backend local   # just the analysis, offline
+#     python cli.py --stages visualize                 # redraw the charts from the saved totals
+#     python cli.py --search battery --output -        # results JSON on stdout, progress on stderr
+#     python cli.py --stages analyze --durable         # start this in several shells to share the work
+#     python cli.py --dedupe --dedupe-threshold 0.8    # analyze each cluster of near-duplicates once
+#     python cli.py --stages fetch --clear-cache       # drop results of older prompts/models (--clear-cache all: every one)
+#
+# Progress goes to stdout and a JSON summary is written at the end. Only this
+# file's standard-library imports happen up front: the app's modules (and
+# through them openai, matplotlib, wordcloud, numpy) are imported by the stage
+# that needs them, so --help answers in milliseconds.
+
+STAGES = ("fetch", "analyze", "visualize", "recommend")
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "..", "visuals", "results.json")
+
+# Slow-to-import libraries whose loading is reported per stage
+HEAVY_MODULES = ("openai", "matplotlib", "wordcloud", "PIL", "numpy")
+
+_STDLIB_IMPORTED = time.perf_counter()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the review analysis pipeline without the GUI.")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"comma-separated stages to run, in pipeline order (default: {','.join(STAGES)})")
+    parser.add_argument("--backend", default="openai", help="analyzer: openai or local")
+    parser.add_argument("--workers", type=int, default=None, help="concurrent API requests")
+    parser.add_argument("--batch-size", type=int, default=None, help="reviews per request")
+    parser.add_argument("--incremental", action="store_true", help="only analyze reviews added since the last run")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false", help="ignore cached results")
+    parser.add_argument("--clear-cache", nargs="?", const="stale", choices=("stale", "all"),
+                        help="before running, delete cached results from other models/prompt versions "
+                             "(stale, the default) or all of them")
+    parser.add_argument("--durable", action="store_true",
+                        help="record the run in the job table: resumes after a crash, and several processes "
+                             "started with the same options share the work")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="analyze one review per cluster of near-duplicates and reuse its result for the rest "
+                             "(uses about 1.2 KB of memory per distinct review, 120 MB at most)")
+    parser.add_argument("--dedupe-threshold", type=float, default=None,
+                        help="similarity (0-1) at which two reviews count as duplicates (default 0.9)")
+    parser.add_argument("--search", help="only analyze the reviews matching this full-text search")
+    parser.add_argument("--search-mode", default="keyword", help="keyword, phrase or prefix")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT,
+                        help="where to write the results JSON ('-' for stdout; progress then goes to stderr)")
+    parser.add_argument("--quiet", action="store_true", help="don't print a line for every review")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}. Choose from: {', '.join(STAGES)}")
+    # Always run in pipeline order, whatever order they were given in
+    args.stages = [s for s in STAGES if s in stages]
+    return args
+
+
+class ProgressPrinter:
+    """Prints messages from the log queue as they arrive, on a background thread."""
+
+    def __init__(self, log_queue, stream, quiet=False):
+        self.log_queue = log_queue
+        self.stream = stream
+        self.quiet = quiet
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stop_event.is_set() or not self.log_queue.empty():
+            try:
+                msg = self.log_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if self.quiet and msg.startswith("Review "):
+                continue
+            self.stream.write(msg if msg.endswith("\n") else msg + "\n")
+            self.stream.flush()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def _timed_stage(name, results, function):
+    """Run one stage, recording its wall time and the heavy libraries it had to import."""
+    before = {m for m in HEAVY_MODULES if m in sys.modules}
+    start = time.perf_counter()
+    value = function()
+    results["stages"][name] = {
+        "seconds": round(time.perf_counter() - start, 3),
+        "imported": [m for m in HEAVY_MODULES if m in sys.modules and m not in before],
+    }
+    return value
+
+
+def run(args, log_queue):
+    """Run the selected stages and return the results dict."""
+    results = {"stages": {}, "startup": {}}
+
+    start = time.perf_counter()
+    import analysis
+    import aggregates
+    import database
+    results["startup"]["app_import_s"] = round(time.perf_counter() - start, 3)
+
+    store = None
+
+    if args.clear_cache:
+        results["cache_cleared"] = analysis.clear_result_cache(stale_only=args.clear_cache == "stale")
+        log_queue.put(f"Result cache: {results['cache_cleared']} {args.clear_cache} entries deleted.\n")
+
+    if "fetch" in args.stages:
+        def fetch():
+            fetched = {"reviews": database.count_reviews()}
+            if args.search:
+                fetched["matching"] = len(database.search_reviews(args.search, args.search_mode))
+            if args.incremental:
+                fetched["new"] = database.count_reviews(after_id=aggregates.load_store().last_review_id)
+            log_queue.put(f"Fetch: {json.dumps(fetched)}\n")
+            return fetched
+        results["fetch"] = _timed_stage("fetch", results, fetch)
+
+    if "analyze" in args.stages:
+        options = {"use_cache": args.use_cache, "incremental": args.incremental, "backend": args.backend,
+                   "batch_size": args.batch_size, "outputs": False, "durable": args.durable, "dedupe": args.dedupe}
+        if args.dedupe_threshold is not None:
+            options["dedupe_threshold"] = args.dedupe_threshold
+        if args.workers:
+            options["max_workers"] = args.workers
+        if args.search:
+            options.update(search=args.search, search_mode=args.search_mode)
+        store = _timed_stage("analyze", results,
+                             lambda: analysis.analyze_sentiment_for_all(log_queue, **options))
+        if store is None:
+            results["error"] = "analysis did not run; see the progress log"
+            return results
+
+    if store is None and ("visualize" in args.stages or "recommend" in args.stages):
+        # Later stages on their own work from the totals saved by the last full run
+        store = aggregates.load_store()
+        if not store.total_reviews:
+            results["error"] = "no saved analysis results; run the analyze stage first"
+            return results
+
+    if store is not None:
+        results["summary"] = {
+            "total_reviews": store.total_reviews,
+            "last_review_id": store.last_review_id,
+            "sentiments": store.sentiments(),
+            "top_positive_aspects": store.top_aspects("positive", 10),
+            "top_negative_aspects": store.top_aspects("negative", 10),
+        }
+
+    if "visualize" in args.stages:
+        results["visuals"] = _timed_stage("visualize", results, lambda: analysis.render_visuals(store, log_queue))
+    if "recommend" in args.stages:
+        results["recommendations"] = _timed_stage(
+            "recommend", results, lambda: analysis.write_recommendations(store, log_queue))
+
+    # API calls, tokens, cost and stage timings. They are saved as visuals/metrics.json and .prom only
+    # after an analysis; a visualize or recommend run on its own would replace them with an empty run
+    if "analyze" in args.stages:
+        analysis.write_metrics(log_queue)
+    snapshot = analysis.run_metrics.snapshot()
+    results["metrics"] = {"api": snapshot["api"], "stages": snapshot["stages"]}
+    if "dedupe" in snapshot:
+        results["dedupe"] = snapshot["dedupe"]
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    progress_stream = sys.stderr if args.output == "-" else sys.stdout
+    log_queue = queue.Queue()
+
+    with ProgressPrinter(log_queue, progress_stream, quiet=args.quiet):
+        log_queue.put(f"Stages: {', '.join(args.stages)}\n")
+        results = run(args, log_queue)
+
+    results["startup"]["stdlib_import_s"] = round(_STDLIB_IMPORTED - _START, 3)
+    results["total_s"] = round(time.perf_counter() - _START, 3)
+    results["stages_run"] = args.stages
+
+    text = json.dumps(results, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}")
+    stage_times = ", ".join(f"{name} {info['seconds']}s" for name, info in results["stages"].items())
+    print(f"Startup {results['startup'].get('app_import_s', 0) + results['startup']['stdlib_import_s']:.3f}s"
+          f"{', ' + stage_times if stage_times else ''}, total {results['total_s']}s", file=progress_stream)
+    return 1 if "error" in results else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+#final cli file
@@ -0,0 +1,103 @@
+import tkinter as tk
+from tkinter import Toplevel, ttk
+
+# --- Live results dashboard ---
+# A window that shows the results of the running analysis as they come in: a
+# sentiment bar chart (matplotlib, embedded in the window) and the most
+# mentioned positive and negative aspects. Every REFRESH_MS it takes a snapshot
+# of the run's running totals on the Tk thread (analysis.live_totals, which
+# only holds the totals' lock for a few array copies) and redraws only if the
+# numbers changed, so the analysis thread never waits on the window and the
+# first numbers show up after the first page, however big the table is.
+
+REFRESH_MS = 1000   # how often the dashboard is redrawn (at most)
+TOP_ASPECTS = 10    # rows in each aspect table
+
+
+class LiveDashboard:
+    """Opens (or raises) the dashboard window and keeps it up to date while it is open."""
+
+    def __init__(self, parent, snapshot, refresh_ms=REFRESH_MS, top_n=TOP_ASPECTS):
+        self.parent = parent
+        self.snapshot = snapshot  # callable(top_n) -> totals snapshot dict
+        self.refresh_ms = refresh_ms
+        self.top_n = top_n
+        self.window = None
+        self.shown = None         # the snapshot currently drawn
+
+    def open(self):
+        if self.window is not None and self.window.winfo_exists():
+            self.window.lift()
+            return
+        # matplotlib (and visuals' colours, with wordcloud) are only imported once the dashboard is used
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from visuals import SENTIMENT_COLORS
+        self.colors = SENTIMENT_COLORS
+
+        self.window = Toplevel(self.parent)
+        self.window.title("Live Dashboard")
+        self.window.geometry("900x650")
+
+        self.status = tk.Label(self.window, text="Waiting for results...", font=("Segoe UI", 11, "bold"))
+        self.status.pack(pady=(10, 0))
+
+        self.figure = Figure(figsize=(6, 3.2), dpi=100)
+        self.axes = self.figure.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.window)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True, padx=10)
+
+        tables = tk.Frame(self.window)
+        tables.pack(fill="both", expand=True, padx=10, pady=10)
+        self.tables = {}
+        for column, (kind, title) in enumerate((("positive", "Top Positive Aspects"),
+                                                ("negative", "Top Negative Aspects"))):
+            frame = tk.Frame(tables)
+            frame.grid(row=0, column=column, sticky="nsew", padx=5)
+            tables.columnconfigure(column, weight=1)
+            tk.Label(frame, text=title, font=("Segoe UI", 10, "bold")).pack()
+            tree = ttk.Treeview(frame, columns=("Aspect", "Mentions"), show="headings", height=self.top_n)
+            tree.heading("Aspect", text="Aspect")
+            tree.heading("Mentions", text="Mentions")
+            tree.column("Aspect", width=250)
+            tree.column("Mentions", width=80, anchor="center", stretch=False)
+            tree.pack(fill="both", expand=True)
+            self.tables[kind] = tree
+
+        self.shown = None
+        self._refresh()
+
+    def _refresh(self):
+        if self.window is None or not self.window.winfo_exists():
+            self.window = None
+            return
+        try:
+            snap = self.snapshot(self.top_n)
+            if snap != self.shown:
+                self._draw(snap)
+                self.shown = snap
+        finally:
+            self.window.after(self.refresh_ms, self._refresh)
+
+    def _draw(self, snap):
+        total = snap["total_reviews"]
+        if total:
+            self.status.config(text=f"{total} reviews analyzed (up to review {snap['last_review_id']})")
+        else:
+            self.status.config(text="Waiting for results...")
+
+        sentiments = list(snap["sentiments"])
+        counts = list(snap["sentiments"].values())
+        self.axes.clear()
+        self.axes.bar(sentiments, counts, color=[self.colors.get(s, "purple") for s in sentiments])
+        self.axes.set_title("Sentiment Distribution")
+        self.axes.set_ylabel("Count")
+        self.figure.tight_layout()
+        self.canvas.draw_idle()
+
+        for kind, tree in self.tables.items():
+            tree.delete(*tree.get_children())
+            for aspect, count in snap[f"top_{kind}_aspects"]:
+                tree.insert("", "end", values=(aspect, count))
+
+#final dashboard file
@@ -1,23 +1,204 @@
 import sqlite3
 import os
+import re
 
 # Finds the 'data' folder one level up from this 'src' folder
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "feedback.db")
 
-def fetch_reviews():
-    """Return all review text and IDs."""
+def count_reviews(after_id=0):
+    """Return how many reviews have an ID above after_id (all of them by default)."""
+    conn = sqlite3.connect(DB_PATH)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        # Fetches all reviews from the 'reviews' table
-        cursor.execute("SELECT id, review_text FROM reviews")
-        rows = cursor.fetchall()
+        return conn.execute("SELECT COUNT(*) FROM reviews WHERE id > ?", (after_id,)).fetchone()[0]
+    finally:
         conn.close()
+
+
+def estimate_review_count():
+    """
+    The highest review ID: an instant upper bound on the number of reviews
+    (exact unless rows were deleted), where count_reviews() reads the whole table.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return conn.execute("SELECT MAX(id) FROM reviews").fetchone()[0] or 0
+    finally:
+        conn.close()
+
+
+def iter_review_pages(after_id=0, page_size=500):
+    """
+    Yield the reviews with an ID above after_id as lists of (id, review_text),
+    page_size rows at a time, oldest first.
+
+    Uses keyset pagination (WHERE id > last seen id), so each page is a quick
+    index lookup and only one page is held in memory, however big the table is.
+    Errors are raised to the caller instead of being printed.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        last_id = after_id
+        while True:
+            rows = conn.execute(
+                "SELECT id, review_text FROM reviews WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, page_size),
+            ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+    finally:
+        conn.close()
+
+def fetch_review_page(after_id=None, before_id=None, limit=200, preview_chars=120):
+    """
+    Return one page of (id, preview text) rows in ID order, for the review browser.
+
+    With after_id, the page starts right after that ID (scrolling down); with
+    before_id, it ends right before that ID (scrolling up). Only the first
+    preview_chars characters of each review are read.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if before_id is not None:
+            rows = conn.execute(
+                "SELECT id, substr(review_text, 1, ?) FROM reviews WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (preview_chars, before_id, limit),
+            ).fetchall()
+            rows.reverse()
+        else:
+            rows = conn.execute(
+                "SELECT id, substr(review_text, 1, ?) FROM reviews WHERE id > ? ORDER BY id LIMIT ?",
+                (preview_chars, after_id or 0, limit),
+            ).fetchall()
         return rows
-    except sqlite3.Error as e:
-        print(f"CRITICAL: Database connection error or query failed: {e}")
-        print(f"Attempted to connect to: {DB_PATH}")
-        print("Please ensure 'data/feedback.db' exists and the table is named 'reviews'.")
-        return None # Return None to signal an error
+    finally:
+        conn.close()
+
+
+def fetch_review_text(review_id):
+    """Return the full text of one review, or None if there is no such review."""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        row = conn.execute("SELECT review_text FROM reviews WHERE id = ?", (review_id,)).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+# --- Full-text search ---
+# reviews_fts is an FTS5 index over reviews.review_text. It stores no copy of
+# the text (content='reviews') and triggers keep it in step with every
+# INSERT, UPDATE and DELETE on reviews, so searches never go stale.
+
+SEARCH_MODES = ("keyword", "phrase", "prefix")
+
+_SEARCH_OBJECTS = ("reviews_fts", "reviews_fts_insert", "reviews_fts_delete", "reviews_fts_update")
+
+# Only a change to the text itself touches the index (not, e.g., ingest.py filling in content hashes)
+FTS_UPDATE_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS reviews_fts_update AFTER UPDATE OF review_text ON reviews BEGIN
+        INSERT INTO reviews_fts (reviews_fts, rowid, review_text) VALUES ('delete', old.id, old.review_text);
+        INSERT INTO reviews_fts (rowid, review_text) VALUES (new.id, new.review_text);
+    END
+"""
+
+
+def ensure_search_index(conn):
+    """
+    Create the search index and its triggers if any of them are missing
+    (first use, or the reviews table was recreated), then fill it from reviews.
+    """
+    found = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name IN (?, ?, ?, ?)", _SEARCH_OBJECTS
+    ).fetchone()[0]
+    if found == len(_SEARCH_OBJECTS):
+        return
+    with conn:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts "
+            "USING fts5(review_text, content='reviews', content_rowid='id')"
+        )
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS reviews_fts_insert AFTER INSERT ON reviews BEGIN
+                INSERT INTO reviews_fts (rowid, review_text) VALUES (new.id, new.review_text);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS reviews_fts_delete AFTER DELETE ON reviews BEGIN
+                INSERT INTO reviews_fts (reviews_fts, rowid, review_text) VALUES ('delete', old.id, old.review_text);
+            END
+        """)
+        conn.execute(FTS_UPDATE_TRIGGER)
+        conn.execute("INSERT INTO reviews_fts (reviews_fts) VALUES ('rebuild')")
+
+
+def build_search_query(text, mode="keyword"):
+    """
+    Turn what the user typed into an FTS5 MATCH expression.
+
+    "keyword": reviews containing every word ("battery life" -> battery AND life)
+    "phrase":  reviews containing the words next to each other, in order
+    "prefix":  every word as a prefix ("batt comf" matches "battery ... comfortable")
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}'. Use one of: {', '.join(SEARCH_MODES)}.")
+    # Only words are kept, so quotes and operators in the input can't break the query
+    words = re.findall(r"\w+", text)
+    if not words:
+        raise ValueError("The search text has no words in it.")
+    if mode == "phrase":
+        return '"' + " ".join(words) + '"'
+    if mode == "prefix":
+        return " ".join(f'"{word}"*' for word in words)
+    return " ".join(f'"{word}"' for word in words)
+
+
+def search_reviews(text, mode="keyword", limit=None):
+    """Return the IDs of the reviews matching the search, best match (BM25 rank) first."""
+    query = build_search_query(text, mode)
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        ensure_search_index(conn)
+        sql = "SELECT rowid FROM reviews_fts WHERE reviews_fts MATCH ? ORDER BY rank"
+        params = (query,)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return [row[0] for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def _select_by_ids(conn, columns, review_ids, params=()):
+    """Rows for the given IDs, in the order the IDs were given (IDs not in the table are left out)."""
+    placeholders = ",".join("?" * len(review_ids))
+    rows = {row[0]: row for row in conn.execute(
+        f"SELECT id, {columns} FROM reviews WHERE id IN ({placeholders})", (*params, *review_ids))}
+    return [rows[review_id] for review_id in review_ids if review_id in rows]
+
+
+def iter_reviews_by_ids(review_ids, page_size=500):
+    """Like iter_review_pages(), but for a chosen list of review IDs (e.g. search results), in that order."""
+    page_size = min(page_size, 500)  # stay well under SQLite's limit on query parameters
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        for start in range(0, len(review_ids), page_size):
+            rows = _select_by_ids(conn, "review_text", review_ids[start:start + page_size])
+            if rows:
+                yield rows
+    finally:
+        conn.close()
+
+
+def fetch_review_previews(review_ids, preview_chars=120):
+    """(id, preview text) rows for the given IDs, in that order, for the review browser."""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        rows = []
+        for start in range(0, len(review_ids), 500):
+            rows += _select_by_ids(conn, "substr(review_text, 1, ?)", review_ids[start:start + 500], (preview_chars,))
+        return rows
+    finally:
+        conn.close()
 
 #final database py file
\ No newline at end of file
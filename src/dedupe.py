@@ -0,0 +1,219 @@
+import collections
+import hashlib
+import re
+import numpy as np  # Installed with matplotlib
+
+# --- Near-duplicate detection ---
+# Many reviews are reposts, templated complaints or copy-pasted text. Before a
+# run, find_duplicates() reads every review once and groups the duplicates:
+#
+#   1. Exact: the text is normalized (case, punctuation, spacing) and hashed;
+#      reviews with the same hash are one cluster.
+#   2. Near: each review's shingles (overlapping 5-byte pieces) are turned into a MinHash
+#      signature, and LSH (banding) finds earlier reviews that are likely to be
+#      similar. A candidate only counts if the estimated Jaccard similarity of
+#      the two reviews is at least the threshold.
+#
+# The first review of a cluster (lowest ID) is its representative. Only the
+# representative is analyzed; every other member gets the same result, so the
+# counts still cover every review.
+#
+# Memory: each distinct review costs about 1.2 KB for near-duplicate search
+# (its signature and LSH bucket entries) and about 100 bytes for exact
+# matching. Near-duplicate search only keeps the last MAX_SIGNATURES
+# representatives (about 120 MB), so a review is compared with that many
+# earlier distinct reviews, not with all of them; exact duplicates are found
+# across the whole table.
+
+DEFAULT_THRESHOLD = 0.9   # estimated Jaccard similarity needed to count as a near-duplicate
+NUM_PERM = 64             # MinHash signature length
+SHINGLE_SIZE = 5          # bytes of (UTF-8) text per shingle, at most 8
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)  # odd multiplier that spreads a packed shingle over 64 bits
+_SEED = 1                 # fixed, so every process clusters the same reviews the same way
+MAX_SIGNATURES = 100000   # representatives kept for near-duplicate search (None: no limit)
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace, so trivial edits don't hide a duplicate."""
+    text = re.sub(r"[^\w\s]", " ", (text or "").lower())
+    return " ".join(text.split())
+
+
+def lsh_params(threshold, num_perm=NUM_PERM):
+    """
+    Pick (bands, rows) with bands * rows <= num_perm so that pairs at the
+    threshold are likely to share a band: minimizes the area of false
+    positives below the threshold plus false negatives above it.
+    """
+    def area(f, lo, hi, steps=100):
+        step = (hi - lo) / steps
+        return sum(f(lo + (i + 0.5) * step) for i in range(steps)) * step
+
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            candidate = lambda s: 1 - (1 - s ** rows) ** bands
+            error = (area(candidate, 0.0, threshold) +
+                     area(lambda s: 1 - candidate(s), threshold, 1.0))
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """
+    Turns a text into a MinHash signature of num_perm 32-bit values. Each
+    "permutation" is a multiply-add-shift hash, (a * x + b) >> 32 with 64-bit
+    wraparound, which numpy computes without a slow modulo.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=_SEED):
+        if not 1 <= shingle_size <= 8:
+            raise ValueError("The shingle size must be between 1 and 8 bytes.")
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.randint(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)  # odd
+        self.b = rng.randint(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, normalized):
+        k = self.shingle_size
+        data = np.frombuffer(normalized.encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        if len(data) < k:
+            data = np.concatenate([data, np.zeros(k - len(data), dtype=np.uint64)])
+        # Pack each k-byte window into one integer (no hashing in Python), then mix it down to 32 bits
+        count = len(data) - k + 1
+        shingles = np.zeros(count, dtype=np.uint64)
+        for j in range(k):
+            shingles |= data[j:j + count] << np.uint64(8 * j)
+        hashes = (shingles * _MIX) >> np.uint64(32)
+        return ((self.a * hashes + self.b) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+class DuplicateIndex:
+    """
+    Clusters reviews as they are added, in ID order. add() returns the
+    representative's ID if the review duplicates an earlier one, else None
+    (the review becomes a representative itself).
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, max_signatures=MAX_SIGNATURES):
+        if not 0 < threshold <= 1:
+            raise ValueError("The dedupe threshold must be above 0 and at most 1.")
+        self.threshold = threshold
+        self.max_signatures = max_signatures
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.exact = {}        # hash of normalized text -> representative ID
+        self.signatures = {}   # representative ID -> signature (the last max_signatures)
+        self.recent = collections.deque()  # (representative ID, its band keys), oldest first
+        self.buckets = [collections.defaultdict(list) for _ in range(self.bands)]
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.candidates_checked = 0
+
+    def add(self, review_id, text):
+        normalized = normalize(text)
+        digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+        representative = self.exact.get(digest)
+        if representative is not None:
+            self.exact_duplicates += 1
+            return representative
+
+        signature = self.hasher.signature(normalized)
+        keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+        checked = set()
+        for bucket, key in zip(self.buckets, keys):
+            for candidate in bucket.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                    self.candidates_checked += len(checked)
+                    self.near_duplicates += 1
+                    self.exact[digest] = candidate  # the same text again is now an exact hit
+                    return candidate
+        self.candidates_checked += len(checked)
+
+        self.exact[digest] = review_id
+        self.signatures[review_id] = signature
+        for bucket, key in zip(self.buckets, keys):
+            bucket[key].append(review_id)
+        self.recent.append((review_id, keys))
+        if self.max_signatures is not None and len(self.recent) > self.max_signatures:
+            self._forget_oldest()
+        return None
+
+    def _forget_oldest(self):
+        """Drop the oldest representative from near-duplicate search (its exact hash stays)."""
+        review_id, keys = self.recent.popleft()
+        del self.signatures[review_id]
+        for bucket, key in zip(self.buckets, keys):
+            ids = bucket[key]
+            ids.remove(review_id)
+            if not ids:
+                del bucket[key]
+
+
+class DuplicateClusters:
+    """
+    The result of find_duplicates(): which reviews follow which representative.
+    Only reviews that have duplicates are stored.
+    """
+
+    def __init__(self, representative_of, stats):
+        self.representative_of = representative_of   # member ID -> representative ID
+        self.members = collections.Counter(representative_of.values())  # representative ID -> member count
+        self.stats = stats
+
+    def representative(self, review_id):
+        """The ID of the review whose result this review gets, or None if it is analyzed itself."""
+        return self.representative_of.get(review_id)
+
+    def has_members(self, review_id):
+        return review_id in self.members
+
+    def summary(self):
+        s = self.stats
+        return (f"{s['reviews']} reviews in {s['clusters']} clusters: {s['duplicates']} duplicates "
+                f"({s['exact_duplicates']} exact, {s['near_duplicates']} near) will reuse their cluster's result, "
+                f"{s['duplicate_fraction']:.1%} fewer analyses. Largest cluster: {s['largest_cluster']} reviews.")
+
+
+def find_duplicates(pages, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, top=5, max_signatures=MAX_SIGNATURES):
+    """
+    Read pages of (review_id, text) in ID order and cluster the duplicates.
+    Returns a DuplicateClusters with the member -> representative map and stats.
+    """
+    index = DuplicateIndex(threshold, num_perm, max_signatures)
+    representative_of = {}
+    reviews = 0
+    for page in pages:
+        for review_id, text in page:
+            reviews += 1
+            representative = index.add(review_id, text)
+            if representative is not None:
+                representative_of[review_id] = representative
+
+    sizes = collections.Counter(representative_of.values())
+    duplicates = len(representative_of)
+    stats = {
+        "reviews": reviews,
+        "clusters": reviews - duplicates,
+        "duplicates": duplicates,
+        "exact_duplicates": index.exact_duplicates,
+        "near_duplicates": index.near_duplicates,
+        "duplicate_fraction": round(duplicates / reviews, 4) if reviews else 0.0,
+        "clusters_with_duplicates": len(sizes),
+        "largest_cluster": max(sizes.values()) + 1 if sizes else 1,
+        "largest_clusters": [{"representative": rep, "size": n + 1} for rep, n in sizes.most_common(top)],
+        "candidates_checked": index.candidates_checked,
+        "threshold": threshold,
+        "lsh_bands": index.bands,
+        "lsh_rows": index.rows,
+        "max_signatures": max_signatures,
+    }
+    return DuplicateClusters(representative_of, stats)
+
+#final dedupe file
@@ -0,0 +1,279 @@
+import argparse
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import database
+
+# --- Bulk loading of reviews ---
+# Loads new reviews into the 'reviews' table of feedback.db from CSV or JSONL
+# files, or from stdin:
+#
+#     python ingest.py new_reviews.csv export.jsonl
+#     zcat dump.jsonl.gz | python ingest.py -                 # format is guessed from the first line
+#     python ingest.py survey.csv --column comment            # text in a column with another name
+#
+# Files are streamed: rows are read, hashed and inserted BATCH_ROWS at a time
+# (one executemany), with a commit every ROWS_PER_TRANSACTION rows, so memory
+# stays flat however big the input is. The first load adds two columns to the
+# table:
+#   content_hash  a hash of the review text, with a unique index. A review
+#                 whose text is already in the table is skipped, so loading the
+#                 same file twice adds nothing. Reviews that were in the table
+#                 before are hashed once when the columns are added (of earlier
+#                 exact duplicates only the first is hashed; the rows are kept).
+#   ingested_at   when the row was loaded (one timestamp per load, also in the
+#                 report). Rows from before the first load have none.
+# New reviews get higher IDs than every existing one, so incremental analysis
+# (which reads reviews after the last analyzed ID) picks them up as they are;
+# the report's first_id/last_id give the ID range of one load.
+
+# Rows per executemany call, and rows per transaction
+BATCH_ROWS = 10000
+ROWS_PER_TRANSACTION = 200000
+
+# Settings for the loading connection. WAL stays on for the database file,
+# which lets the app keep reading while a load is running; the rest only
+# apply to this connection.
+LOAD_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",    # with WAL, a crash can lose the last commit but never corrupts the file
+    "PRAGMA cache_size=-65536",     # 64 MB page cache, so the hash index stays in memory
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA wal_autocheckpoint=10000",
+)
+
+# Names looked for (in this order, ignoring case) when no text column is given
+TEXT_COLUMNS = ("review_text", "text", "review", "body", "content")
+
+# How many unusable input rows are listed individually in the report
+SKIP_SAMPLES = 20
+
+# Reviews can be long; the csv module's default limit is 128 KB per field
+csv.field_size_limit(2 ** 31 - 1)
+
+
+def content_hash(text):
+    """The 16-byte hash stored in content_hash for a review text (surrounding whitespace ignored)."""
+    return hashlib.blake2b(text.strip().encode("utf-8"), digest_size=16).digest()
+
+
+def ensure_ingest_schema(conn):
+    """Add the content_hash and ingested_at columns, and the content_hash index, if they are missing."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(reviews)")}
+    if not columns:
+        raise ValueError("The database has no 'reviews' table.")
+    # Made by earlier versions; nothing reads by ingested_at, so it only slowed loads down
+    conn.execute("DROP INDEX IF EXISTS reviews_by_ingested_at")
+    if {"content_hash", "ingested_at"} <= columns:
+        return
+    conn.create_function("content_hash", 1, content_hash, deterministic=True)
+    with conn:
+        if "content_hash" not in columns:
+            conn.execute("ALTER TABLE reviews ADD COLUMN content_hash BLOB")
+        if "ingested_at" not in columns:
+            conn.execute("ALTER TABLE reviews ADD COLUMN ingested_at REAL")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'reviews_fts_update'").fetchone():
+            # Older versions of this trigger re-indexed a row on any update, including the one below
+            conn.execute("DROP TRIGGER reviews_fts_update")
+            conn.execute(database.FTS_UPDATE_TRIGGER)
+        conn.execute("UPDATE reviews SET content_hash = content_hash(review_text) WHERE content_hash IS NULL")
+        conn.execute("""
+            UPDATE reviews SET content_hash = NULL
+            WHERE id NOT IN (SELECT MIN(id) FROM reviews GROUP BY content_hash)
+        """)
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS reviews_by_content_hash ON reviews (content_hash) "
+                     "WHERE content_hash IS NOT NULL")
+
+
+# --- Reading the input ---
+
+def _open_text(path):
+    if path == "-":
+        # newline="" so the csv module sees line breaks inside quoted fields as they are
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+
+def _guess_format(path, first_line):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    return "jsonl" if first_line.lstrip()[:1] in ("{", '"') else "csv"
+
+
+def _pick_column(names, column):
+    """Index of the review text column among the header names."""
+    lowered = [name.strip().lower() for name in names]
+    wanted = [column.lower()] if column else TEXT_COLUMNS
+    for name in wanted:
+        if name in lowered:
+            return lowered.index(name)
+    raise ValueError(f"No review text column in the CSV header {names}; "
+                     f"name it with --column (looked for: {', '.join(wanted)}).")
+
+
+def _csv_texts(lines, column):
+    """Yield (row number, text or None) for every data row of a CSV file with a header row."""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    index = _pick_column(header, column)
+    for row in reader:
+        if not row:
+            continue
+        yield reader.line_num, row[index] if index < len(row) else None
+
+
+def _jsonl_texts(lines, column):
+    """Yield (line number, text or None) for every line: a JSON object with a text field, or a JSON string."""
+    wanted = [column] if column else TEXT_COLUMNS
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        if isinstance(item, str):
+            yield line_number, item
+        elif isinstance(item, dict):
+            yield line_number, next((item[name] for name in wanted if isinstance(item.get(name), str)), None)
+        else:
+            yield line_number, None
+
+
+def iter_texts(path, input_format=None, column=None):
+    """
+    Yield (line number, review text) for every row of a CSV or JSONL file
+    ("-" for stdin); the text is None for a row that has no usable review.
+    input_format is "csv" or "jsonl"; by default it is guessed from the file
+    name or, failing that, from the first line.
+    """
+    with _open_text(path) as f:
+        first_line = f.readline()
+        lines = itertools.chain([first_line], f)
+        input_format = input_format or _guess_format(path, first_line)
+        if input_format == "csv":
+            yield from _csv_texts(lines, column)
+        elif input_format == "jsonl":
+            yield from _jsonl_texts(lines, column)
+        else:
+            raise ValueError(f"Unknown input format '{input_format}'. Use csv or jsonl.")
+
+
+# --- Loading ---
+
+def _log(log_queue, message):
+    if log_queue is not None:
+        log_queue.put(message + "\n")
+
+
+def ingest_files(paths, input_format=None, column=None, db_path=None, log_queue=None):
+    """
+    Load the reviews in the given files (CSV or JSONL, "-" for stdin) into the
+    reviews table, skipping texts that are already there. Returns a report
+    dict: rows read, inserted, duplicates, skipped (empty or unreadable, with
+    a sample), the ID range and ingested_at of the new reviews, and timings.
+    """
+    start = time.perf_counter()
+    ingested_at = time.time()
+    report = {"rows": 0, "inserted": 0, "duplicates": 0, "skipped": 0, "skip_samples": [],
+              "first_id": None, "last_id": None, "ingested_at": ingested_at}
+
+    conn = sqlite3.connect(db_path or database.DB_PATH, timeout=60)
+    try:
+        for pragma in LOAD_PRAGMAS:
+            conn.execute(pragma)
+        ensure_ingest_schema(conn)
+        last_id_before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM reviews").fetchone()[0]
+
+        batch = []
+        in_transaction = 0
+
+        def flush():
+            nonlocal in_transaction
+            # NOT EXISTS rather than INSERT OR IGNORE, which would use up an AUTOINCREMENT ID per duplicate
+            cursor = conn.executemany(
+                "INSERT INTO reviews (review_text, content_hash, ingested_at) SELECT ?1, ?2, ?3 "
+                "WHERE NOT EXISTS (SELECT 1 FROM reviews WHERE content_hash = ?2)", batch)
+            report["inserted"] += cursor.rowcount
+            report["duplicates"] += len(batch) - cursor.rowcount
+            in_transaction += len(batch)
+            batch.clear()
+            if in_transaction >= ROWS_PER_TRANSACTION:
+                conn.commit()
+                in_transaction = 0
+                _log(log_queue, f"{report['rows']} rows read, {report['inserted']} new reviews so far...")
+
+        for path in paths:
+            _log(log_queue, f"Reading {'stdin' if path == '-' else path}...")
+            for line_number, text in iter_texts(path, input_format, column):
+                report["rows"] += 1
+                text = text.strip() if isinstance(text, str) else ""
+                if not text:
+                    report["skipped"] += 1
+                    if len(report["skip_samples"]) < SKIP_SAMPLES:
+                        report["skip_samples"].append({"file": path, "line": line_number})
+                    continue
+                batch.append((text, content_hash(text), ingested_at))
+                if len(batch) >= BATCH_ROWS:
+                    flush()
+        if batch:
+            flush()
+        conn.commit()
+
+        if report["inserted"]:
+            report["first_id"], report["last_id"] = conn.execute(
+                "SELECT MIN(id), MAX(id) FROM reviews WHERE id > ?", (last_id_before,)).fetchone()
+        conn.execute("PRAGMA optimize")
+    finally:
+        # Anything not committed yet (an error halfway) is rolled back; earlier transactions stay
+        conn.close()
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    report["rows_per_s"] = round(report["rows"] / report["seconds"]) if report["seconds"] else None
+    _log(log_queue, f"Loaded {report['inserted']} new reviews from {report['rows']} rows "
+                    f"({report['duplicates']} already present, {report['skipped']} skipped) in {report['seconds']}s.")
+    return report
+
+
+class _PrintQueue:
+    """Stands in for the log queue on the command line: prints each message to stderr."""
+
+    def put(self, message):
+        sys.stderr.write(message)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load reviews from CSV or JSONL files into the reviews table.")
+    parser.add_argument("files", nargs="+", help="CSV or JSONL files, or - for stdin")
+    parser.add_argument("--format", dest="input_format", choices=("csv", "jsonl"),
+                        help="input format (default: from the file name or the first line)")
+    parser.add_argument("--column", help=f"column or field with the review text (default: {', '.join(TEXT_COLUMNS)})")
+    parser.add_argument("--db", help="database file (default: data/feedback.db)")
+    args = parser.parse_args(argv)
+
+    try:
+        report = ingest_files(args.files, args.input_format, args.column, args.db, _PrintQueue())
+    except Exception as e:
+        print(f"CRITICAL ERROR: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+#final ingest file
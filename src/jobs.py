@@ -0,0 +1,414 @@
+import collections
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Job tables live in the same sidecar database as the result cache
+import cache
+import database
+import aggregates
+
+# --- Durable, resumable analysis runs ---
+# A run is written to SQLite before any review is analyzed: one row per review
+# (pending / done / failed, plus its result) grouped into shards of SHARD_SIZE
+# reviews. A worker leases one shard at a time; the lease runs out after
+# LEASE_SECONDS unless the worker keeps committing results, so the shards of a
+# crashed or closed worker are picked up again by the next one. Any number of
+# workers (threads, processes, or machines sharing the file) can work on the
+# same run, because a shard is only ever handed to one live lease. When every
+# shard is done, merge_run() turns the stored results into the aggregate store
+# used by the charts and the report.
+
+SHARD_SIZE = 200        # reviews per shard (one page of work for a worker)
+LEASE_SECONDS = 120     # a shard whose worker hasn't committed for this long is handed out again
+COMMIT_EVERY = 50       # results written per transaction (each commit also renews the lease)
+POLL_SECONDS = 1.0      # how often an idle worker checks on shards leased by others
+# A run merged without save_as (a search) keeps its own store this long, for
+# workers that finish late and ask for the merged result
+RUN_STORE_SECONDS = 24 * 3600
+
+# WAL lets readers and one writer work at the same time. It needs every worker
+# on the same machine (it uses shared memory); for a database file on a
+# network share, set this to "DELETE".
+JOURNAL_MODE = "WAL"
+
+
+def _connect():
+    """Open the sidecar database for job work, creating the tables the first time."""
+    # isolation_level=None: transactions are started explicitly with _transaction()
+    conn = sqlite3.connect(cache.CACHE_DB_PATH, timeout=60, isolation_level=None)
+    conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_runs (
+            run_id TEXT PRIMARY KEY,
+            run_key TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            base_after_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            merged_at REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_shards (
+            run_id TEXT NOT NULL,
+            shard INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            worker TEXT,
+            lease_expires REAL,
+            claims INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (run_id, shard)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_reviews (
+            run_id TEXT NOT NULL,
+            review_id INTEGER NOT NULL,
+            shard INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            result_json TEXT,
+            worker TEXT,
+            updated_at REAL,
+            PRIMARY KEY (run_id, review_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS job_reviews_by_shard ON job_reviews (run_id, shard, status)")
+    aggregates.create_tables(conn)
+    return conn
+
+
+@contextmanager
+def _transaction(conn):
+    """A write transaction that takes the database lock up front, so two workers can't claim the same shard."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def open_run(run_key, base_after_id=0, review_ids=None, retry_ids=()):
+    """
+    Return (run_id, created) for the unfinished run with this key, creating it
+    if there is none. A new run covers the reviews with an ID above
+    base_after_id, or exactly review_ids when given (e.g. search results).
+    retry_ids are earlier reviews added in front of those (an incremental run
+    retrying the saved totals' failed reviews; only used without review_ids).
+    Workers that call this with the same key at the same time all get the same run.
+    """
+    conn = _connect()
+    try:
+        if review_ids is None:
+            conn.execute("ATTACH DATABASE ? AS reviews_db", (database.DB_PATH,))
+        with _transaction(conn):
+            row = conn.execute(
+                "SELECT run_id FROM job_runs WHERE run_key = ? AND status = 'running' "
+                "ORDER BY created_at DESC LIMIT 1", (run_key,)
+            ).fetchone()
+            if row:
+                return row[0], False
+
+            run_id = uuid.uuid4().hex
+            total = 0
+            if retry_ids:
+                # Only the ones still in the table; a deleted review would stay pending forever
+                total = conn.execute(
+                    "INSERT INTO job_reviews (run_id, review_id, shard, status) "
+                    "SELECT ?, id, (ROW_NUMBER() OVER (ORDER BY id) - 1) / ?, 'pending' "
+                    "FROM reviews_db.reviews WHERE id IN (SELECT value FROM json_each(?))",
+                    (run_id, SHARD_SIZE, json.dumps(list(retry_ids))),
+                ).rowcount
+            first_shard = -(-total // SHARD_SIZE)
+            if review_ids is None:
+                # Shard numbers follow ID order, so each shard is a contiguous block of reviews
+                total += conn.execute(
+                    "INSERT INTO job_reviews (run_id, review_id, shard, status) "
+                    "SELECT ?, id, ? + (ROW_NUMBER() OVER (ORDER BY id) - 1) / ?, 'pending' "
+                    "FROM reviews_db.reviews WHERE id > ?",
+                    (run_id, first_shard, SHARD_SIZE, base_after_id),
+                ).rowcount
+            else:
+                total += conn.executemany(
+                    "INSERT OR IGNORE INTO job_reviews (run_id, review_id, shard, status) VALUES (?, ?, ?, 'pending')",
+                    ((run_id, review_id, i // SHARD_SIZE) for i, review_id in enumerate(review_ids)),
+                ).rowcount
+            conn.execute(
+                "INSERT INTO job_shards (run_id, shard, status) "
+                "SELECT DISTINCT run_id, shard, 'pending' FROM job_reviews WHERE run_id = ?", (run_id,)
+            )
+            conn.execute(
+                "INSERT INTO job_runs (run_id, run_key, status, total, base_after_id, source, created_at) "
+                "VALUES (?, ?, 'running', ?, ?, ?, ?)",
+                (run_id, run_key, total, base_after_id, "reviews" if review_ids is None else "ids", time.time()),
+            )
+            return run_id, True
+    finally:
+        conn.close()
+
+
+def run_progress(run_id):
+    """{"total": n, "pending": n, "done": n, "failed": n} for a run that has not been merged yet."""
+    conn = _connect()
+    try:
+        progress = {"total": 0, "pending": 0, "done": 0, "failed": 0}
+        for status, count in conn.execute(
+                "SELECT status, COUNT(*) FROM job_reviews WHERE run_id = ? GROUP BY status", (run_id,)):
+            progress[status] = count
+            progress["total"] += count
+        return progress
+    finally:
+        conn.close()
+
+
+def iter_unfinished(run_id, chunk_size=5000):
+    """Yield the IDs of a run's reviews that have no result yet (pending or failed), a list at a time, in ID order."""
+    conn = _connect()
+    try:
+        last = -1
+        while True:
+            review_ids = [row[0] for row in conn.execute(
+                "SELECT review_id FROM job_reviews WHERE run_id = ? AND review_id > ? AND status != 'done' "
+                "ORDER BY review_id LIMIT ?", (run_id, last, chunk_size))]
+            if not review_ids:
+                return
+            yield review_ids
+            last = review_ids[-1]
+    finally:
+        conn.close()
+
+
+def record_results(run_id, results, worker_id="bulk"):
+    """
+    Write (review_id, analysis or None) pairs for a run in one transaction,
+    without leasing shards (for results that come from outside a JobWorker,
+    e.g. Batch API files). A review that already has a result keeps it.
+    Returns how many reviews were updated.
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        with _transaction(conn):
+            return conn.executemany(
+                "UPDATE job_reviews SET status = ?, result_json = ?, worker = ?, updated_at = ? "
+                "WHERE run_id = ? AND review_id = ? AND status != 'done'",
+                [("done" if analysis else "failed", json.dumps(analysis) if analysis else None,
+                  worker_id, now, run_id, review_id) for review_id, analysis in results],
+            ).rowcount
+    finally:
+        conn.close()
+
+
+def iter_results(run_id, chunk_size=5000):
+    """Yield a run's finished results as lists of (review_id, analysis), in ID order."""
+    conn = _connect()
+    try:
+        last = -1
+        while True:
+            rows = conn.execute(
+                "SELECT review_id, result_json FROM job_reviews WHERE run_id = ? AND review_id > ? "
+                "AND status = 'done' ORDER BY review_id LIMIT ?", (run_id, last, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield [(review_id, json.loads(result_json)) for review_id, result_json in rows]
+            last = rows[-1][0]
+    finally:
+        conn.close()
+
+
+class JobWorker:
+    """
+    One worker's side of a run: claims shards, records results in batches,
+    and releases each shard when all of its reviews are done. Use it from a
+    single thread (the thread that reads the results).
+    """
+
+    def __init__(self, run_id, worker_id=None, lease_seconds=None, commit_every=None):
+        self.run_id = run_id
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.lease_seconds = lease_seconds or LEASE_SECONDS
+        self.commit_every = commit_every or COMMIT_EVERY
+        self.conn = _connect()
+        self.held = collections.deque()  # shards handed out by pages() and not finished yet, in order
+        self.unsaved = []
+        self.reclaimed = 0  # shards taken over from a worker whose lease ran out
+
+    def _claim(self):
+        """Lease the next free shard (or one whose lease ran out). Returns its number, or None."""
+        now = time.time()
+        with _transaction(self.conn):
+            row = self.conn.execute(
+                "SELECT shard, claims FROM job_shards WHERE run_id = ? "
+                "AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                "ORDER BY shard LIMIT 1", (self.run_id, now)
+            ).fetchone()
+            if row is None:
+                return None
+            shard, claims = row
+            self.conn.execute(
+                "UPDATE job_shards SET status = 'leased', worker = ?, lease_expires = ?, claims = claims + 1 "
+                "WHERE run_id = ? AND shard = ?",
+                (self.worker_id, now + self.lease_seconds, self.run_id, shard),
+            )
+        if claims:
+            self.reclaimed += 1
+        return shard
+
+    def pages(self):
+        """
+        Yield the pending reviews of one claimed shard at a time, as lists of
+        (id, review_text). Ends when no shard is free; see wait_for_others().
+        """
+        while True:
+            shard = self._claim()
+            if shard is None:
+                return
+            review_ids = [row[0] for row in self.conn.execute(
+                "SELECT review_id FROM job_reviews WHERE run_id = ? AND shard = ? AND status = 'pending' "
+                "ORDER BY review_id", (self.run_id, shard))]
+            self.held.append(shard)
+            # Can be empty if a crashed worker finished the reviews but not the shard
+            yield [row for page in database.iter_reviews_by_ids(review_ids) for row in page]
+
+    def record(self, review_id, analysis):
+        """Remember one review's result (None for a failure); written in batches of commit_every."""
+        self.unsaved.append((
+            "done" if analysis else "failed",
+            json.dumps(analysis) if analysis else None,
+            self.worker_id,
+            time.time(),
+            self.run_id,
+            review_id,
+        ))
+        if len(self.unsaved) >= self.commit_every:
+            self.flush()
+
+    def flush(self):
+        """Write the remembered results in one transaction and renew this worker's leases."""
+        if not self.unsaved and not self.held:
+            return
+        with _transaction(self.conn):
+            # Only pending rows are updated: if a lease ran out and another worker
+            # did the same review too, the first result stays and nothing is counted twice
+            self.conn.executemany(
+                "UPDATE job_reviews SET status = ?, result_json = ?, worker = ?, updated_at = ? "
+                "WHERE run_id = ? AND review_id = ? AND status = 'pending'",
+                self.unsaved,
+            )
+            self.conn.execute(
+                "UPDATE job_shards SET lease_expires = ? WHERE run_id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, self.run_id, self.worker_id),
+            )
+        self.unsaved = []
+
+    def page_done(self):
+        """Call after every review of the oldest page from pages() was recorded."""
+        self.flush()
+        shard = self.held.popleft()
+        with _transaction(self.conn):
+            self.conn.execute(
+                "UPDATE job_shards SET status = 'done', worker = ?, lease_expires = NULL "
+                "WHERE run_id = ? AND shard = ? AND NOT EXISTS ("
+                "    SELECT 1 FROM job_reviews WHERE run_id = ? AND shard = ? AND status = 'pending')",
+                (self.worker_id, self.run_id, shard, self.run_id, shard),
+            )
+
+    def wait_for_others(self, log_queue=None):
+        """
+        Called when pages() ran out. Waits while other workers hold the
+        remaining shards. Returns True when the whole run is done, or False
+        as soon as a shard is free again (a lease ran out), to be claimed
+        with another pages() pass.
+        """
+        logged = False
+        while True:
+            leased, free = self.conn.execute(
+                "SELECT COALESCE(SUM(status = 'leased' AND lease_expires >= ?), 0), "
+                "       COALESCE(SUM(status = 'pending' OR (status = 'leased' AND lease_expires < ?)), 0) "
+                "FROM job_shards WHERE run_id = ?", (time.time(), time.time(), self.run_id)
+            ).fetchone()
+            if free:
+                return False
+            if not leased:
+                return True
+            if log_queue is not None and not logged:
+                log_queue.put(f"Waiting for other workers to finish their last {leased} shard(s)...\n")
+                logged = True
+            time.sleep(POLL_SECONDS)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+
+def merge_run(run_id, save_as=aggregates.DEFAULT_STORE, analyzer=None):
+    """
+    Build the aggregate store from a finished run's results and save it (in
+    one transaction, so a crash mid-merge changes nothing). A run that started
+    after earlier results (incremental) is added on top of the store saved
+    under save_as (failed reviews of that store that the run analyzed again
+    are taken out of its counts first); with save_as=None nothing but the run's own store is saved
+    (e.g. for a search); that store is kept under "run:<run_id>" for
+    RUN_STORE_SECONDS and then pruned. analyzer ("name/model/vversion") is
+    recorded as the analyzer behind the saved counts. The job rows are deleted afterwards.
+    Merging a run that another worker already merged just returns the saved
+    result.
+    """
+    conn = _connect()
+    run_store = f"run:{run_id}"
+    try:
+        with _transaction(conn):
+            status, base_after_id = conn.execute(
+                "SELECT status, base_after_id FROM job_runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if status == "merged":
+                return aggregates.read_store(conn, run_store if save_as is None else save_as)
+
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM job_reviews WHERE run_id = ? AND status = 'pending'", (run_id,)
+            ).fetchone()[0]
+            if pending:
+                raise RuntimeError(f"Run {run_id} still has {pending} pending reviews.")
+
+            store = aggregates.AggregateStore()
+            if base_after_id and save_as is not None:
+                store = aggregates.read_store(conn, save_as)
+            for review_id, result_json in conn.execute(
+                    "SELECT review_id, result_json FROM job_reviews WHERE run_id = ? ORDER BY review_id", (run_id,)):
+                analysis = json.loads(result_json) if result_json else None
+                if review_id in store.failed_ids:
+                    store.forget_failures([review_id])  # retried: counted again below
+                if analysis:
+                    store.add(review_id, analysis.get("sentiment", "Error"),
+                              analysis.get("positive_aspects", []), analysis.get("negative_aspects", []))
+                else:
+                    store.add_failure(review_id)
+
+            if analyzer is not None:
+                store.analyzer = analyzer
+            if save_as is None:
+                aggregates.write_store(conn, store, run_store)
+            else:
+                aggregates.write_store(conn, store, save_as)
+            conn.execute("DELETE FROM job_reviews WHERE run_id = ?", (run_id,))
+            conn.execute("DELETE FROM job_shards WHERE run_id = ?", (run_id,))
+            conn.execute("UPDATE job_runs SET status = 'merged', merged_at = ? WHERE run_id = ?", (time.time(), run_id))
+            for (old_run_id,) in conn.execute(
+                    "SELECT run_id FROM job_runs WHERE status = 'merged' AND merged_at < ?",
+                    (time.time() - RUN_STORE_SECONDS,)).fetchall():
+                aggregates.delete_store(conn, f"run:{old_run_id}")
+        return store
+    finally:
+        conn.close()
+
+#final jobs file
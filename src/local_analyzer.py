@@ -0,0 +1,156 @@
+import re
+import numpy as np  # Installed with matplotlib
+
+# --- Fast offline analyzer ---
+# A lexicon-based engine that runs in-process with no network. It is much less
+# nuanced than the OpenAI model, but it returns the same
+# {"sentiment", "positive_aspects", "negative_aspects"} shape and handles
+# thousands of reviews per second, so it can be used for pre-screening,
+# bulk triage of big backlogs, or as a fallback when the API is unavailable.
+
+POSITIVE_WORDS = {
+    "amazing", "awesome", "beautiful", "best", "better", "brilliant", "clear", "comfortable",
+    "comfortably", "crisp", "easy", "emotional", "excellent", "excited", "fantastic", "fast",
+    "faster", "favorite", "fun", "game-changer", "good", "great", "immersive", "impressive",
+    "incredible", "instantly", "intuitive", "love", "loved", "magic", "magical", "mind-blowing",
+    "nice", "perfect", "premium", "priceless", "revolutionary", "seamless", "sharp", "smooth",
+    "smoother", "stunning", "superb", "usable", "wonderful", "wow",
+}
+
+NEGATIVE_WORDS = {
+    "annoying", "awkward", "bad", "blurry", "boring", "broken", "buggy", "claustrophobic",
+    "clunky", "disappointed", "disappointing", "embarrassed", "empty", "expensive", "gimmick",
+    "hard", "headache", "heavier", "heavy", "isolating", "lonely", "limited", "limiting", "mess",
+    "nausea", "narrow", "overpriced", "pain", "painful", "poor", "refund", "regret", "returned",
+    "slow", "sore", "stupid", "terrible", "uncomfortable", "underwhelmed", "useless", "waste",
+    "worse", "worst",
+}
+
+NEGATORS = {"not", "no", "never", "isn't", "doesn't", "don't", "didn't", "wasn't", "can't", "couldn't", "won't"}
+
+# Keyword -> aspect name. Keywords of two or three words are matched on word pairs and triples.
+ASPECT_KEYWORDS = {
+    "display": "display", "screen": "display", "resolution": "display", "visuals": "display",
+    "eye tracking": "eye tracking", "hand tracking": "hand tracking", "gestures": "hand tracking",
+    "battery": "battery life", "cord": "battery life", "cable": "battery life",
+    "weight": "weight", "heavy": "weight", "heavier": "weight", "brick": "weight",
+    "price": "price", "expensive": "price", "overpriced": "price", "cost": "price",
+    "comfort": "comfort", "comfortable": "comfort", "uncomfortable": "comfort", "strap": "comfort",
+    "band": "comfort", "fit": "comfort",
+    "apps": "apps", "app": "apps", "software": "software", "visionos": "software",
+    "passthrough": "passthrough", "fov": "field of view", "field of view": "field of view",
+    "movies": "movies", "movie": "movies", "cinema": "movies",
+    "immersive videos": "immersive video", "immersive video": "immersive video",
+    "spatial photos": "spatial photos", "spatial videos": "spatial photos",
+    "eyesight": "eyesight", "persona": "persona", "personas": "persona",
+    "typing": "typing", "keyboard": "typing",
+    "audio": "audio", "sound": "audio", "speakers": "audio",
+    "build quality": "build quality", "design": "design",
+    "performance": "performance", "games": "games", "gaming": "games",
+    "productivity": "productivity", "multitask": "productivity", "multitasking": "productivity",
+}
+
+_CLAUSE_SPLIT = re.compile(r"[.!?;\n]+|\bbut\b|\bhowever\b|\bexcept\b")
+_WORD = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+
+LOCAL_MODEL_NAME = "local-lexicon"
+LOCAL_VERSION = 1
+
+
+def _word_polarity(words, i):
+    """+1 / -1 / 0 for the word at position i, flipped if one of the two words before it is a negator."""
+    word = words[i]
+    if word in POSITIVE_WORDS:
+        polarity = 1.0
+    elif word in NEGATIVE_WORDS:
+        polarity = -1.0
+    else:
+        return 0.0
+    if any(w in NEGATORS for w in words[max(0, i - 2):i]):
+        polarity = -polarity
+    return polarity
+
+
+def analyze_texts(texts):
+    """
+    Analyze a whole list of review texts at once and return one analysis dict per text.
+
+    Every word with a sentiment is turned into a (clause number, polarity) pair;
+    the clause scores and the review scores are then summed for the whole batch in
+    two numpy bincount calls instead of review by review.
+    """
+    clause_doc = []      # clause number -> review number
+    clause_aspects = []  # clause number -> aspects mentioned in it
+    word_clause = []     # one entry per sentiment word: its clause number
+    word_polarity = []   # one entry per sentiment word: +1 / -1
+
+    for doc_index, text in enumerate(texts):
+        for clause in _CLAUSE_SPLIT.split(text.lower()):
+            words = _WORD.findall(clause)
+            if not words:
+                continue
+            clause_index = len(clause_doc)
+            clause_doc.append(doc_index)
+
+            aspects = []
+            for i, word in enumerate(words):
+                polarity = _word_polarity(words, i)
+                if polarity:
+                    word_clause.append(clause_index)
+                    word_polarity.append(polarity)
+                pair = f"{words[i - 1]} {word}" if i else None
+                triple = f"{words[i - 2]} {pair}" if i > 1 else None
+                aspect = ASPECT_KEYWORDS.get(triple) or ASPECT_KEYWORDS.get(pair) or ASPECT_KEYWORDS.get(word)
+                if aspect and aspect not in aspects:
+                    aspects.append(aspect)
+            clause_aspects.append(aspects)
+
+    clause_scores = np.bincount(
+        np.asarray(word_clause, dtype=np.int64),
+        weights=np.asarray(word_polarity, dtype=np.float64),
+        minlength=len(clause_doc),
+    )
+    doc_scores = np.bincount(
+        np.asarray(clause_doc, dtype=np.int64),
+        weights=clause_scores,
+        minlength=len(texts),
+    )
+
+    results = [{"sentiment": "Neutral", "positive_aspects": [], "negative_aspects": []} for _ in texts]
+    for doc_index, score in enumerate(doc_scores):
+        if score > 0:
+            results[doc_index]["sentiment"] = "Positive"
+        elif score < 0:
+            results[doc_index]["sentiment"] = "Negative"
+
+    # An aspect takes the tone of the clause it is mentioned in
+    for clause_index, aspects in enumerate(clause_aspects):
+        score = clause_scores[clause_index]
+        if not aspects or score == 0:
+            continue
+        result = results[clause_doc[clause_index]]
+        target = result["positive_aspects"] if score > 0 else result["negative_aspects"]
+        for aspect in aspects:
+            if aspect not in target:
+                target.append(aspect)
+
+    return results
+
+
+class LocalAnalyzer:
+    """
+    Analyzer backend that runs on the CPU with no network.
+    Has the same analyze_batch() interface as analysis.OpenAIAnalyzer.
+    """
+    name = "local"
+    model = LOCAL_MODEL_NAME
+    version = LOCAL_VERSION
+    batch_size = 1000  # big batches keep the numpy work vectorized
+    cacheable = False  # recomputing is faster than a cache lookup
+
+    def analyze_batch(self, batch, log_queue):
+        """Analyze a list of (review_id, text) pairs. Returns {review_id: analysis}."""
+        results = analyze_texts([text for _, text in batch])
+        return {review_id: result for (review_id, _), result in zip(batch, results)}
+
+#final local analyzer file
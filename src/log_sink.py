@@ -0,0 +1,94 @@
+import queue
+import re
+import time
+import tkinter as tk
+
+# --- Batched log sink for the GUI ---
+# The analysis thread can put thousands of messages per second on the log queue.
+# Instead of moving one message per tick into the text box, the sink drains
+# everything that is waiting (up to a time budget), turns it into one text
+# insert, trims the box to a fixed number of lines, and can fold the per-review
+# progress lines into one summary line per tick.
+
+# Lines kept in the log box; older lines are dropped like a ring buffer
+MAX_LOG_LINES = 2000
+# How long one tick may spend reading the queue, in seconds
+DRAIN_TIME_BUDGET = 0.03
+# With coalescing on, a tick with more progress lines than this shows a summary instead
+COALESCE_THRESHOLD = 5
+
+# "Review 12 (3/79) Positive: ..." lines sent by analysis.py for every review
+_PROGRESS_LINE = re.compile(r"^Review \d+ \((\d+)/(\d+)\)")
+
+
+class LogSink:
+    """
+    Moves messages from a queue into a (disabled) ScrolledText widget.
+    Messages listed in control_messages are not shown; they are passed to
+    on_control(msg) in order, after the text that came before them is shown.
+    """
+
+    def __init__(self, widget, control_messages=(), on_control=None, max_lines=MAX_LOG_LINES,
+                 time_budget=DRAIN_TIME_BUDGET, coalesce_progress=True):
+        self.widget = widget
+        self.control_messages = set(control_messages)
+        self.on_control = on_control
+        self.max_lines = max_lines
+        self.time_budget = time_budget
+        self.coalesce_progress = coalesce_progress
+
+    def _format(self, messages):
+        """Join one tick's messages into a single string, folding progress lines if there are many."""
+        if not self.coalesce_progress:
+            return "".join(messages)
+
+        progress = [m for m in messages if _PROGRESS_LINE.match(m)]
+        if len(progress) <= COALESCE_THRESHOLD:
+            return "".join(messages)
+
+        # The latest line is shown in full, so it isn't counted among the "more"
+        done, total = _PROGRESS_LINE.match(progress[-1]).groups()
+        summary = f"... {len(progress) - 1} more reviews analyzed ({done}/{total}). Latest: {progress[-1]}"
+        if not summary.endswith("\n"):
+            summary += "\n"
+        # Other messages (errors, cache stats, ...) are still shown, in order,
+        # with the summary where the last progress line was
+        parts = []
+        for m in messages:
+            if m is progress[-1]:
+                parts.append(summary)
+            elif not _PROGRESS_LINE.match(m):
+                parts.append(m)
+        return "".join(parts)
+
+    def _write(self, messages):
+        if not messages:
+            return
+        text = self._format(messages)
+        self.widget.config(state="normal")
+        self.widget.insert(tk.END, text)
+        line_count = int(self.widget.index("end-1c").split(".")[0])
+        if line_count > self.max_lines:
+            self.widget.delete("1.0", f"{line_count - self.max_lines + 1}.0")
+        self.widget.config(state="disabled")
+        self.widget.see(tk.END)
+
+    def drain(self, log_queue):
+        """Read everything waiting on the queue (within the time budget) and show it."""
+        deadline = time.monotonic() + self.time_budget
+        pending = []
+        while time.monotonic() < deadline:
+            try:
+                msg = log_queue.get_nowait()
+            except queue.Empty:
+                break
+            if msg in self.control_messages:
+                self._write(pending)
+                pending = []
+                if self.on_control:
+                    self.on_control(msg)
+            else:
+                pending.append(msg)
+        self._write(pending)
+
+#final log sink file
@@ -4,11 +4,10 @@ from dotenv import load_dotenv
 import threading  # For running analysis in the background
 import os         # To find image files
 import queue      # For thread-safe messages
+import importlib.util
 
-# --- Import Pillow for images ---
-try:
-    from PIL import Image, ImageTk
-except ImportError:
+# --- Check that Pillow is installed (thumbnails.py uses it for images) ---
+if importlib.util.find_spec("PIL") is None:
     print("--- CRITICAL ERROR ---")
     print("Pillow library not found. Please install it to show images:")
     print("pip install Pillow")
@@ -21,8 +20,11 @@ except ImportError:
     exit() # Exit the script
 
 # --- Import our functions ---
-from database import fetch_reviews
-from analysis import analyze_sentiment_for_all
+from analysis import analyze_sentiment_for_all, clear_result_cache, live_totals, run_metrics
+from dashboard import LiveDashboard
+from log_sink import LogSink, MAX_LOG_LINES
+from review_browser import ReviewBrowser
+from thumbnails import ThumbnailLoader
 
 # --- Load environment variables ---
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
@@ -34,13 +36,24 @@ POSITIVE_WC_PATH = os.path.join(VISUALS_DIR, "positive_aspects_wordcloud.png")
 NEGATIVE_WC_PATH = os.path.join(VISUALS_DIR, "negative_aspects_wordcloud.png")
 RECOMMENDATIONS_PATH = os.path.join(VISUALS_DIR, "recommendations.txt")
 
+# Charts in the results window: (title, image, display size)
+RESULT_CHARTS = [
+    ("Sentiment Distribution", BAR_CHART_PATH, (500, 400)),
+    ("Positive Aspects", POSITIVE_WC_PATH, (450, 225)),
+    ("Negative Aspects", NEGATIVE_WC_PATH, (450, 225)),
+]
+
 # --- Create a queue for logging ---
 log_queue = queue.Queue()
 
+# --- Log box settings ---
+COALESCE_PROGRESS = True  # fold per-review lines into one summary per tick on big runs
+STATS_REFRESH_MS = 500    # how often the stats panel is refreshed
+
 
 # --- GUI functions ---
 
-def analyze_reviews_thread(log_queue):
+def analyze_reviews_thread(log_queue, incremental=False, search=None, dedupe=False, durable=False, use_cache=True):
     """
     This function runs in the background thread.
     It calls the main analysis function.
@@ -50,8 +63,15 @@ def analyze_reviews_thread(log_queue):
     recs_btn.config(state="disabled") 
 
     try:
-        analyze_sentiment_for_all(log_queue)
-        log_queue.put("--- ANALYSIS COMPLETE ---")
+        # durable: if the window is closed mid-run, the next durable run continues from where this one stopped
+        if search:
+            text, mode = search
+            analyze_sentiment_for_all(log_queue, incremental=incremental, search=text, search_mode=mode,
+                                      durable=durable, dedupe=dedupe, use_cache=use_cache)
+        else:
+            analyze_sentiment_for_all(log_queue, incremental=incremental, durable=durable, dedupe=dedupe,
+                                      use_cache=use_cache)
+        log_queue.put("--- ANALYSIS COMPLETE ---\n")
     except Exception as e:
         log_queue.put(f"\n--- ANALYSIS FAILED ---\n{e}\n")
     finally:
@@ -60,6 +80,12 @@ def analyze_reviews_thread(log_queue):
 
 def start_analysis():
     """Starts the analysis thread."""
+    search = None
+    if search_only_var.get():
+        search = review_browser.active_search
+        if search is None:
+            messagebox.showerror("No Search", "Search for something in the review table first, or untick 'Only search matches'.")
+            return
     messagebox.showinfo(
         "Analysis Started",
         "Analysis is running in the background. See the log box in the main window for live progress."
@@ -68,29 +94,25 @@ def start_analysis():
     log_box.delete('1.0', tk.END)
     log_box.config(state="disabled")
     
-    analysis_thread = threading.Thread(target=analyze_reviews_thread, args=(log_queue,))
+    analysis_thread = threading.Thread(target=analyze_reviews_thread, args=(log_queue, incremental_var.get(), search, dedupe_var.get(), durable_var.get(), not ignore_cache_var.get()))
     analysis_thread.start()
+    if live_dashboard_var.get():
+        live_dashboard.open()
 
-def show_reviews():
-    """Load and display reviews from database."""
+def clear_old_cache():
+    """Delete cached results made with another model or prompt version (they are never used again)."""
     try:
-        reviews = fetch_reviews()
-        if reviews is None:
-             messagebox.showerror("Database Error", "Could not fetch data. Check console for details.")
-             return
+        deleted = clear_result_cache(stale_only=True)
     except Exception as e:
-        messagebox.showerror("Database Error", f"Could not fetch data:\n{e}")
+        messagebox.showerror("Error", f"Could not clear the result cache:\n{e}")
         return
+    log_queue.put(f"Result cache: {deleted} old entries deleted.\n")
+    messagebox.showinfo("Cache Cleared", f"Deleted {deleted} cached results from older prompts or models.")
 
-    if not reviews:
-        messagebox.showinfo("No Data", "No reviews found in database.")
-        return
-    
-    for item in tree.get_children():
-        tree.delete(item)
-    for r in reviews:
-        tree.insert("", "end", values=r)
-    log_queue.put(f"Loaded {len(reviews)} reviews into the table.\n")
+
+def show_reviews():
+    """Show the first page of reviews; more pages are read as the table is scrolled."""
+    review_browser.load()
 
 
 def show_results():
@@ -131,38 +153,30 @@ def show_results():
         
     scrollable_frame.bind("<Configure>", on_frame_configure)
 
-    try:
-        tk.Label(scrollable_frame, text="Sentiment Distribution", font=("Segoe UI", 14, "bold")).pack(pady=(10,0))
-        img1 = Image.open(BAR_CHART_PATH)
-        img1 = img1.resize((500, 400), Image.Resampling.LANCZOS)
-        tk_img1 = ImageTk.PhotoImage(img1)
-        
-        lbl1 = tk.Label(scrollable_frame, image=tk_img1)
-        lbl1.pack(pady=5)
-        
-        tk.Label(scrollable_frame, text="Positive Aspects", font=("Segoe UI", 14, "bold")).pack(pady=(10,0))
-        img2 = Image.open(POSITIVE_WC_PATH)
-        img2 = img2.resize((450, 225), Image.Resampling.LANCZOS)
-        tk_img2 = ImageTk.PhotoImage(img2)
-        
-        lbl2 = tk.Label(scrollable_frame, image=tk_img2)
-        lbl2.pack(pady=5)
-        
-        tk.Label(scrollable_frame, text="Negative Aspects", font=("Segoe UI", 14, "bold")).pack(pady=(10,0))
-        img3 = Image.open(NEGATIVE_WC_PATH)
-        img3 = img3.resize((450, 225), Image.Resampling.LANCZOS)
-        tk_img3 = ImageTk.PhotoImage(img3)
-        
-        lbl3 = tk.Label(scrollable_frame, image=tk_img3)
-        lbl3.pack(pady=5)
-        
-        results_window.img_ref1 = tk_img1
-        results_window.img_ref2 = tk_img2
-        results_window.img_ref3 = tk_img3
+    # Each chart starts as a blank placeholder of its final size; the images are
+    # read on a background thread (thumbnail_loader) and come from its cache
+    # when the window is opened again, so the window appears straight away
+    results_window.placeholders = []
+    for title, path, size in RESULT_CHARTS:
+        tk.Label(scrollable_frame, text=title, font=("Segoe UI", 14, "bold")).pack(pady=(10,0))
+        placeholder = tk.PhotoImage(width=size[0], height=size[1])
+        results_window.placeholders.append(placeholder)
+        label = tk.Label(scrollable_frame, image=placeholder, text="Loading...", compound="center",
+                         font=("Segoe UI", 10), bg="#f0f0f0")
+        label.pack(pady=5)
+        thumbnail_loader.get(path, size, lambda photo, label=label: show_chart(label, photo))
+
+
+def show_chart(label, photo):
+    """Put a loaded chart into its placeholder (unless the results window was closed meanwhile)."""
+    if not label.winfo_exists():
+        return
+    if photo is None:
+        label.config(text="Failed to load this image.")
+        return
+    label.config(image=photo, text="")
+    label.image = photo
 
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to load images. Is 'Pillow' installed?\n{e}")
-        results_window.destroy()
 
 def show_recommendations():
     """
@@ -201,94 +215,141 @@ def show_recommendations():
         messagebox.showerror("Error", f"Failed to read recommendations file:\n{e}")
 
 
+def handle_control_message(msg):
+    """Called by the log sink for messages that are signals, not log text."""
+    if msg == "--- ENABLE_BUTTONS ---":
+        analyze_btn.config(text="Analyze Sentiment", state="normal")
+        results_btn.config(text="Show Results", state="normal")
+        recs_btn.config(state="normal") 
+        messagebox.showinfo(
+            "Analysis Complete",
+            "Analysis is complete! You can now click 'Show Results' or 'View Recommendations'."
+        )
+
+
+def update_stats_panel():
+    """Show the running analysis' throughput, ETA, API calls and tokens (read from run_metrics, never blocks it)."""
+    try:
+        snap = run_metrics.snapshot()
+        if snap["reviews_total"]:
+            stats_label.config(text=run_metrics.status_line(snap))
+    finally:
+        root.after(STATS_REFRESH_MS, update_stats_panel)
+
+
 def process_log_queue():
     """
-    Check the queue for new messages and update the log box.
+    Move every waiting message from the queue into the log box in one update.
     """
     try:
-        msg = log_queue.get_nowait() 
-        
-        if msg == "--- ENABLE_BUTTONS ---":
-            analyze_btn.config(text="Analyze Sentiment", state="normal")
-            results_btn.config(text="Show Results", state="normal")
-            recs_btn.config(state="normal") 
-            messagebox.showinfo(
-                "Analysis Complete",
-                "Analysis is complete! You can now click 'Show Results' or 'View Recommendations'."
-            )
-        elif msg == "--- ANALYSIS COMPLETE ---":
-             log_box.config(state="normal")
-             log_box.insert(tk.END, msg + "\n")
-             log_box.config(state="disabled")
-             log_box.see(tk.END)
-        else:
-            log_box.config(state="normal")
-            log_box.insert(tk.END, msg) 
-            log_box.config(state="disabled")
-            log_box.see(tk.END)
-            
-    except queue.Empty:
-        pass
+        log_sink.drain(log_queue)
     finally:
         root.after(100, process_log_queue)
 
 
 # --- Main window setup ---
-root = tk.Tk()
-root.title("Apple Vision Pro Sentiment Analysis")
-root.geometry("800x750")
-
-style = ttk.Style()
-style.theme_use("clam") 
-style.configure("Treeview.Heading", font=("Segoe UI", 10, "bold"))
-
-title_label = tk.Label(root, text="Apple Vision Pro Customer Feedback", font=("Segoe UI", 16, "bold"))
-title_label.pack(pady=10)
-
-button_frame = tk.Frame(root)
-button_frame.pack(pady=10)
-
-load_btn = tk.Button(button_frame, text="Load Reviews", font=("Segoe UI", 10), command=show_reviews)
-load_btn.grid(row=0, column=0, padx=10, ipady=2)
-
-analyze_btn = tk.Button(button_frame, text="Analyze Sentiment", font=("Segoe UI", 10, "bold"), command=start_analysis)
-analyze_btn.grid(row=0, column=1, padx=10, ipady=2)
-
-results_btn = tk.Button(button_frame, text="Show Results", font=("Segoe UI", 10), command=show_results, state="disabled")
-results_btn.grid(row=0, column=2, padx=10, ipady=2)
-
-recs_btn = tk.Button(button_frame, text="View Recommendations", font=("Segoe UI", 10), command=show_recommendations, state="disabled")
-recs_btn.grid(row=0, column=3, padx=10, ipady=2)
-
-# --- Treeview to display reviews ---
-tree_frame = tk.Frame(root)
-tree_frame.pack(pady=10, fill="both", expand=True, padx=20)
-
-columns = ("ID", "Review")
-tree = ttk.Treeview(tree_frame, columns=columns, show="headings", height=10)
-tree.heading("ID", text="ID")
-tree.heading("Review", text="Review")
-tree.column("ID", width=50, anchor="center", stretch=False)
-tree.column("Review", width=700)
-
-scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
-tree.configure(yscrollcommand=scrollbar.set)
-scrollbar.pack(side="right", fill="y")
-tree.pack(side="left", fill="both", expand=True)
-
-# --- Live Log Box ---
-log_frame = tk.Frame(root, pady=10)
-log_frame.pack(fill="both", expand=True, padx=20)
-
-log_label = tk.Label(log_frame, text="Live Analysis Log", font=("Segoe UI", 12, "bold"))
-log_label.pack()
-
-log_box = scrolledtext.ScrolledText(log_frame, height=10, font=("Courier New", 9), state="disabled", wrap=tk.WORD)
-log_box.pack(fill="both", expand=True)
+# Guarded so worker processes (which re-import this file when they start) do not open a window
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.title("Apple Vision Pro Sentiment Analysis")
+    root.geometry("900x750")
+
+    style = ttk.Style()
+    style.theme_use("clam") 
+    style.configure("Treeview.Heading", font=("Segoe UI", 10, "bold"))
+
+    title_label = tk.Label(root, text="Apple Vision Pro Customer Feedback", font=("Segoe UI", 16, "bold"))
+    title_label.pack(pady=10)
+
+    button_frame = tk.Frame(root)
+    button_frame.pack(pady=10)
+
+    load_btn = tk.Button(button_frame, text="Load Reviews", font=("Segoe UI", 10), command=show_reviews)
+    load_btn.grid(row=0, column=0, padx=10, ipady=2)
+
+    analyze_btn = tk.Button(button_frame, text="Analyze Sentiment", font=("Segoe UI", 10, "bold"), command=start_analysis)
+    analyze_btn.grid(row=0, column=1, padx=10, ipady=2)
+
+    results_btn = tk.Button(button_frame, text="Show Results", font=("Segoe UI", 10), command=show_results, state="disabled")
+    results_btn.grid(row=0, column=2, padx=10, ipady=2)
+
+    recs_btn = tk.Button(button_frame, text="View Recommendations", font=("Segoe UI", 10), command=show_recommendations, state="disabled")
+    recs_btn.grid(row=0, column=3, padx=10, ipady=2)
+
+    # Charts and top aspects of the running analysis, updated about once a second
+    live_dashboard = LiveDashboard(root, live_totals)
+    dashboard_btn = tk.Button(button_frame, text="Live Dashboard", font=("Segoe UI", 10), command=live_dashboard.open)
+    dashboard_btn.grid(row=0, column=4, padx=10, ipady=2)
+
+    # Only analyze reviews added since the last run and merge them into the saved totals
+    incremental_var = tk.BooleanVar(value=False)
+    incremental_check = tk.Checkbutton(button_frame, text="Only new reviews", font=("Segoe UI", 9), variable=incremental_var)
+    incremental_check.grid(row=1, column=1, pady=(5, 0))
+
+    # Only analyze the reviews matching the search shown in the review table
+    search_only_var = tk.BooleanVar(value=False)
+    search_only_check = tk.Checkbutton(button_frame, text="Only search matches", font=("Segoe UI", 9), variable=search_only_var)
+    search_only_check.grid(row=1, column=2, pady=(5, 0))
+
+    # Analyze one review per group of near-duplicates and reuse its result for the others
+    # (the pre-pass uses about 1.2 KB per distinct review, 120 MB at most; see dedupe.py)
+    dedupe_var = tk.BooleanVar(value=False)
+    dedupe_check = tk.Checkbutton(button_frame, text="Skip duplicates", font=("Segoe UI", 9), variable=dedupe_var)
+    dedupe_check.grid(row=1, column=3, pady=(5, 0))
+
+    # Record the run in the job table so a run stopped halfway can be resumed (costs a row per review up front)
+    durable_var = tk.BooleanVar(value=False)
+    durable_check = tk.Checkbutton(button_frame, text="Resumable run", font=("Segoe UI", 9), variable=durable_var)
+    durable_check.grid(row=1, column=0, pady=(5, 0))
+
+    # Analyze every review again instead of reusing cached results (the new results replace them)
+    ignore_cache_var = tk.BooleanVar(value=False)
+    ignore_cache_check = tk.Checkbutton(button_frame, text="Ignore cache", font=("Segoe UI", 9), variable=ignore_cache_var)
+    ignore_cache_check.grid(row=2, column=1, pady=(5, 0))
+
+    clear_cache_btn = tk.Button(button_frame, text="Clear Old Cache", font=("Segoe UI", 9), command=clear_old_cache)
+    clear_cache_btn.grid(row=2, column=2, pady=(5, 0))
+
+    # Open the live dashboard when an analysis starts
+    live_dashboard_var = tk.BooleanVar(value=True)
+    live_dashboard_check = tk.Checkbutton(button_frame, text="Open dashboard", font=("Segoe UI", 9), variable=live_dashboard_var)
+    live_dashboard_check.grid(row=1, column=4, pady=(5, 0))
+
+    # --- Treeview to display reviews ---
+    # Pages are read in the background as the user scrolls, so large tables open instantly
+    review_browser = ReviewBrowser(root)
+    review_browser.pack(pady=10, fill="both", expand=True, padx=20)
+
+    # Loads and caches the chart images for the results window
+    thumbnail_loader = ThumbnailLoader(root)
+
+    # --- Live Log Box ---
+    log_frame = tk.Frame(root, pady=10)
+    log_frame.pack(fill="both", expand=True, padx=20)
+
+    log_label = tk.Label(log_frame, text="Live Analysis Log", font=("Segoe UI", 12, "bold"))
+    log_label.pack()
+
+    # --- Stats panel: live throughput, ETA, API calls and tokens of the current run ---
+    stats_label = tk.Label(log_frame, text="No analysis run yet.", font=("Courier New", 8), anchor="w", justify="left", wraplength=740)
+    stats_label.pack(fill="x")
+
+    log_box = scrolledtext.ScrolledText(log_frame, height=10, font=("Courier New", 9), state="disabled", wrap=tk.WORD)
+    log_box.pack(fill="both", expand=True)
+
+    # Drains the queue in batches and keeps the box at a fixed number of lines
+    log_sink = LogSink(
+        log_box,
+        control_messages=["--- ENABLE_BUTTONS ---"],
+        on_control=handle_control_message,
+        max_lines=MAX_LOG_LINES,
+        coalesce_progress=COALESCE_PROGRESS,
+    )
 
 
-# --- Start GUI ---
-root.after(100, process_log_queue) # Start the queue checker
-root.mainloop()
+    # --- Start GUI ---
+    root.after(100, process_log_queue) # Start the queue checker
+    root.after(STATS_REFRESH_MS, update_stats_panel)
+    root.mainloop()
 
 #final main file
\ No newline at end of file
@@ -0,0 +1,276 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Run metrics ---
+# One RunMetrics object collects everything about an analysis run: each API
+# call's latency (split into time queued behind the rate limits, time on the
+# network, and time backing off before retries), tokens, retries and errors,
+# how long each stage took, and how many reviews are done. It is safe to use
+# from every worker thread, cheap enough to update on every call, and its size
+# does not grow with the number of calls (latencies go into fixed histogram buckets).
+# snapshot() is read by the GUI stats panel; write() saves JSON and
+# Prometheus text files at the end of a run.
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prefix of every Prometheus metric name
+PROMETHEUS_PREFIX = "review_analysis"
+
+
+def _new_call_stats():
+    return {
+        "calls": 0, "errors": 0, "retries": 0,
+        "prompt_tokens": 0, "completion_tokens": 0,
+        "wall_seconds": 0.0, "queued_seconds": 0.0, "network_seconds": 0.0, "backoff_seconds": 0.0,
+        "buckets": [0] * (len(LATENCY_BUCKETS) + 1),  # the last bucket is +Inf
+    }
+
+
+def _percentile(buckets, fraction):
+    """Estimate a latency percentile from histogram buckets (linear within the bucket)."""
+    count = sum(buckets)
+    if not count:
+        return 0.0
+    target = fraction * count
+    seen = 0
+    lower = 0.0
+    for upper, in_bucket in zip(LATENCY_BUCKETS + (LATENCY_BUCKETS[-1] * 2,), buckets):
+        if in_bucket and seen + in_bucket >= target:
+            return lower + (upper - lower) * (target - seen) / in_bucket
+        seen += in_bucket
+        lower = upper
+    return lower
+
+
+def _format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}" if seconds >= 3600 else f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class RunMetrics:
+    """Counters, timers and a latency histogram for one run. Call reset() when a run starts."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, total_reviews=0, prices=None):
+        """
+        Start a new run. prices is (USD per million prompt tokens, USD per
+        million completion tokens) for the model, used to estimate the cost.
+        """
+        with self.lock:
+            self.started_at = time.time()
+            self.start = time.perf_counter()
+            self.total_reviews = total_reviews
+            self.reviews_done = 0
+            self.last_review_at = self.start
+            self.prices = prices
+            self.calls = {}   # kind ("review", "batch", "recommendations") -> stats
+            self.stages = {}  # stage name -> seconds
+            self.sections = {}  # extra reports, e.g. "dedupe" -> cluster stats
+            self.last_progress = time.perf_counter()
+
+    def set_total(self, total_reviews):
+        with self.lock:
+            self.total_reviews = total_reviews
+
+    # --- Recording ---
+
+    def record_call(self, kind, wall_seconds, timings, usage=None, error=False):
+        """
+        Record one API call. timings is the dict filled in by
+        RateController.call(); usage is the response's usage object, if any.
+        """
+        with self.lock:
+            stats = self.calls.setdefault(kind, _new_call_stats())
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["retries"] += max(0, timings.get("attempts", 1) - 1)
+            stats["wall_seconds"] += wall_seconds
+            stats["queued_seconds"] += timings.get("queued", 0.0)
+            stats["network_seconds"] += timings.get("network", 0.0)
+            stats["backoff_seconds"] += timings.get("backoff", 0.0)
+            if usage is not None:
+                stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+            bucket = len(LATENCY_BUCKETS)
+            for i, upper in enumerate(LATENCY_BUCKETS):
+                if wall_seconds <= upper:
+                    bucket = i
+                    break
+            stats["buckets"][bucket] += 1
+
+    def set_section(self, name, data):
+        """Add a plain dict of extra information (e.g. dedupe stats) to the snapshot under `name`."""
+        with self.lock:
+            self.sections[name] = dict(data)
+
+    def add_stage_time(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of code and add it to the named stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - start)
+
+    def timed_pages(self, name, pages):
+        """Pass a page iterator through, adding the time spent waiting for each page to the named stage."""
+        try:
+            while True:
+                start = time.perf_counter()
+                page = next(pages, None)
+                self.add_stage_time(name, time.perf_counter() - start)
+                if page is None:
+                    return
+                yield page
+        finally:
+            pages.close()
+
+    def review_done(self, count=1):
+        with self.lock:
+            self.reviews_done += count
+            self.last_review_at = time.perf_counter()
+
+    def progress_due(self, every_seconds):
+        """True at most once every every_seconds; used to throttle progress messages."""
+        with self.lock:
+            now = time.perf_counter()
+            if now - self.last_progress < every_seconds:
+                return False
+            self.last_progress = now
+            return True
+
+    # --- Reading ---
+
+    def snapshot(self):
+        """Everything recorded so far, as a plain dict (safe to call from any thread at any time)."""
+        with self.lock:
+            elapsed = time.perf_counter() - self.start
+            # Once every review is done, throughput stops at the last one (rendering etc. don't count)
+            finished = self.total_reviews and self.reviews_done >= self.total_reviews
+            rate_seconds = (self.last_review_at if finished else time.perf_counter()) - self.start
+            calls = {kind: dict(stats, buckets=list(stats["buckets"])) for kind, stats in self.calls.items()}
+            snap = {
+                "started_at": self.started_at,
+                "elapsed_seconds": round(elapsed, 3),
+                "reviews_done": self.reviews_done,
+                "reviews_total": self.total_reviews,
+                "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+                "calls": calls,
+            }
+            snap.update(self.sections)
+            prices = self.prices
+
+        rate = snap["reviews_done"] / rate_seconds if rate_seconds > 0 else 0.0
+        remaining = max(0, snap["reviews_total"] - snap["reviews_done"])
+        snap["reviews_per_second"] = round(rate, 2)
+        snap["eta_seconds"] = round(remaining / rate, 1) if rate > 0 and remaining else 0.0
+
+        totals = _new_call_stats()
+        for stats in calls.values():
+            for key, value in stats.items():
+                if key == "buckets":
+                    totals["buckets"] = [a + b for a, b in zip(totals["buckets"], value)]
+                else:
+                    totals[key] += value
+            stats["p50_seconds"] = round(_percentile(stats["buckets"], 0.50), 4)
+            stats["p95_seconds"] = round(_percentile(stats["buckets"], 0.95), 4)
+            stats["p99_seconds"] = round(_percentile(stats["buckets"], 0.99), 4)
+        snap["api"] = {
+            "calls": totals["calls"], "errors": totals["errors"], "retries": totals["retries"],
+            "prompt_tokens": totals["prompt_tokens"], "completion_tokens": totals["completion_tokens"],
+            "queued_seconds": round(totals["queued_seconds"], 3),
+            "network_seconds": round(totals["network_seconds"], 3),
+            "p50_seconds": round(_percentile(totals["buckets"], 0.50), 4),
+            "p95_seconds": round(_percentile(totals["buckets"], 0.95), 4),
+        }
+        if prices:
+            cost = (totals["prompt_tokens"] * prices[0] + totals["completion_tokens"] * prices[1]) / 1e6
+            snap["api"]["cost_usd"] = round(cost, 6)
+            snap["api"]["cost_per_review_usd"] = round(cost / snap["reviews_done"], 8) if snap["reviews_done"] else 0.0
+        return snap
+
+    def status_line(self, snap=None):
+        """One line for the log and the GUI: progress, throughput, ETA, API calls, tokens and cost."""
+        snap = snap or self.snapshot()
+        api = snap["api"]
+        line = (f"{snap['reviews_done']}/{snap['reviews_total']} reviews, {snap['reviews_per_second']:.1f}/s, "
+                f"ETA {_format_seconds(snap['eta_seconds'])} | API calls {api['calls']} "
+                f"({api['retries']} retries, {api['errors']} errors), p50 {api['p50_seconds'] * 1000:.0f} ms, "
+                f"queued {api['queued_seconds']:.1f}s / network {api['network_seconds']:.1f}s | "
+                f"tokens {api['prompt_tokens']:,} in / {api['completion_tokens']:,} out")
+        if "cost_usd" in api:
+            line += f" | ~${api['cost_usd']:.4f}"
+        return line
+
+    def to_prometheus(self, snap=None):
+        """The metrics in the Prometheus text exposition format."""
+        snap = snap or self.snapshot()
+        p = PROMETHEUS_PREFIX
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+            for labels, value in samples:
+                label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+                lines.append(f"{p}_{name}{label_text} {value}")
+
+        calls = snap["calls"]
+        metric("reviews_done", "gauge", "Reviews analyzed in this run.", [({}, snap["reviews_done"])])
+        metric("reviews_total", "gauge", "Reviews in this run.", [({}, snap["reviews_total"])])
+        metric("reviews_per_second", "gauge", "Average analysis throughput of this run.", [({}, snap["reviews_per_second"])])
+        metric("run_seconds", "gauge", "Wall time of this run so far.", [({}, snap["elapsed_seconds"])])
+        metric("stage_seconds", "gauge", "Time spent in each stage.",
+               [({"stage": name}, seconds) for name, seconds in snap["stages"].items()])
+        metric("api_calls_total", "counter", "API calls, by kind.",
+               [({"kind": kind}, s["calls"]) for kind, s in calls.items()])
+        metric("api_errors_total", "counter", "API calls that failed after every retry.",
+               [({"kind": kind}, s["errors"]) for kind, s in calls.items()])
+        metric("api_retries_total", "counter", "Retried API attempts.",
+               [({"kind": kind}, s["retries"]) for kind, s in calls.items()])
+        metric("tokens_total", "counter", "Tokens reported by the API.",
+               [({"kind": kind, "type": t}, s[f"{t}_tokens"]) for kind, s in calls.items()
+                for t in ("prompt", "completion")])
+        metric("api_time_seconds_total", "counter", "Time inside API calls, split into queueing, network and backoff.",
+               [({"kind": kind, "part": part}, round(s[f"{part}_seconds"], 6)) for kind, s in calls.items()
+                for part in ("queued", "network", "backoff")])
+
+        lines.append(f"# HELP {p}_api_latency_seconds Wall latency of API calls, including queueing and retries.")
+        lines.append(f"# TYPE {p}_api_latency_seconds histogram")
+        for kind, s in calls.items():
+            cumulative = 0
+            for upper, count in zip(LATENCY_BUCKETS + ("+Inf",), s["buckets"]):
+                cumulative += count
+                lines.append(f'{p}_api_latency_seconds_bucket{{kind="{kind}",le="{upper}"}} {cumulative}')
+            lines.append(f'{p}_api_latency_seconds_sum{{kind="{kind}"}} {round(s["wall_seconds"], 6)}')
+            lines.append(f'{p}_api_latency_seconds_count{{kind="{kind}"}} {s["calls"]}')
+
+        if "dedupe" in snap:
+            metric("duplicates", "gauge", "Reviews that reused a near-duplicate's result instead of being analyzed.",
+                   [({"match": "exact"}, snap["dedupe"]["exact_duplicates"]),
+                    ({"match": "near"}, snap["dedupe"]["near_duplicates"])])
+            metric("clusters", "gauge", "Distinct reviews after dedupe.", [({}, snap["dedupe"]["clusters"])])
+        if "cost_usd" in snap["api"]:
+            metric("cost_usd", "gauge", "Estimated API cost of this run.", [({}, snap["api"]["cost_usd"])])
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path, prometheus_path):
+        """Save the metrics as JSON and as Prometheus text."""
+        snap = self.snapshot()
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(snap, f, indent=2)
+        with open(prometheus_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus(snap))
+        return snap
+
+#final metrics file
@@ -0,0 +1,290 @@
+import argparse
+import json
+import math
+import random
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from local_analyzer import analyze_texts
+
+# --- Local stand-in for the OpenAI chat completions endpoint ---
+# Answers POST /v1/chat/completions with deterministic results (the local
+# lexicon analyzer run on the review text), after a simulated network latency.
+# It can also fail on purpose (500s and 429 rate limits), so the pipeline can
+# be benchmarked and tested without spending money on the real API.
+#
+# Point the app at it with:
+#     OPENAI_BASE_URL=http://127.0.0.1:8089/v1  OPENAI_API_KEY=mock
+#
+# It can also stand in for the Batch API, offline: answer a request file
+# written by bulk.py with the output file the Batch API would return:
+#     python mock_server.py --batch-input batches/x_0000.jsonl --batch-output results.jsonl
+
+RECOMMENDATIONS_TEXT = """Overview
+Customers like the display and the immersive content, but comfort, weight and price hold the product back.
+
+Recommendations
+- Reduce weight and improve the strap for longer sessions.
+- Extend battery life or integrate the battery pack.
+- Expand the native app library.
+
+Conclusion
+Prioritize comfort and weight in the next hardware revision.
+"""
+
+
+class MockSettings:
+    """How the mock server behaves. All times are in milliseconds."""
+
+    def __init__(self, latency_ms=50.0, latency_sigma=0.5, error_rate=0.0, rate_limit_rate=0.0,
+                 rpm_limit=0, seed=0):
+        self.latency_ms = latency_ms            # median latency of a request
+        self.latency_sigma = latency_sigma      # spread of the log-normal latency (0 = fixed)
+        self.error_rate = error_rate            # fraction of requests answered with a 500
+        self.rate_limit_rate = rate_limit_rate  # fraction of requests answered with a 429
+        self.rpm_limit = rpm_limit              # hard requests-per-minute limit (0 = none)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_times = []                 # start times inside the current minute, for rpm_limit
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0}
+
+    def next_latency(self):
+        with self.lock:
+            if self.latency_sigma <= 0:
+                return self.latency_ms / 1000
+            return self.random.lognormvariate(math.log(self.latency_ms), self.latency_sigma) / 1000
+
+    def pick_outcome(self):
+        """
+        Return (outcome, retry_after_seconds) for the next request, where outcome
+        is "ok", "error" or "rate_limited".
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            if self.rpm_limit:
+                self.request_times = [t for t in self.request_times if now - t < 60]
+                if len(self.request_times) >= self.rpm_limit:
+                    self.stats["rate_limited"] += 1
+                    # Like the real API: wait until the oldest request leaves the window
+                    return "rate_limited", 60 - (now - self.request_times[0])
+                self.request_times.append(now)
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return "rate_limited", 0.2
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return "error", None
+            self.stats["ok"] += 1
+            return "ok", None
+
+    def remaining_requests(self):
+        with self.lock:
+            if not self.rpm_limit:
+                return 10000
+            return max(0, self.rpm_limit - len(self.request_times))
+
+
+def _extract_reviews(request):
+    """
+    Pull the review text(s) back out of a request built by analysis.py: the
+    json_schema name says which kind it is, and the user message holds the
+    review (or a JSON list of {"id", "review"} for a batch).
+    Returns (list of (id, text), is_batch), or (None, False) for other requests.
+    """
+    schema_name = ((request.get("response_format") or {}).get("json_schema") or {}).get("name")
+    messages = request.get("messages") or []
+    content = messages[-1].get("content", "") if messages else ""
+    if schema_name == "review_batch_analysis":
+        return [(item["id"], item["review"]) for item in json.loads(content)], True
+    if schema_name == "review_analysis":
+        return [(None, content)], False
+    return None, False
+
+
+def build_reply(request):
+    """Return the assistant message content for a chat request."""
+    reviews, is_batch = _extract_reviews(request)
+    if reviews is None:
+        return RECOMMENDATIONS_TEXT
+    results = analyze_texts([text for _, text in reviews])
+    if is_batch:
+        return json.dumps({"results": [dict(result, id=review_id) for (review_id, _), result in zip(reviews, results)]})
+    return json.dumps(results[0])
+
+
+def completion_body(request, content):
+    """A chat completion response body, as the API returns it."""
+    messages = request.get("messages", [])
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "gpt-4o-mini"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def write_batch_results(input_path, output_path, error_rate=0.0, seed=0, chunk_size=1000):
+    """
+    Answer a Batch API input file without a network: every request line gets a
+    result line in the Batch API output format, in the same order. error_rate
+    of them (picked with seed) come back as failures instead. Reviews are
+    analyzed chunk_size at a time, so big files are answered quickly.
+    Returns {"requests": n, "errors": n}.
+    """
+    rng = random.Random(seed)
+    stats = {"requests": 0, "errors": 0}
+
+    def answer(chunk, out):
+        extracted = [_extract_reviews(item["body"])[0] for item in chunk]
+        texts = [reviews[0][1] for reviews in extracted if reviews]
+        results = iter(analyze_texts(texts)) if texts else iter(())
+        for item, reviews in zip(chunk, extracted):
+            content = json.dumps(next(results)) if reviews else RECOMMENDATIONS_TEXT
+            line = {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": item["custom_id"]}
+            if rng.random() < error_rate:
+                stats["errors"] += 1
+                line.update(response=None, error={"code": "server_error", "message": "Internal server error (mock)."})
+            else:
+                line.update(response={"status_code": 200, "request_id": uuid.uuid4().hex,
+                                      "body": completion_body(item["body"], content)}, error=None)
+            out.write(json.dumps(line) + "\n")
+
+    with open(input_path, "r", encoding="utf-8") as f, open(output_path, "w", encoding="utf-8") as out:
+        chunk = []
+        for line in f:
+            if line.strip():
+                chunk.append(json.loads(line))
+                stats["requests"] += 1
+            if len(chunk) >= chunk_size:
+                answer(chunk, out)
+                chunk = []
+        if chunk:
+            answer(chunk, out)
+    return stats
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    settings = MockSettings()
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; without this, Nagle's algorithm
+        # adds ~40 ms to every keep-alive response and swamps the simulated latency
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        all_headers = {
+            "Content-Type": "application/json",
+            "Content-Length": str(len(body)),
+            "x-ratelimit-limit-requests": str(self.settings.rpm_limit or 10000),
+            "x-ratelimit-remaining-requests": str(self.settings.remaining_requests()),
+            "x-ratelimit-reset-requests": "1s",
+        }
+        all_headers.update(headers or {})
+        for name, value in all_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        time.sleep(self.settings.next_latency())
+        outcome, retry_after = self.settings.pick_outcome()
+        if outcome == "rate_limited":
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (mock).", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                headers={
+                    "retry-after-ms": str(int(retry_after * 1000)),
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": f"{retry_after:.3f}s",
+                },
+            )
+            return
+        if outcome == "error":
+            self._send_json(500, {"error": {"message": "Internal server error (mock).", "type": "server_error"}})
+            return
+
+        content = build_reply(request)
+        self._send_json(200, completion_body(request, content))
+
+
+def start_server(settings=None, host="127.0.0.1", port=0):
+    """
+    Start the mock server in a background thread and return it.
+    Use port=0 to pick a free port; the URL to use as OPENAI_BASE_URL is
+    f"http://{host}:{server.server_address[1]}/v1". Call server.shutdown() to stop it.
+    """
+    handler = type("ConfiguredHandler", (MockOpenAIHandler,), {"settings": settings or MockSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089, help="0 picks a free port")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="median latency per request")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread of the latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that return a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests that return a 429")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="requests per minute before 429s (0 = no limit)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-input", help="answer this Batch API request file instead of starting the server")
+    parser.add_argument("--batch-output", help="where to write the Batch API results for --batch-input")
+    args = parser.parse_args()
+
+    if args.batch_input:
+        if not args.batch_output:
+            parser.error("--batch-input needs --batch-output")
+        stats = write_batch_results(args.batch_input, args.batch_output, args.error_rate, args.seed)
+        print(f"Wrote {stats['requests']} results ({stats['errors']} failed) to {args.batch_output}")
+        return
+
+    settings = MockSettings(args.latency_ms, args.latency_sigma, args.error_rate, args.rate_limit_rate,
+                            args.rpm_limit, args.seed)
+    server = start_server(settings, args.host, args.port)
+    # The first line is read by benchmark.py to find the port
+    print(f"Mock OpenAI server listening on http://{args.host}:{server.server_address[1]}/v1", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Stopped. Stats: {settings.stats}")
+
+
+if __name__ == "__main__":
+    main()
+
+#final mock server file
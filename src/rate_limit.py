@@ -0,0 +1,243 @@
+import random
+import re
+import threading
+import time
+
+# --- Rate control for API calls ---
+# Keeps requests inside the requests-per-minute and tokens-per-minute budgets,
+# retries transient failures (429s, 5xx, timeouts) with jittered exponential
+# backoff, and lowers/raises the number of requests in flight as throttling
+# appears and goes away (additive increase, multiplicative decrease).
+
+
+class TokenBucket:
+    """
+    A bucket that refills at rate_per_minute and holds at most `capacity` tokens.
+    acquire() blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0  # tokens per second
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)  # a huge request still goes through eventually
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def limit_to(self, remaining):
+        """Never hold more tokens than the server says are left."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, float(remaining))
+
+
+def parse_reset_time(value):
+    """
+    Turn a rate-limit reset header into seconds.
+    Handles "20ms", "1s", "6m0s", "1h2m3.5s" and plain numbers of seconds.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    found = False
+    for number, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        found = True
+        total += float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if found else None
+
+
+def is_transient_error(error):
+    """True for errors worth retrying: rate limits, server errors, timeouts and dropped connections."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    try:
+        import openai
+        if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+            return True
+    except ImportError:
+        pass
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def _headers_of(obj):
+    """Response headers from a raw response or from an API error, if there are any."""
+    headers = getattr(obj, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(obj, "response", None), "headers", None)
+    return headers or {}
+
+
+class RateController:
+    """
+    Shared by every worker thread. Wrap each API call in call() and the
+    controller decides when it may start and whether to retry it.
+    """
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=200_000, max_concurrency=8,
+                 min_concurrency=1, max_retries=5, base_delay=0.5, max_delay=60.0, decrease_cooldown=1.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)  # current limit, moved up and down by AIMD
+        self.in_flight = 0
+        self.paused_until = 0.0  # set from retry-after / reset headers
+        # Several requests usually hit the same limit together; they count as one signal
+        self.decrease_cooldown = decrease_cooldown
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0}
+
+    def set_budgets(self, requests_per_minute, tokens_per_minute):
+        """Replace the requests/tokens per minute budgets."""
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def set_max_concurrency(self, max_concurrency):
+        """Change the upper limit (e.g. to the number of worker threads) and start from it."""
+        with self.condition:
+            self.max_concurrency = max(self.min_concurrency, int(max_concurrency))
+            self.concurrency = float(self.max_concurrency)
+            self.condition.notify_all()
+
+    # --- Concurrency slots ---
+
+    def _acquire_slot(self):
+        with self.condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.concurrency):
+                    self.in_flight += 1
+                    return
+                self.condition.wait(timeout=wait if wait > 0 else 0.5)
+
+    def _release_slot(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    # --- Feedback from responses ---
+
+    def _on_success(self, headers):
+        with self.condition:
+            if self.concurrency < self.max_concurrency:
+                # Additive increase: about +1 slot after `concurrency` good calls in a row
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+                self.condition.notify_all()
+        self._read_headers(headers)
+
+    def _on_throttled(self, headers, log_queue):
+        with self.condition:
+            old = int(self.concurrency)
+            self.stats["throttled"] += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= self.decrease_cooldown:
+                # Multiplicative decrease
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                self.last_decrease = now
+            new = int(self.concurrency)
+        if log_queue is not None and new < old:
+            log_queue.put(f"Rate limited by the API, lowering concurrency to {new}.\n")
+        return self._read_headers(headers)
+
+    def _read_headers(self, headers):
+        """Sync the buckets with the server's rate-limit headers. Returns a retry delay, if one was given."""
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_requests is not None:
+            self.requests.limit_to(float(remaining_requests))
+        if remaining_tokens is not None:
+            self.tokens.limit_to(float(remaining_tokens))
+
+        retry_after = None
+        if headers.get("retry-after-ms") is not None:
+            retry_after = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after") is not None:
+            retry_after = parse_reset_time(headers["retry-after"])
+        elif remaining_requests is not None and float(remaining_requests) <= 0:
+            retry_after = parse_reset_time(headers.get("x-ratelimit-reset-requests"))
+        elif remaining_tokens is not None and float(remaining_tokens) <= 0:
+            retry_after = parse_reset_time(headers.get("x-ratelimit-reset-tokens"))
+
+        if retry_after:
+            with self.condition:
+                self.paused_until = max(self.paused_until, time.monotonic() + min(retry_after, self.max_delay))
+        return retry_after
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff: a random delay up to base * 2^attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    # --- The wrapper ---
+
+    def call(self, request, estimated_tokens=1, log_queue=None, timings=None):
+        """
+        Run request() (an API call) inside the budgets, retrying transient errors.
+        The last error is raised if every attempt fails.
+
+        If a timings dict is given, it is filled in (also when the call fails) with
+        "queued" (seconds waiting for the budgets and a free slot), "network"
+        (seconds inside request()), "backoff" (seconds sleeping between attempts)
+        and "attempts".
+        """
+        if timings is None:
+            timings = {}
+        timings.update(queued=0.0, network=0.0, backoff=0.0, attempts=0)
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            self.requests.acquire(1)
+            self.tokens.acquire(estimated_tokens)
+            self._acquire_slot()
+            sent = time.perf_counter()
+            timings["queued"] += sent - start
+            timings["attempts"] += 1
+            try:
+                with self.condition:
+                    self.stats["calls"] += 1
+                response = request()
+            except Exception as e:
+                timings["network"] += time.perf_counter() - sent
+                self._release_slot()
+                if not is_transient_error(e) or attempt == self.max_retries:
+                    with self.condition:
+                        self.stats["failed"] += 1
+                    raise
+                retry_after = None
+                if getattr(e, "status_code", None) == 429:
+                    retry_after = self._on_throttled(_headers_of(e), log_queue)
+                delay = max(retry_after or 0, self._backoff(attempt))
+                with self.condition:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+                timings["backoff"] += delay
+                continue
+            timings["network"] += time.perf_counter() - sent
+            self._release_slot()
+            self._on_success(_headers_of(response))
+            return response
+
+#final rate limit file
@@ -0,0 +1,290 @@
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+import database
+
+# --- Virtualized review browser ---
+# Shows the reviews table without loading all of it: pages of short previews
+# are read from SQLite as the user scrolls, only a few pages are kept in the
+# Treeview at once, and the full text of a review is loaded when it is
+# selected. All database reads happen on a background thread, so the window
+# never freezes, and the first page appears just as fast for 100 or 10 million rows:
+# it is read first, the total is estimated from the highest ID, and the exact
+# COUNT(*), which reads the whole table, runs on its own thread afterwards.
+# The search bar switches the table to the reviews matching a full-text search
+# (database.search_reviews), best match first, paged the same way.
+
+PAGE_SIZE = 200         # rows read per page
+MAX_LOADED_PAGES = 3    # pages kept in the Treeview; pages scrolled far away are dropped
+PREVIEW_CHARS = 120     # characters of each review shown in the table
+POLL_MS = 50            # how often results from the reader thread are picked up
+EDGE = 0.1              # load more when the view is this close to the top/bottom
+
+
+class ReviewBrowser:
+    """A Treeview of reviews, a status line, and a box with the full text of the selected review."""
+
+    def __init__(self, parent):
+        self.frame = tk.Frame(parent)
+
+        search_frame = tk.Frame(self.frame)
+        search_frame.pack(fill="x", pady=(0, 5))
+        tk.Label(search_frame, text="Search:", font=("Segoe UI", 9)).pack(side="left")
+        self.search_entry = tk.Entry(search_frame, font=("Segoe UI", 9))
+        self.search_entry.pack(side="left", fill="x", expand=True, padx=5)
+        self.search_entry.bind("<Return>", lambda event: self.search())
+        self.search_mode = ttk.Combobox(search_frame, values=database.SEARCH_MODES, state="readonly", width=8)
+        self.search_mode.set(database.SEARCH_MODES[0])
+        self.search_mode.pack(side="left")
+        tk.Button(search_frame, text="Search", font=("Segoe UI", 9), command=self.search).pack(side="left", padx=5)
+        tk.Button(search_frame, text="Clear", font=("Segoe UI", 9), command=self.load).pack(side="left")
+
+        table_frame = tk.Frame(self.frame)
+        table_frame.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=("ID", "Review"), show="headings", height=10)
+        self.tree.heading("ID", text="ID")
+        self.tree.heading("Review", text="Review")
+        self.tree.column("ID", width=50, anchor="center", stretch=False)
+        self.tree.column("Review", width=700)
+        self.scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+
+        self.status = tk.Label(self.frame, text="Click 'Load Reviews' to browse the reviews.", anchor="w", font=("Segoe UI", 9))
+        self.status.pack(fill="x")
+        self.detail = tk.Text(self.frame, height=3, wrap=tk.WORD, font=("Segoe UI", 9), state="disabled")
+        self.detail.pack(fill="x")
+
+        self.total = None
+        self.total_exact = False  # False while self.total is only the estimate
+        self.loading = False
+        self.at_start = True    # no rows before the first loaded one
+        self.at_end = False     # no rows after the last loaded one
+        self.generation = 0     # bumped by load()/search(), so answers for an old load are ignored
+        # (text, mode) while search results are shown, else None; read by main.py for "Only search matches"
+        self.active_search = None
+        self.search_ids = None  # ranked IDs of the current search
+        self.search_positions = {}  # iid -> position in search_ids
+
+        # Requests go to the reader thread; answers come back on `results`
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        threading.Thread(target=self._reader, daemon=True).start()
+        self.frame.after(POLL_MS, self._poll)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    # --- Background reader thread (no Tk calls here) ---
+
+    def _reader(self):
+        while True:
+            generation, kind, arg = self.requests.get()
+            try:
+                if kind == "estimate":
+                    result = database.estimate_review_count()
+                elif kind == "search":
+                    result = database.search_reviews(*arg)
+                elif isinstance(arg, list):  # a page of search results, by ID
+                    result = database.fetch_review_previews(arg, preview_chars=PREVIEW_CHARS)
+                elif kind == "down":
+                    result = database.fetch_review_page(after_id=arg, limit=PAGE_SIZE, preview_chars=PREVIEW_CHARS)
+                elif kind == "up":
+                    result = database.fetch_review_page(before_id=arg, limit=PAGE_SIZE, preview_chars=PREVIEW_CHARS)
+                else:  # "text"
+                    result = (arg, database.fetch_review_text(arg))
+                self.results.put((generation, kind, result, None))
+            except Exception as e:
+                self.results.put((generation, kind, None, e))
+
+    def _count(self, generation):
+        """Runs on its own thread, so the full-table count never holds up a page."""
+        try:
+            self.results.put((generation, "count", database.count_reviews(), None))
+        except Exception:
+            pass  # the estimate stays
+
+    # --- Main thread ---
+
+    def _reset(self):
+        self.generation += 1
+        self.tree.delete(*self.tree.get_children())
+        self._show_detail("")
+        self.total = None
+        self.total_exact = False
+        self.at_start = True
+        self.at_end = False
+        self.loading = True
+        self.active_search = None
+        self.search_ids = None
+        self.search_positions = {}
+
+    def load(self):
+        """(Re)load every review, from the first one."""
+        self._reset()
+        self.search_entry.delete(0, tk.END)
+        self.status.config(text="Loading reviews...")
+        # First page first; the total is estimated after it, then counted (see _handle)
+        self.requests.put((self.generation, "down", 0))
+        self.requests.put((self.generation, "estimate", None))
+
+    def search(self):
+        """Show only the reviews matching the search box, best match first."""
+        text = self.search_entry.get().strip()
+        if not text:
+            self.load()
+            return
+        self._reset()
+        self.active_search = (text, self.search_mode.get())
+        self.status.config(text=f"Searching for '{text}'...")
+        self.requests.put((self.generation, "search", self.active_search))
+
+    def _request_page(self, direction):
+        """Ask the reader thread for the page below ("down") or above ("up") the loaded rows."""
+        self.loading = True
+        children = self.tree.get_children()
+        if self.search_ids is None:
+            cursor = int(children[-1] if direction == "down" else children[0]) if children else 0
+            self.requests.put((self.generation, direction, cursor))
+        elif direction == "down":
+            start = self.search_positions[children[-1]] + 1 if children else 0
+            self.requests.put((self.generation, direction, self.search_ids[start:start + PAGE_SIZE]))
+        else:
+            end = self.search_positions[children[0]]
+            self.requests.put((self.generation, direction, self.search_ids[max(0, end - PAGE_SIZE):end]))
+
+    def _poll(self):
+        try:
+            while True:
+                self._handle(*self.results.get_nowait())
+        except queue.Empty:
+            pass
+        self.frame.after(POLL_MS, self._poll)
+
+    def _handle(self, generation, kind, result, error):
+        if generation != self.generation:
+            return  # answer for a load that was replaced
+        if error is not None:
+            self.loading = False
+            self.status.config(text=f"Could not load reviews: {error}")
+            return
+
+        if kind == "count":
+            self.total, self.total_exact = result, True
+        elif kind == "estimate":
+            self.total = result
+            # The first page is in (the reader answers in order), so now the full count can run
+            threading.Thread(target=self._count, args=(generation,), daemon=True).start()
+        elif kind == "search":
+            self.search_ids = result
+            self.search_positions = {str(review_id): i for i, review_id in enumerate(result)}
+            self.total, self.total_exact = len(result), True
+            if not result:
+                self.loading = False
+                self.status.config(text=f"No reviews match '{self.active_search[0]}'.")
+                return
+            self._request_page("down")
+            return
+        elif kind == "text":
+            review_id, text = result
+            selection = self.tree.selection()
+            if selection and selection[0] == str(review_id):
+                self._show_detail(text or "")
+        elif kind == "down":
+            self.loading = False
+            if len(result) < PAGE_SIZE:
+                self.at_end = True
+            if result:
+                self._keep_view(lambda: self._add_rows(result, at_top=False))
+            elif not self.tree.get_children():
+                self.status.config(text="No reviews found in database.")
+                return
+        elif kind == "up":
+            self.loading = False
+            if len(result) < PAGE_SIZE:
+                self.at_start = True
+            if result:
+                self._keep_view(lambda: self._add_rows(result, at_top=True))
+        if self.search_ids is not None and kind in ("down", "up"):
+            # With search results the list's own ends are the ends
+            children = self.tree.get_children()
+            self.at_start = not children or self.search_positions[children[0]] == 0
+            self.at_end = not children or self.search_positions[children[-1]] == len(self.search_ids) - 1
+        self._update_status()
+
+    def _add_rows(self, rows, at_top):
+        """Insert a page, then drop pages from the other end if too many are loaded."""
+        for offset, (review_id, preview) in enumerate(rows):
+            preview = preview.replace("\n", " ")
+            if len(preview) >= PREVIEW_CHARS:
+                preview = preview[:PREVIEW_CHARS - 3] + "..."
+            self.tree.insert("", offset if at_top else "end", iid=str(review_id), values=(review_id, preview))
+
+        children = self.tree.get_children()
+        extra = len(children) - PAGE_SIZE * MAX_LOADED_PAGES
+        if extra > 0:
+            if at_top:
+                self.tree.delete(*children[-extra:])
+                self.at_end = False
+            else:
+                self.tree.delete(*children[:extra])
+                self.at_start = False
+
+    def _keep_view(self, change):
+        """Apply a change to the rows without moving the rows the user is looking at."""
+        children = self.tree.get_children()
+        anchor = None
+        if children:
+            top = self.tree.yview()[0]
+            anchor = children[min(len(children) - 1, int(top * len(children)))]
+        change()
+        children = self.tree.get_children()
+        if anchor is not None and self.tree.exists(anchor) and children:
+            self.tree.yview_moveto(self.tree.index(anchor) / len(children))
+
+    def _on_scroll(self, first, last):
+        """Called by the Treeview whenever the view moves; loads the next page near an edge."""
+        self.scrollbar.set(first, last)
+        if self.loading:
+            return
+        children = self.tree.get_children()
+        if not children:
+            return
+        if float(last) > 1 - EDGE and not self.at_end:
+            self._request_page("down")
+        elif float(first) < EDGE and not self.at_start:
+            self._request_page("up")
+
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        self._show_detail("Loading full review...")
+        self.requests.put((self.generation, "text", int(selection[0])))
+
+    def _show_detail(self, text):
+        self.detail.config(state="normal")
+        self.detail.delete("1.0", tk.END)
+        self.detail.insert(tk.END, text)
+        self.detail.config(state="disabled")
+
+    def _update_status(self):
+        children = self.tree.get_children()
+        if not children:
+            return
+        if self.total is None:
+            total = "?"
+        else:
+            total = f"{self.total:,}" if self.total_exact else f"about {self.total:,}"
+        if self.search_ids is not None:
+            first = self.search_positions[children[0]] + 1
+            last = self.search_positions[children[-1]] + 1
+            self.status.config(text=f"Showing matches {first}-{last} of {total} for '{self.active_search[0]}', best first")
+        else:
+            self.status.config(text=f"Showing reviews {children[0]}-{children[-1]} of {total} (scroll for more, select a row for the full text)")
+
+#final review browser file
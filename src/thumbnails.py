@@ -0,0 +1,123 @@
+import os
+import queue
+import threading
+from PIL import Image  # ImageTk (which needs tkinter) is imported by the loader, so visuals.py works headless
+
+# --- Chart thumbnails ---
+# visuals.py saves a display-sized copy of every chart next to it
+# (sentiment_chart.png -> sentiment_chart.thumb.png) when it draws it, so the
+# results window doesn't have to shrink full-size images. ThumbnailLoader reads
+# and decodes them on a background thread and keeps the decoded PhotoImages,
+# keyed by the file's modification time: reopening the window shows them at
+# once, and a redrawn chart is picked up automatically.
+
+THUMBNAIL_SUFFIX = ".thumb.png"
+POLL_MS = 50  # how often decoded images are picked up from the loader thread
+
+
+def thumbnail_path(path):
+    """Where the thumbnail of the image at path is saved."""
+    return os.path.splitext(path)[0] + THUMBNAIL_SUFFIX
+
+
+def write_thumbnail(path, size):
+    """Save a copy of the image at path, resized to size (width, height), as its thumbnail."""
+    target = thumbnail_path(path)
+    with Image.open(path) as image:
+        small = image.resize(size, Image.Resampling.LANCZOS)
+    # Written under a temporary name and swapped in, so a reader never sees half a file
+    small.save(target + ".tmp", format="PNG")
+    os.replace(target + ".tmp", target)
+    return target
+
+
+class ThumbnailLoader:
+    """
+    Loads images for Tk labels without blocking the event loop. Files are
+    read, decoded and (if needed) resized on a background thread; only the
+    PhotoImage is made on the Tk thread, as Tk requires.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget     # any widget, used to schedule polling on the Tk thread
+        self.cache = {}          # (image path, size) -> ((file read, its mtime), PhotoImage)
+        self.waiting = {}        # (image path, size) -> callbacks waiting for it
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.polling = False
+        threading.Thread(target=self._reader, daemon=True).start()
+
+    def _source(self, path):
+        """The file to read for path (its thumbnail, unless that is missing or older) and its mtime."""
+        thumbnail = thumbnail_path(path)
+        try:
+            image_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            image_mtime = None
+        try:
+            thumbnail_mtime = os.stat(thumbnail).st_mtime_ns
+            if image_mtime is None or thumbnail_mtime >= image_mtime:
+                return thumbnail, thumbnail_mtime
+        except OSError:
+            pass
+        return path, image_mtime
+
+    def get(self, path, size, callback):
+        """
+        Call callback(photo) with the image at path, shown at size (width,
+        height): right away if it is cached and the file hasn't changed, or
+        once it has been loaded in the background. photo is None if the file
+        could not be read. Returns True if the image came from the cache.
+        """
+        item = (path, tuple(size))
+        key = self._source(path)
+        cached = self.cache.get(item)
+        if cached and cached[0] == key:
+            callback(cached[1])
+            return True
+        callbacks = self.waiting.setdefault(item, [])
+        callbacks.append(callback)
+        if len(callbacks) == 1:
+            self.requests.put((item, key))
+        if not self.polling:
+            self.polling = True
+            self.widget.after(POLL_MS, self._poll)
+        return False
+
+    # --- Background thread (no Tk calls here) ---
+
+    def _reader(self):
+        while True:
+            item, key = self.requests.get()
+            size = item[1]
+            try:
+                with Image.open(key[0]) as image:
+                    image.load()
+                    if image.size != tuple(size):
+                        image = image.resize(size, Image.Resampling.LANCZOS)
+                    else:
+                        image = image.copy()
+                self.results.put((item, key, image))
+            except Exception:
+                self.results.put((item, key, None))
+
+    # --- Tk thread ---
+
+    def _poll(self):
+        from PIL import ImageTk
+        try:
+            while True:
+                item, key, image = self.results.get_nowait()
+                photo = ImageTk.PhotoImage(image) if image is not None else None
+                if photo is not None:
+                    self.cache[item] = (key, photo)
+                for callback in self.waiting.pop(item, []):
+                    callback(photo)
+        except queue.Empty:
+            pass
+        if self.waiting:
+            self.widget.after(POLL_MS, self._poll)
+        else:
+            self.polling = False
+
+#final thumbnails file
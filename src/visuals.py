@@ -1,7 +1,14 @@
 import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use("Agg")  # Non-interactive backend: safe in worker processes and background threads
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
 import collections  # Built-in counter, no install needed
+from thumbnails import thumbnail_path, write_thumbnail
 
 # Finds the 'visuals' folder one level up from this 'src' folder
 VISUALS_DIR = os.path.join(os.path.dirname(__file__), "..", "visuals")
@@ -12,35 +19,59 @@ try:
 except OSError as e:
     print(f"Error creating visuals directory: {e}")
 
-def generate_barchart(sentiment_list):
-    """Create a bar chart of sentiment counts from a list."""
+# Output file names
+BAR_CHART_FILE = "sentiment_chart.png"
+POSITIVE_WC_FILE = "positive_aspects_wordcloud.png"
+NEGATIVE_WC_FILE = "negative_aspects_wordcloud.png"
+
+# Display size of each image in the results window; a thumbnail this size is
+# saved next to every image that is drawn (see thumbnails.py)
+THUMBNAIL_SIZES = {BAR_CHART_FILE: (500, 400), POSITIVE_WC_FILE: (450, 225), NEGATIVE_WC_FILE: (450, 225)}
+
+# Remembers a fingerprint of the data behind each image, to skip unchanged renders
+RENDER_MANIFEST_FILE = "render_manifest.json"
+
+# Each sentiment keeps its colour even when another one is missing
+SENTIMENT_COLORS = {"Positive": "green", "Negative": "red", "Neutral": "grey", "Error": "blue"}
+
+
+def generate_barchart(sentiment_counts, output_dir=None):
+    """
+    Create a bar chart of sentiment counts.
+    Takes a {sentiment: count} dict (or a plain list of sentiments).
+    """
     
-    if not sentiment_list:
+    if not sentiment_counts:
         print("Skipping bar chart: No sentiment data provided.")
         return
         
-    # 1. Use Counter to count items in the list (e.g., {'Positive': 40, 'Negative': 35, ...})
-    data = collections.Counter(sentiment_list)
+    # 1. Use Counter to count items (e.g., {'Positive': 40, 'Negative': 35, ...})
+    data = collections.Counter(sentiment_counts)
 
     # 2. Get the labels (sentiments) and values (counts)
     sentiments = list(data.keys())
     counts = list(data.values())
+    colors = [SENTIMENT_COLORS.get(s, "purple") for s in sentiments]
 
     # 3. Create the plot
     plt.figure(figsize=(8, 6))
-    plt.bar(sentiments, counts, color=['green', 'red', 'grey', 'blue']) # Added colors
+    plt.bar(sentiments, counts, color=colors)
     plt.title("Sentiment Distribution")
     plt.xlabel("Sentiment")
     plt.ylabel("Count")
     
     # 4. Save the plot
-    plt.savefig(os.path.join(VISUALS_DIR, "sentiment_chart.png"))
+    plt.savefig(os.path.join(output_dir or VISUALS_DIR, BAR_CHART_FILE))
     plt.close() # Close plot to free up memory
 
-def generate_wordcloud(text_data, filename):
-    """Generate a word cloud from the provided text and save to a file."""
+def generate_wordcloud(frequencies, filename, output_dir=None):
+    """
+    Generate a word cloud and save to a file.
+    Takes an {aspect: count} dict, so multi-word aspects like "battery life"
+    stay together. Plain text is still accepted and split into words.
+    """
     
-    if not text_data.strip():
+    if isinstance(frequencies, str) and not frequencies.strip() or not frequencies:
         print(f"Skipping {filename}: No text data provided.")
         return
 
@@ -48,11 +79,116 @@ def generate_wordcloud(text_data, filename):
     wordcloud = WordCloud(width=800, 
                           height=400, 
                           background_color="white",
-                          colormap="viridis").generate(text_data)
+                          colormap="viridis")
+    if isinstance(frequencies, str):
+        wordcloud.generate(frequencies)
+    else:
+        wordcloud.generate_from_frequencies(frequencies)
                           
-    save_path = os.path.join(VISUALS_DIR, filename)
+    save_path = os.path.join(output_dir or VISUALS_DIR, filename)
     
     # Save the file
     wordcloud.to_file(save_path)
 
+
+# --- Rendering stage ---
+
+def _fingerprint(data):
+    """A short hash of the chart data, so unchanged inputs can be detected."""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, RENDER_MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, RENDER_MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _render_job(kind, data, filename, output_dir):
+    """Draw one image and its thumbnail (in this process, or in a worker with parallel=True)."""
+    if kind == "barchart":
+        generate_barchart(data, output_dir)
+    else:
+        generate_wordcloud(data, filename, output_dir)
+    write_thumbnail(os.path.join(output_dir, filename), THUMBNAIL_SIZES[filename])
+    return filename
+
+
+def render_all(sentiment_counts, positive_frequencies, negative_frequencies, parallel=False, output_dir=None):
+    """
+    Draw the bar chart and both word clouds from count dicts, each with a
+    display-sized thumbnail for the results window.
+
+    The images are drawn one after another. With parallel=True each one is
+    drawn in its own spawned worker process instead; every worker imports
+    matplotlib and WordCloud again before drawing, which costs more (about
+    5 s) than drawing all three here (about 1 s), so it only pays off for
+    much bigger word clouds. An image is skipped when its data has not
+    changed since it was last drawn.
+    Returns {filename: "rendered" | "unchanged" | "no data" | "FAILED: <error>"}.
+    """
+    output_dir = output_dir or VISUALS_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _load_manifest(output_dir)
+
+    jobs = [
+        ("barchart", dict(sentiment_counts), BAR_CHART_FILE),
+        ("wordcloud", dict(positive_frequencies), POSITIVE_WC_FILE),
+        ("wordcloud", dict(negative_frequencies), NEGATIVE_WC_FILE),
+    ]
+    status = {}
+    to_render = []
+    for kind, data, filename in jobs:
+        fingerprint = _fingerprint(data)
+        if not data:
+            status[filename] = "no data"
+        elif manifest.get(filename) == fingerprint and os.path.exists(os.path.join(output_dir, filename)):
+            status[filename] = "unchanged"
+            if not os.path.exists(thumbnail_path(os.path.join(output_dir, filename))):
+                # Drawn before thumbnails existed
+                try:
+                    write_thumbnail(os.path.join(output_dir, filename), THUMBNAIL_SIZES[filename])
+                except Exception as e:
+                    print(f"Could not save thumbnail for {filename}: {e}")
+        else:
+            to_render.append((kind, data, filename, fingerprint))
+
+    if parallel and len(to_render) > 1:
+        # "spawn" gives clean workers; forking a process that runs Tk threads is unsafe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(to_render), mp_context=context) as pool:
+            futures = {pool.submit(_render_job, kind, data, filename, output_dir): (filename, fingerprint)
+                       for kind, data, filename, fingerprint in to_render}
+            for future, (filename, fingerprint) in futures.items():
+                try:
+                    future.result()
+                    status[filename] = "rendered"
+                    manifest[filename] = fingerprint
+                except Exception as e:
+                    status[filename] = f"FAILED: {e}"
+    else:
+        for kind, data, filename, fingerprint in to_render:
+            try:
+                _render_job(kind, data, filename, output_dir)
+                status[filename] = "rendered"
+                manifest[filename] = fingerprint
+            except Exception as e:
+                status[filename] = f"FAILED: {e}"
+
+    try:
+        _save_manifest(output_dir, manifest)
+    except OSError as e:
+        print(f"Could not save render manifest: {e}")
+    return status
+
 #final visuals file
\ No newline at end of file
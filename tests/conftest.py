@@ -0,0 +1,33 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The app's modules live in src/ and import each other by bare name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import cache  # noqa: E402
+import database  # noqa: E402
+
+
+@pytest.fixture
+def add_reviews(tmp_path, monkeypatch):
+    """
+    Point the app at an empty reviews table and sidecar database in tmp_path.
+    Returns add_reviews(texts), which appends reviews to the table.
+    """
+    db_path = str(tmp_path / "feedback.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, review_text TEXT NOT NULL)")
+    conn.close()
+    monkeypatch.setattr(database, "DB_PATH", db_path)
+    monkeypatch.setattr(cache, "CACHE_DB_PATH", str(tmp_path / "analysis.db"))
+
+    def add(texts):
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.executemany("INSERT INTO reviews (review_text) VALUES (?)", [(text,) for text in texts])
+        conn.close()
+
+    return add
@@ -0,0 +1,48 @@
+import pytest
+
+from aggregates import AggregateStore, normalize_aspect
+
+
+@pytest.mark.parametrize("aspect, expected", [
+    ("Battery  Life", "battery life"),
+    ("battery life.", "battery life"),
+    ("battery lifes", "battery life"),
+    ("Batteries", "battery"),
+    ("apps", "app"),
+    ("displays", "display"),
+    ("boxes", "box"),
+    ("watches", "watch"),
+    ("classes", "class"),
+    ("immersive videos", "immersive video"),
+    ("spatial photos", "spatial photo"),
+    ("visionOS", "visionos"),
+    ("  ", ""),
+])
+def test_normalize_aspect_folds_spellings(aspect, expected):
+    assert normalize_aspect(aspect) == expected
+
+
+@pytest.mark.parametrize("aspect, expected", [
+    ("movies", "movie"),
+    ("headaches", "headache"),
+    ("series", "series"),
+    ("lens", "lens"),
+    ("lenses", "lens"),
+    ("news", "news"),
+    ("glasses", "glasses"),
+    ("graphics", "graphics"),
+    ("caches", "cache"),
+    ("cookies", "cookie"),
+])
+def test_normalize_aspect_keeps_real_words(aspect, expected):
+    assert normalize_aspect(aspect) == expected
+
+
+def test_store_counts_folded_aspects_together():
+    store = AggregateStore()
+    store.add(1, "Positive", ["Movies", "movie"], ["Headaches"])
+    store.add(2, "Negative", [], ["headache", "price"])
+    assert store.sentiments() == {"Positive": 1, "Negative": 1}
+    assert store.top_aspects("positive") == [("movie", 2)]
+    assert store.top_aspects("negative") == [("headache", 2), ("price", 1)]
+    assert store.snapshot()["top_negative_aspects"] == store.top_aspects("negative", 10)
@@ -0,0 +1,115 @@
+import queue
+import random
+
+import pytest
+
+import aggregates
+import analysis
+
+
+class FakeAnalyzer:
+    """Answers "Positive" for every review, except the IDs in failing (None, like a failed request)."""
+    name = "fake"
+    model = "fake-model"
+    version = "1"
+    batch_size = 2
+    cacheable = False
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.seen = []
+
+    def analyze_batch(self, batch, log_queue):
+        self.seen.extend(review_id for review_id, _ in batch)
+        return {review_id: None if review_id in self.failing else
+                {"sentiment": "Positive", "positive_aspects": ["display"], "negative_aspects": []}
+                for review_id, _ in batch}
+
+
+def _run(analyzer, **options):
+    return analysis.analyze_sentiment_for_all(queue.Queue(), backend=analyzer, outputs=False, **options)
+
+
+@pytest.mark.parametrize("durable", [False, True])
+def test_failed_review_is_retried_by_the_next_incremental_run(add_reviews, durable):
+    add_reviews([f"review {i}" for i in range(1, 5)])
+    store = _run(FakeAnalyzer(failing={2}), durable=durable)
+    assert store.sentiments() == {"Positive": 3, "Error": 1}
+    assert aggregates.load_store().failed_ids == {2}
+
+    add_reviews(["review 5", "review 6"])
+    retry = FakeAnalyzer()
+    store = _run(retry, incremental=True, durable=durable)
+    assert retry.seen == [2, 5, 6]
+    assert store.sentiments() == {"Positive": 6}
+    saved = aggregates.load_store()
+    assert (saved.total_reviews, saved.last_review_id, saved.failed_ids) == (6, 6, set())
+
+    # Nothing new and nothing failed: up to date
+    idle = FakeAnalyzer()
+    assert _run(idle, incremental=True, durable=durable).sentiments() == {"Positive": 6}
+    assert idle.seen == []
+
+
+def test_review_that_fails_again_stays_failed(add_reviews):
+    add_reviews(["review 1", "review 2"])
+    _run(FakeAnalyzer(failing={1}))
+    store = _run(FakeAnalyzer(failing={1}), incremental=True)
+    assert store.sentiments() == {"Positive": 1, "Error": 1}
+    assert aggregates.load_store().failed_ids == {1}
+
+
+def test_incremental_run_does_not_fall_back_to_the_local_analyzer(add_reviews, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    add_reviews(["Great display"])
+    log = queue.Queue()
+    assert analysis.analyze_sentiment_for_all(log, incremental=True, outputs=False) is None
+    assert "can't fall back" in "".join(log.queue)
+    assert aggregates.load_store().total_reviews == 0
+
+    # A full run still falls back, and records which analyzer made the totals
+    store = analysis.analyze_sentiment_for_all(log, outputs=False)
+    assert store.total_reviews == 1
+    assert aggregates.load_store().analyzer.startswith("local/")
+
+
+@pytest.mark.parametrize("durable", [False, True])
+def test_incremental_run_with_another_analyzer_rebuilds_the_totals(add_reviews, durable):
+    add_reviews(["review 1", "review 2"])
+    _run(FakeAnalyzer(), durable=durable)
+    assert aggregates.load_store().analyzer == "fake/fake-model/v1"
+
+    add_reviews(["review 3"])
+    other = FakeAnalyzer()
+    other.version = "2"
+    store = _run(other, incremental=True, durable=durable)
+    assert other.seen == [1, 2, 3]  # everything again, not just review 3
+    assert store.sentiments() == {"Positive": 3}
+    assert aggregates.load_store().analyzer == "fake/fake-model/v2"
+
+
+def _totals(store):
+    return (store.total_reviews, store.last_review_id, store.sentiments(),
+            store.aspect_frequencies("positive"), store.aspect_frequencies("negative"))
+
+
+@pytest.mark.parametrize("batch_size", [1, 7])
+def test_concurrent_run_gives_the_same_totals_as_one_worker(add_reviews, monkeypatch, batch_size):
+    from local_analyzer import analyze_texts
+
+    rng = random.Random(0)
+    parts = ["The display is stunning", "the headband hurts after an hour", "battery life is too short",
+             "I love the immersive videos", "the price is not worth it", "eye tracking works great",
+             "field of view feels narrow", "apps are missing", "passthrough is not bad"]
+    texts = [". ".join(rng.sample(parts, rng.randint(1, 4))) + f" #{i}" for i in range(1200)]
+    add_reviews(texts)
+    monkeypatch.setattr(analysis, "PAGE_SIZE", 100)  # many pages in flight at once
+
+    expected = aggregates.AggregateStore()
+    for review_id, result in enumerate(analyze_texts(texts), 1):
+        expected.add(review_id, result["sentiment"], result["positive_aspects"], result["negative_aspects"])
+
+    single = _run("local", max_workers=1, batch_size=batch_size)
+    concurrent = _run("local", max_workers=8, batch_size=batch_size)
+    assert _totals(single) == _totals(expected)
+    assert _totals(concurrent) == _totals(single)
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from bulk import parse_result_line
+
+ANSWER = {"sentiment": "Positive", "positive_aspects": ["display"], "negative_aspects": []}
+
+
+def _line(custom_id="bulk-3-42", status_code=200, content=None, error=None):
+    content = json.dumps(ANSWER) if content is None else content
+    body = {"choices": [{"message": {"content": content}}]}
+    return json.dumps({"custom_id": custom_id, "error": error,
+                       "response": {"status_code": status_code, "body": body}})
+
+
+def test_good_line():
+    assert parse_result_line(_line()) == ("bulk-3", 42, ANSWER, None)
+
+
+@pytest.mark.parametrize("line, failure", [
+    (_line(error={"code": "batch_expired", "message": "expired"}), "error: batch_expired"),
+    (_line(error={"message": "server error"}), "error: server error"),
+    (_line(status_code=429), "HTTP 429"),
+    (_line(content="not json"), "unreadable answer"),
+    (_line(content=json.dumps({"sentiment": "Great"})), "answer not in the expected shape"),
+    (_line(content=json.dumps({**ANSWER, "positive_aspects": "display"})), "answer not in the expected shape"),
+])
+def test_failed_requests_keep_their_review(line, failure):
+    assert parse_result_line(line) == ("bulk-3", 42, None, failure)
+
+
+@pytest.mark.parametrize("line", [
+    "{not json",
+    json.dumps({"response": {}}),
+    json.dumps({"custom_id": "bulk-3-abc"}),
+    json.dumps({"custom_id": 42}),
+    json.dumps([1, 2]),
+])
+def test_badly_formed_lines_are_unreadable(line):
+    assert parse_result_line(line) == (None, None, None, "unreadable line")
@@ -0,0 +1,69 @@
+import queue
+
+import analysis
+import cache
+
+
+class CachingAnalyzer:
+    """A cacheable analyzer that remembers which reviews it was asked about."""
+    name = "fake"
+    batch_size = 10
+    cacheable = True
+
+    def __init__(self, model=analysis.MODEL_NAME, version=analysis.PROMPT_VERSION):
+        self.model = model
+        self.version = version
+        self.seen = []
+
+    def analyze_batch(self, batch, log_queue):
+        self.seen.extend(review_id for review_id, _ in batch)
+        return {review_id: {"sentiment": "Positive", "positive_aspects": ["display"], "negative_aspects": []}
+                for review_id, _ in batch}
+
+
+def _run(analyzer, **options):
+    analysis.analyze_sentiment_for_all(queue.Queue(), backend=analyzer, outputs=False, **options)
+    return analyzer.seen
+
+
+def _cached_rows():
+    conn = cache._connect()
+    try:
+        return sorted(conn.execute("SELECT model, prompt_version FROM analysis_cache"))
+    finally:
+        conn.close()
+
+
+def test_cache_key_covers_text_version_and_model():
+    key = cache.make_cache_key("Great display", 2, "gpt-4o-mini")
+    assert key == cache.make_cache_key("Great display", 2, "gpt-4o-mini")
+    assert len({key,
+                cache.make_cache_key("Great display!", 2, "gpt-4o-mini"),
+                cache.make_cache_key("Great display", 3, "gpt-4o-mini"),
+                cache.make_cache_key("Great display", 2, "gpt-4o")}) == 4
+
+
+def test_cache_hits_skip_the_analyzer(add_reviews):
+    add_reviews(["Great display", "Too heavy", "Great display"])
+    assert _run(CachingAnalyzer()) == [1, 2, 3]
+    assert _run(CachingAnalyzer()) == []  # every text is cached now
+    assert _run(CachingAnalyzer(), use_cache=False) == [1, 2, 3]
+
+    # Another model or prompt version never reuses these results
+    assert _run(CachingAnalyzer(model="gpt-4o")) == [1, 2, 3]
+    assert _run(CachingAnalyzer(version=analysis.PROMPT_VERSION + 1)) == [1, 2, 3]
+
+
+def test_clearing_stale_results_keeps_the_current_ones(add_reviews):
+    add_reviews(["Great display", "Too heavy"])
+    _run(CachingAnalyzer())
+    _run(CachingAnalyzer(model="gpt-4o"))
+    _run(CachingAnalyzer(version=analysis.PROMPT_VERSION - 1))
+    assert len(_cached_rows()) == 6
+
+    assert analysis.clear_result_cache(stale_only=True) == 4
+    assert _cached_rows() == [(analysis.MODEL_NAME, analysis.PROMPT_VERSION)] * 2
+    assert _run(CachingAnalyzer()) == []  # still hits
+
+    assert analysis.clear_result_cache(stale_only=False) == 2
+    assert _run(CachingAnalyzer()) == [1, 2]
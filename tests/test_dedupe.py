@@ -0,0 +1,40 @@
+import pytest
+
+from dedupe import DuplicateIndex, find_duplicates
+
+TEXT = "The displays are sharp but the headband gets uncomfortable after an hour of watching movies."
+
+
+def test_exact_and_near_duplicates_share_a_representative():
+    index = DuplicateIndex()
+    assert index.add(1, TEXT) is None
+    assert index.add(2, TEXT.upper() + "!!") == 1
+    assert index.add(3, TEXT + " Really.") == 1
+    assert (index.exact_duplicates, index.near_duplicates) == (1, 1)
+    assert index.add(4, "Passthrough is grainy in low light and the battery is too heavy.") is None
+
+
+def test_find_duplicates_reports_clusters():
+    pages = [[(1, TEXT), (2, "Great apps, terrible price.")], [(3, TEXT), (4, TEXT + " ")]]
+    clusters = find_duplicates(pages)
+    assert clusters.representative_of == {3: 1, 4: 1}
+    assert clusters.stats["clusters"] == 2
+    assert clusters.stats["exact_duplicates"] == 2
+    assert clusters.stats["largest_cluster"] == 3
+
+
+def test_near_duplicate_search_keeps_only_the_last_signatures():
+    index = DuplicateIndex(max_signatures=1)
+    index.add(1, TEXT)
+    index.add(2, "Passthrough is grainy in low light and the battery is too heavy.")
+    assert len(index.signatures) == 1 and len(index.recent) == 1
+    assert all(1 not in ids for bucket in index.buckets for ids in bucket.values())
+    # Review 1 has left the near-duplicate window, but exact matches still find it
+    assert index.add(3, TEXT + " Really.") is None
+    assert index.add(4, TEXT) == 1
+
+
+@pytest.mark.parametrize("threshold", [0, -0.5, 1.5])
+def test_threshold_must_be_in_range(threshold):
+    with pytest.raises(ValueError):
+        DuplicateIndex(threshold)
@@ -0,0 +1,65 @@
+import json
+import sqlite3
+
+import pytest
+
+import database
+import ingest
+
+
+def _write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def _reviews():
+    conn = sqlite3.connect(database.DB_PATH)
+    try:
+        return conn.execute("SELECT id, review_text FROM reviews ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_reingest_skips_texts_already_in_the_table(add_reviews, tmp_path):
+    add_reviews(["Great display", "Too heavy"])
+    csv_file = _write(tmp_path / "new.csv", "id,review_text\n1,Great display\n2,Love the apps\n3,  Love the apps  \n")
+
+    report = ingest.ingest_files([csv_file])
+    assert (report["rows"], report["inserted"], report["duplicates"], report["skipped"]) == (3, 1, 2, 0)
+    assert (report["first_id"], report["last_id"]) == (3, 3)
+    assert _reviews()[-1] == (3, "Love the apps")
+
+    # Loading the same file again adds nothing and uses up no IDs
+    again = ingest.ingest_files([csv_file])
+    assert (again["inserted"], again["duplicates"]) == (0, 3)
+    assert (again["first_id"], again["last_id"]) == (None, None)
+    jsonl_file = _write(tmp_path / "more.jsonl", json.dumps({"text": "Battery dies fast"}) + "\n")
+    assert ingest.ingest_files([jsonl_file])["first_id"] == 4
+
+
+def test_unusable_rows_are_skipped_and_reported(add_reviews, tmp_path):
+    csv_file = _write(tmp_path / "survey.csv", "comment,score\nNice headband,5\n,3\n   ,1\nshort\n")
+    jsonl_file = _write(tmp_path / "export.jsonl", "\n".join([
+        json.dumps({"body": "Sharp screen"}),
+        "{not json",
+        json.dumps({"stars": 4}),
+        json.dumps(42),
+        "",
+        json.dumps("A bare string review"),
+    ]) + "\n")
+
+    report = ingest.ingest_files([csv_file], column="comment")
+    assert (report["rows"], report["inserted"], report["skipped"]) == (4, 2, 2)
+    assert report["skip_samples"] == [{"file": csv_file, "line": 3}, {"file": csv_file, "line": 4}]
+
+    report = ingest.ingest_files([jsonl_file])
+    assert (report["rows"], report["inserted"], report["skipped"]) == (5, 2, 3)
+    assert [sample["line"] for sample in report["skip_samples"]] == [2, 3, 4]
+    assert [text for _, text in _reviews()] == ["Nice headband", "short", "Sharp screen", "A bare string review"]
+
+
+def test_csv_without_a_text_column_is_refused(add_reviews, tmp_path):
+    csv_file = _write(tmp_path / "bad.csv", "name,score\nAnn,5\n")
+    with pytest.raises(ValueError):
+        ingest.ingest_files([csv_file])
+    assert _reviews() == []
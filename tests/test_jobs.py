@@ -0,0 +1,114 @@
+import sqlite3
+import time
+
+import pytest
+
+import aggregates
+import cache
+import jobs
+
+
+@pytest.fixture
+def run_env(add_reviews, monkeypatch):
+    """A reviews table with 6 reviews and an empty sidecar database, in shards of 2."""
+    add_reviews([f"review {i}" for i in range(1, 7)])
+    monkeypatch.setattr(jobs, "SHARD_SIZE", 2)
+    monkeypatch.setattr(jobs, "POLL_SECONDS", 0.01)
+    run_id, created = jobs.open_run("test")
+    assert created
+    return run_id
+
+
+def _result(sentiment, *aspects):
+    return {"sentiment": sentiment, "positive_aspects": list(aspects), "negative_aspects": []}
+
+
+def _work_page(worker, page, sentiment="Positive"):
+    for review_id, _ in page:
+        worker.record(review_id, _result(sentiment, "display"))
+    worker.page_done()
+
+
+def _store_names():
+    conn = sqlite3.connect(cache.CACHE_DB_PATH)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM aggregate_stores")}
+    finally:
+        conn.close()
+
+
+def test_open_run_joins_the_unfinished_run(run_env):
+    assert jobs.open_run("test") == (run_env, False)
+    assert jobs.run_progress(run_env) == {"total": 6, "pending": 6, "done": 0, "failed": 0}
+
+
+def test_two_workers_claim_different_shards_and_merge(run_env):
+    first = jobs.JobWorker(run_env, worker_id="a")
+    second = jobs.JobWorker(run_env, worker_id="b")
+    first_pages, second_pages = first.pages(), second.pages()
+
+    page_a = next(first_pages)
+    page_b = next(second_pages)
+    assert [review_id for review_id, _ in page_a] == [1, 2]
+    assert [review_id for review_id, _ in page_b] == [3, 4]
+
+    _work_page(first, page_a)
+    _work_page(second, page_b, "Negative")
+    _work_page(first, next(first_pages))
+    assert next(first_pages, None) is None and next(second_pages, None) is None
+    assert first.wait_for_others() and second.wait_for_others()
+    first.close()
+    second.close()
+
+    store = jobs.merge_run(run_env)
+    assert store.total_reviews == 6
+    assert store.sentiments() == {"Positive": 4, "Negative": 2}
+    assert aggregates.load_store().sentiments() == store.sentiments()
+    assert jobs.run_progress(run_env)["total"] == 0  # job rows are gone after the merge
+    assert _store_names() == {aggregates.DEFAULT_STORE}  # no per-run store left behind
+
+    # A worker that finishes late gets the merged totals
+    assert jobs.merge_run(run_env).sentiments() == store.sentiments()
+
+
+def test_expired_lease_is_reclaimed_and_first_result_wins(run_env):
+    crashed = jobs.JobWorker(run_env, worker_id="crashed", lease_seconds=0.01)
+    page = next(crashed.pages())
+    crashed.record(page[0][0], _result("Negative"))  # not flushed: lost with the worker
+    time.sleep(0.05)
+
+    rescuer = jobs.JobWorker(run_env, worker_id="rescuer")
+    rescuer_pages = rescuer.pages()
+    assert [review_id for review_id, _ in next(rescuer_pages)] == [1, 2]
+    assert rescuer.reclaimed == 1
+    _work_page(rescuer, page)
+
+    # The old worker's late write doesn't replace the result that was recorded first
+    crashed.flush()
+    crashed.conn.close()
+    assert dict(next(jobs.iter_results(run_env)))[1]["sentiment"] == "Positive"
+
+    for rest in rescuer_pages:
+        _work_page(rescuer, rest)
+    rescuer.close()
+    assert jobs.merge_run(run_env).sentiments() == {"Positive": 6}
+
+
+def test_merge_refuses_pending_reviews(run_env):
+    with pytest.raises(RuntimeError):
+        jobs.merge_run(run_env)
+
+
+def test_search_run_store_is_pruned_later(run_env, monkeypatch):
+    search_run, _ = jobs.open_run("search", review_ids=[2, 5])
+    jobs.record_results(search_run, [(2, _result("Positive")), (5, None)])
+    store = jobs.merge_run(search_run, save_as=None)
+    assert store.sentiments() == {"Positive": 1, "Error": 1}
+    assert f"run:{search_run}" in _store_names()
+    assert aggregates.DEFAULT_STORE not in _store_names()
+
+    # Once RUN_STORE_SECONDS have passed, the next merge removes it
+    monkeypatch.setattr(jobs, "RUN_STORE_SECONDS", -1)
+    jobs.record_results(run_env, [(review_id, _result("Neutral")) for review_id in range(1, 7)])
+    jobs.merge_run(run_env)
+    assert _store_names() == {aggregates.DEFAULT_STORE}
@@ -0,0 +1,17 @@
+from local_analyzer import analyze_texts
+
+
+def test_multi_word_keywords_are_matched():
+    results = analyze_texts([
+        "The field of view is narrow.",
+        "Eye tracking is magic.",
+        "The fov is narrow but the display is stunning.",
+    ])
+    assert results[0] == {"sentiment": "Negative", "positive_aspects": [], "negative_aspects": ["field of view"]}
+    assert results[1]["positive_aspects"] == ["eye tracking"]
+    assert results[2]["negative_aspects"] == ["field of view"]
+    assert results[2]["positive_aspects"] == ["display"]
+
+
+def test_negation_flips_polarity():
+    assert analyze_texts(["The strap is not comfortable."])[0]["sentiment"] == "Negative"
@@ -0,0 +1,23 @@
+from log_sink import COALESCE_THRESHOLD, LogSink
+
+
+def _progress(count, total=100):
+    return [f"Review {i} ({i}/{total}) Positive: fine\n" for i in range(1, count + 1)]
+
+
+def test_few_progress_lines_are_shown_as_they_are():
+    messages = _progress(COALESCE_THRESHOLD)
+    assert LogSink(None)._format(messages) == "".join(messages)
+
+
+def test_many_progress_lines_become_one_summary():
+    messages = _progress(8)
+    messages.insert(3, "Cache: 2 hits\n")
+    text = LogSink(None)._format(messages)
+    assert text == ("Cache: 2 hits\n"
+                    "... 7 more reviews analyzed (8/100). Latest: Review 8 (8/100) Positive: fine\n")
+
+
+def test_coalescing_can_be_turned_off():
+    messages = _progress(8)
+    assert LogSink(None, coalesce_progress=False)._format(messages) == "".join(messages)
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import aggregates
+import analysis
+import cli
+from metrics import LATENCY_BUCKETS, RunMetrics, _percentile
+
+
+def test_percentile_interpolates_within_a_bucket():
+    buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+    assert _percentile(buckets, 0.5) == 0.0
+    buckets[2] = 10  # ten calls between 0.05 and 0.1 s
+    assert _percentile(buckets, 0.5) == pytest.approx(0.075)
+    assert _percentile(buckets, 1.0) == pytest.approx(0.1)
+
+
+def test_snapshot_and_prometheus_text():
+    metrics = RunMetrics()
+    metrics.reset(total_reviews=4, prices=(1.0, 2.0))
+    usage = type("Usage", (), {"prompt_tokens": 1000, "completion_tokens": 500})()
+    for seconds in (0.01, 0.02, 0.3):
+        metrics.record_call("review", seconds, {"attempts": 1, "queued": 0.001, "network": seconds}, usage)
+    metrics.record_call("review", 70.0, {"attempts": 3}, error=True)
+    metrics.review_done(4)
+
+    snap = metrics.snapshot()
+    assert snap["api"]["calls"] == 4 and snap["api"]["errors"] == 1 and snap["api"]["retries"] == 2
+    assert snap["api"]["prompt_tokens"] == 3000
+    assert snap["api"]["cost_usd"] == pytest.approx((3000 * 1.0 + 1500 * 2.0) / 1e6)
+
+    text = metrics.to_prometheus(snap)
+    assert "# TYPE review_analysis_api_latency_seconds histogram" in text
+    assert 'review_analysis_api_latency_seconds_bucket{kind="review",le="0.025"} 2' in text
+    assert 'review_analysis_api_latency_seconds_bucket{kind="review",le="0.5"} 3' in text
+    assert 'review_analysis_api_latency_seconds_bucket{kind="review",le="+Inf"} 4' in text
+    assert 'review_analysis_api_latency_seconds_count{kind="review"} 4' in text
+    assert 'review_analysis_tokens_total{kind="review",type="completion"} 1500' in text
+
+
+def test_cli_writes_metrics_only_when_it_analyzes(add_reviews, tmp_path, monkeypatch):
+    json_path, prom_path = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    monkeypatch.setattr(analysis, "METRICS_JSON_PATH", str(json_path))
+    monkeypatch.setattr(analysis, "METRICS_PROM_PATH", str(prom_path))
+    monkeypatch.setattr(analysis, "render_visuals", lambda store, log_queue: {})
+    add_reviews(["The display is great", "The headband hurts"])
+
+    results = cli.run(cli.parse_args(["--stages", "analyze", "--backend", "local"]), _Discard())
+    assert results["summary"]["total_reviews"] == 2
+    assert json.loads(json_path.read_text())["reviews_done"] == 2
+    assert prom_path.exists()
+
+    json_path.unlink()
+    assert aggregates.load_store().total_reviews == 2
+    cli.run(cli.parse_args(["--stages", "visualize"]), _Discard())
+    assert not json_path.exists()
+
+
+class _Discard:
+    def put(self, message):
+        pass
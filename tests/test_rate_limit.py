@@ -0,0 +1,171 @@
+import queue
+
+import pytest
+
+import analysis
+import mock_server
+import rate_limit
+from rate_limit import RateController, TokenBucket, is_transient_error, parse_reset_time
+
+
+class FakeClock:
+    """Stands in for the time module in rate_limit: sleep() moves the clock instead of waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+class StatusError(Exception):
+    """Looks like an openai.APIStatusError: a status code and the response headers."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("20ms", 0.02), ("1s", 1.0), ("6m0s", 360.0), ("1h2m3.5s", 3723.5), ("2.5", 2.5), (3, 3.0),
+    (None, None), ("soon", None),
+])
+def test_parse_reset_time(value, seconds):
+    assert parse_reset_time(value) == seconds
+
+
+@pytest.mark.parametrize("error, transient", [
+    (StatusError(429), True), (StatusError(500), True), (StatusError(503), True),
+    (StatusError(408), True), (StatusError(409), True),
+    (StatusError(400), False), (StatusError(401), False), (StatusError(404), False),
+    (ConnectionError("reset"), True), (TimeoutError(), True), (ValueError("bad json"), False),
+])
+def test_transient_and_fatal_errors(error, transient):
+    assert is_transient_error(error) is transient
+
+
+def test_token_bucket_waits_for_the_refill(clock):
+    bucket = TokenBucket(60)  # one token a second
+    for _ in range(60):
+        bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire(2)
+    assert sum(clock.slept) == pytest.approx(2.0)
+
+    bucket.limit_to(0)  # the server says nothing is left
+    bucket.acquire()
+    assert sum(clock.slept) == pytest.approx(3.0)
+
+
+def test_throttling_halves_concurrency_once_per_cooldown_and_successes_raise_it(clock):
+    controller = RateController(max_concurrency=8, decrease_cooldown=1.0)
+    log = queue.Queue()
+    controller._on_throttled({}, log)
+    controller._on_throttled({}, log)  # same burst of 429s
+    assert controller.concurrency == 4
+    assert log.get_nowait() == "Rate limited by the API, lowering concurrency to 4.\n"
+
+    clock.now += 1.0
+    controller._on_throttled({}, None)
+    assert controller.concurrency == 2
+    for _ in range(5):
+        clock.now += 1.0
+        controller._on_throttled({}, None)
+    assert controller.concurrency == controller.min_concurrency
+
+    # Additive increase: about one slot per `concurrency` successes, up to the maximum
+    controller._on_success({})
+    assert controller.concurrency == 2
+    for _ in range(100):
+        controller._on_success({})
+    assert controller.concurrency == 8
+
+
+def test_backoff_is_jittered_and_capped():
+    controller = RateController(base_delay=0.5, max_delay=4.0)
+    for attempt in range(8):
+        delays = [controller._backoff(attempt) for _ in range(200)]
+        limit = min(4.0, 0.5 * 2 ** attempt)
+        assert all(0 <= d <= limit for d in delays)
+        assert len(set(delays)) > 1
+
+
+def test_call_retries_429s_and_waits_for_retry_after(clock):
+    controller = RateController(max_concurrency=4, base_delay=0.01)
+    answers = [StatusError(429, {"retry-after-ms": "1500"}), StatusError(503), "ok"]
+
+    def request():
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    timings = {}
+    assert controller.call(request, timings=timings) == "ok"
+    assert timings["attempts"] == 3
+    assert clock.slept[0] >= 1.5  # retry-after wins over the short backoff
+    assert controller.stats == {"calls": 3, "retries": 2, "throttled": 1, "failed": 0}
+    assert controller.concurrency < 4
+
+
+def test_call_raises_fatal_errors_at_once_and_transient_ones_after_the_last_retry(clock):
+    controller = RateController(max_retries=2, base_delay=0.01)
+    attempts = []
+
+    def fatal():
+        attempts.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        controller.call(fatal)
+    assert len(attempts) == 1
+
+    def down():
+        attempts.append(1)
+        raise StatusError(500)
+
+    with pytest.raises(StatusError):
+        controller.call(down)
+    assert len(attempts) == 1 + 3
+    assert controller.stats["failed"] == 2
+
+
+def test_no_review_is_dropped_when_the_api_throttles(add_reviews, monkeypatch):
+    server = mock_server.start_server(mock_server.MockSettings(latency_ms=2, latency_sigma=0, rate_limit_rate=0.2))
+    try:
+        monkeypatch.setenv("OPENAI_API_KEY", "mock")
+        monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+        monkeypatch.setattr(analysis, "_client", None)
+        monkeypatch.setattr(analysis, "_client_failed", False)
+        controller = RateController(max_concurrency=8, base_delay=0.01, max_delay=0.5, decrease_cooldown=0.05)
+        monkeypatch.setattr(analysis, "rate_controller", controller)
+        add_reviews([f"Review {i}: the display is great but the headband is heavy" for i in range(40)])
+
+        log = queue.Queue()
+        store = analysis.analyze_sentiment_for_all(log, max_workers=8, use_cache=False, batch_size=1, outputs=False)
+    finally:
+        server.shutdown()
+
+    messages = []
+    while not log.empty():
+        messages.append(log.get_nowait())
+    assert server.RequestHandlerClass.settings.stats["rate_limited"] > 0
+    assert controller.stats["throttled"] > 0 and controller.stats["failed"] == 0
+    assert any("lowering concurrency" in m for m in messages)
+    assert store.total_reviews == 40
+    assert "Error" not in store.sentiments()